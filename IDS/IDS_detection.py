@@ -1,10 +1,17 @@
+import argparse
 import logging
 import queue
-from scapy.all import IP, TCP
+import time
 from traffic_analyzer import TrafficAnalyzer
 from detection_engine import DetectionEngine
 from alert import AlertSystem
 from packet_capture import PacketCapture
+from pcap_replay import PcapReplayCapture
+from packet_decoder import PacketRecord, record_from_packet
+
+# Optional subsystems (AF_PACKET capture, the SQLite store, metrics and the
+# sharded pipeline) are imported where they are first used,
+# so startup only pays for what the command line enables.
 
 
 class IntrusionDetectionSystem:
@@ -13,12 +20,61 @@ class IntrusionDetectionSystem:
     analysis, detection, and alerting.
     """
 
-    def __init__(self, interface: str = "Ethernet") -> None:
+    def __init__(self, interface: str = "Ethernet", pcap_file: str = None,
+                 replay_speed: float = None, fast_decode: bool = False,
+                 rule_file: str = None, watch_rules: bool = False,
+                 queue_size: int = 65536, overflow_policy: str = "drop_newest",
+                 backend: str = "scapy", bpf_filter: str = "tcp or udp or icmp or icmp6",
+                 alert_window: float = 60.0, alert_dir: str = None,
+                 store_path: str = None, baseline_mode: str = None,
+                 baseline_file: str = None, metrics: bool = False,
+                 metrics_port: int = None, metrics_interval: float = 10.0,
+                 metrics_sample: int = 1, reassembly: bool = False,
+                 stream_window: int = 4096, stream_memory_mb: float = 64.0,
+                 checkpoint_path: str = None, checkpoint_interval: float = 60.0,
+                 flow_export_dir: str = None, flow_export_format: str = "parquet",
+                 flow_sample_interval: float = None) -> None:
         self.interface = interface
-        self.packet_capture = PacketCapture()
-        self.traffic_analyzer = TrafficAnalyzer()
-        self.detection_engine = DetectionEngine()
-        self.alert_system = AlertSystem()
+        if pcap_file:
+            # Offline mode: replay a capture file instead of sniffing live traffic
+            self.packet_capture = PcapReplayCapture(pcap_file, speed=replay_speed, raw=fast_decode)
+        elif backend == "afpacket":
+            from afpacket_capture import AfPacketCapture
+            # Kernel BPF filtering and a memory-mapped TPACKET_V3 ring (Linux only)
+            self.packet_capture = AfPacketCapture(interface, bpf_filter=bpf_filter, queue_size=queue_size,
+                                                  overflow_policy=overflow_policy,
+                                                  on_overload=self._on_capture_overload)
+        else:
+            self.packet_capture = PacketCapture(interface, raw=fast_decode, queue_size=queue_size,
+                                                overflow_policy=overflow_policy,
+                                                on_overload=self._on_capture_overload)
+        # Optional SQLite store for alerts and finished flows
+        self.store = None
+        if store_path:
+            from ids_store import IDSStore
+            self.store = IDSStore(store_path)
+        # Optional TCP stream reassembly, so payload rules see contents split across segments
+        self.reassembler = None
+        if reassembly:
+            from stream_reassembly import StreamReassembler
+            self.reassembler = StreamReassembler(window=stream_window,
+                                                 memory_limit=int(stream_memory_mb * 1024 * 1024))
+        # Optional columnar (Parquet/Arrow) export of finished and sampled flows
+        self.flow_exporter = None
+        if flow_export_dir:
+            from flow_export import FlowExporter
+            self.flow_exporter = FlowExporter(flow_export_dir, export_format=flow_export_format,
+                                              snapshot=lambda: self.traffic_analyzer.active_flows(),
+                                              snapshot_interval=flow_sample_interval)
+        flow_sinks = [sink.add_flow for sink in (self.store, self.flow_exporter) if sink]
+        self.traffic_analyzer = TrafficAnalyzer(on_flow_expired=self._fan_out(flow_sinks),
+                                                reassembler=self.reassembler)
+        self.detection_engine = DetectionEngine(rule_file=rule_file, baseline_mode=baseline_mode,
+                                                baseline_file=baseline_file)
+        if rule_file and watch_rules:
+            self.detection_engine.watch_config(rule_file)
+        self.alert_system = AlertSystem(suppression_window=alert_window, alert_dir=alert_dir,
+                                        store=self.store)
 
         # Configure logging
         logging.basicConfig(
@@ -28,53 +84,350 @@ class IntrusionDetectionSystem:
         )
         self.logger = logging.getLogger(__name__)
 
+        # End-to-end throughput of the last run
+        self.packets_processed = 0
+        self.elapsed = 0.0
+
+        # Optional instrumentation; when off, the uninstrumented loops run
+        self.metrics = None
+        if metrics or metrics_port:
+            from metrics import Metrics
+            self.metrics = Metrics(sample_rate=metrics_sample)
+        self.metrics_port = metrics_port
+        self.metrics_interval = metrics_interval
+        if self.metrics:
+            self._register_metrics()
+
+        # Optional flow-state checkpoints for warm restarts
+        self.checkpointer = None
+        if checkpoint_path:
+            from checkpoint import Checkpointer
+            self.checkpointer = Checkpointer(checkpoint_path, self.traffic_analyzer, self.detection_engine,
+                                             interval=checkpoint_interval)
+
     def start(self) -> None:
         """
         Starts the IDS by initializing packet capture and processing loop.
         """
-        self.logger.info(f"Starting Intrusion Detection System on interface: {self.interface}")
-        self.packet_capture.start_capture(self.interface)
-
-        try:
-            while True:
-                try:
-                    packet = self.packet_capture.packet_queue.get(timeout=1)
-                except queue.Empty:
-                    continue
-
-                features = self.traffic_analyzer.analyze_packet(packet)
-                if not features:
-                    continue
+        self.logger.info(f"Starting Intrusion Detection System on interface: {self.packet_capture.interface}")
+        if self.checkpointer:
+            self.checkpointer.restore()
+            self.checkpointer.start()
+        self.packet_capture.start_capture()
+        self.packets_processed = 0
+        start_time = time.perf_counter()
 
-                threats = self.detection_engine.detect_threats(features)
-                for threat in threats:
-                    packet_info = self._extract_packet_info(packet)
-                    self.alert_system.generate_alert(threat, packet_info)
+        if self.metrics:
+            if self.metrics_port:
+                self.metrics.start_http_server(self.metrics_port)
+            self.metrics.start_reporter(self.metrics_interval, self.logger, 'ids_packets_processed_total')
 
+        try:
+            if self.metrics:
+                self._process_packets_instrumented()
+            else:
+                self._process_packets()
         except KeyboardInterrupt:
             self.logger.info("KeyboardInterrupt detected. Shutting down IDS...")
         except Exception as e:
             self.logger.exception(f"Unexpected error occurred: {e}")
         finally:
+            # Stop the clock with the last packet, not after the shutdown work below
+            self.elapsed = time.perf_counter() - start_time
             self.packet_capture.stop()
+            self.detection_engine.stop_watching()
+            self.detection_engine.save_baselines()
+            checkpointed = False
+            if self.checkpointer:
+                # The checkpoint holds the flows in progress; the run restoring it exports them
+                try:
+                    self.checkpointer.stop()
+                    checkpointed = True
+                except OSError as e:
+                    self.logger.error(f"Final checkpoint failed: {e}")
+            if self.metrics:
+                self.metrics.stop()
+                self.logger.info(f"Metrics: {self.metrics.summary()}")
+            rate = self.packets_processed / self.elapsed if self.elapsed > 0 else 0.0
+            self.logger.info(f"Processed {self.packets_processed} packets in {self.elapsed:.2f}s "
+                             f"({rate:.0f} packets/sec)")
+            queue_stats = self.packet_capture.get_queue_stats()
+            self.logger.info(f"Capture queue: {queue_stats['enqueued']} enqueued, "
+                             f"{queue_stats['dropped']} dropped, high-water {queue_stats['high_water']}"
+                             f"/{queue_stats['capacity']}")
+            if hasattr(self.packet_capture, 'get_kernel_stats'):
+                kernel_stats = self.packet_capture.get_kernel_stats()
+                self.logger.info(f"Kernel: {kernel_stats['kernel_packets']} packets, "
+                                 f"{kernel_stats['kernel_drops']} dropped")
+            if self.reassembler:
+                self.logger.info(f"Reassembly: {self.reassembler.stats()}")
+            self.alert_system.close()
+            if (self.store or self.flow_exporter) and not checkpointed:
+                # Persist the flows still in progress, then commit everything
+                self.traffic_analyzer.flush_flows()
+            if self.store:
+                self.store.close()
+                self.logger.info(f"Store: {self.store.stats()}")
+            if self.flow_exporter:
+                self.flow_exporter.close()
+                self.logger.info(f"Flow export: {self.flow_exporter.stats()}")
             self.logger.info("IDS stopped gracefully.")
 
+    @staticmethod
+    def _fan_out(callbacks: list):
+        """
+        Combines flow expiry callbacks into one (None if there are none).
+        """
+        if len(callbacks) <= 1:
+            return callbacks[0] if callbacks else None
+
+        def on_flow_expired(flow, reason):
+            for callback in callbacks:
+                callback(flow, reason)
+
+        return on_flow_expired
+
+    def _register_metrics(self) -> None:
+        """
+        Registers the pipeline's counters, gauges and per-stage latency histograms.
+        """
+        metrics = self.metrics
+        ring = self.packet_capture.packet_queue
+        metrics.counter('ids_packets_processed_total', 'Packets taken off the capture queue',
+                        lambda: self.packets_processed)
+        metrics.counter('ids_threats_total', 'Threats passed to the alert system')
+        metrics.counter('ids_capture_enqueued_total', 'Packets queued by the capture thread',
+                        lambda: ring.enqueued)
+        metrics.counter('ids_capture_dropped_total', 'Packets dropped by the capture queue',
+                        lambda: ring.dropped)
+        metrics.gauge('ids_capture_queue_depth', 'Packets waiting in the capture queue', ring.qsize)
+        metrics.gauge('ids_flow_table_size', 'Flows tracked by the traffic analyzer',
+                      lambda: len(self.traffic_analyzer.flow_stats))
+        metrics.counter('ids_alerts_suppressed_total', 'Repeated alerts aggregated instead of emitted',
+                        lambda: self.alert_system.aggregator.suppressed)
+        if self.reassembler:
+            metrics.gauge('ids_reassembly_bytes', 'Bytes buffered by TCP stream reassembly',
+                          lambda: self.reassembler.memory)
+            metrics.counter('ids_reassembly_evictions_total', 'Streams evicted by the reassembly memory caps',
+                            lambda: self.reassembler.stream_evictions + self.reassembler.memory_evictions)
+        metrics.histogram('ids_analyze_seconds', 'TrafficAnalyzer.analyze_packet latency')
+        metrics.histogram('ids_detect_seconds', 'DetectionEngine.detect_threats latency')
+        metrics.histogram('ids_alert_seconds', 'AlertSystem.generate_alert latency for packets with threats')
+        metrics.histogram('ids_packet_seconds', 'Total processing latency per packet')
+
+    def _on_capture_overload(self, stats: dict) -> None:
+        """
+        Raises a sensor overloaded alert when the capture ring starts dropping packets.
+        Runs on the capture thread; AlertSystem locks its shared aggregation state.
+        """
+        threat = {
+            'type': 'sensor_overloaded',
+            'confidence': 1.0,
+            'dropped': stats['dropped'],
+            'queue_depth': stats['depth'],
+            'capacity': stats['capacity'],
+            'policy': stats['policy']
+        }
+        self.alert_system.generate_alert(threat, {})
+
+    def _capture_exhausted(self) -> bool:
+        """
+        Returns True once a finite source (e.g. a replay) is done and drained.
+        """
+        return self.packet_capture.finished.is_set() and self.packet_capture.packet_queue.empty()
+
+    def _process_packets(self) -> None:
+        """
+        Processing loop: one packet at a time.
+        """
+        while True:
+            try:
+                packet = self.packet_capture.packet_queue.get(timeout=1)
+            except queue.Empty:
+                self.detection_engine.apply_pending_reload()
+                # A replay source finishes once the file is exhausted
+                if self._capture_exhausted():
+                    break
+                continue
+
+            self.packets_processed += 1
+            features = self.traffic_analyzer.analyze_packet(packet)
+            if not features:
+                continue
+
+            threats = self.detection_engine.detect_threats(features)
+            for threat in threats:
+                packet_info = self._extract_packet_info(packet)
+                self.alert_system.generate_alert(threat, packet_info)
+
+    def _process_packets_instrumented(self) -> None:
+        """
+        Processing loop that also records per-stage latency for one in
+        metrics.sample_rate packets. Only used when metrics are enabled.
+        """
+        metrics = self.metrics.metrics
+        analyze_latency = metrics['ids_analyze_seconds']
+        detect_latency = metrics['ids_detect_seconds']
+        alert_latency = metrics['ids_alert_seconds']
+        packet_latency = metrics['ids_packet_seconds']
+        threat_counter = metrics['ids_threats_total']
+        sample_rate = self.metrics.sample_rate
+        clock = time.perf_counter_ns
+
+        while True:
+            try:
+                packet = self.packet_capture.packet_queue.get(timeout=1)
+            except queue.Empty:
+                self.detection_engine.apply_pending_reload()
+                if self._capture_exhausted():
+                    break
+                continue
+
+            self.packets_processed += 1
+            sampled = not self.packets_processed % sample_rate
+            if sampled:
+                started = clock()
+
+            features = self.traffic_analyzer.analyze_packet(packet)
+            if sampled:
+                analyzed = clock()
+                analyze_latency.record(analyzed - started)
+            if not features:
+                if sampled:
+                    packet_latency.record(analyzed - started)
+                continue
+
+            threats = self.detection_engine.detect_threats(features)
+            if sampled:
+                detected = clock()
+                detect_latency.record(detected - analyzed)
+
+            if threats:
+                threat_counter.inc(len(threats))
+                for threat in threats:
+                    packet_info = self._extract_packet_info(packet)
+                    self.alert_system.generate_alert(threat, packet_info)
+                if sampled:
+                    alerted = clock()
+                    alert_latency.record(alerted - detected)
+                    detected = alerted
+            if sampled:
+                packet_latency.record(detected - started)
+
     def _extract_packet_info(self, packet) -> dict:
         """
         Extract relevant packet information for alerting.
         """
-        try:
-            return {
-                'source_ip': packet[IP].src,
-                'destination_ip': packet[IP].dst,
-                'source_port': packet[TCP].sport,
-                'destination_port': packet[TCP].dport
-            }
-        except IndexError:
-            self.logger.warning("Malformed packet encountered, skipping.")
-            return {}
+        if not isinstance(packet, PacketRecord):
+            packet = record_from_packet(packet)
+            if packet is None:
+                self.logger.warning("Malformed packet encountered, skipping.")
+                return {}
+        return {
+            'source_ip': packet.src,
+            'destination_ip': packet.dst,
+            'source_port': packet.sport,
+            'destination_port': packet.dport,
+            'packet_time': float(packet.time)
+        }
 
 
 if __name__ == "__main__":
-    ids = IntrusionDetectionSystem()
+    parser = argparse.ArgumentParser(description="Lightweight Scapy-based Intrusion Detection System")
+    parser.add_argument("-i", "--interface", default="Ethernet", help="Network interface to sniff")
+    parser.add_argument("-r", "--pcap", help="Replay a pcap/pcapng file instead of sniffing live")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="Replay at this multiple of the original speed (default: as fast as possible)")
+    parser.add_argument("--fast-decode", action="store_true",
+                        help="Decode headers from raw frames instead of dissecting with Scapy "
+                             "(always on with --workers)")
+    parser.add_argument("--rules", help="JSON/YAML file with declarative signature rules")
+    parser.add_argument("--watch-rules", action="store_true",
+                        help="Hot-reload the rules file (and its baselines) when it changes")
+    parser.add_argument("--backend", choices=["scapy", "afpacket"], default="scapy",
+                        help="Live capture backend (afpacket: kernel BPF + TPACKET_V3 mmap ring, Linux only)")
+    parser.add_argument("--bpf", default="tcp or udp or icmp or icmp6",
+                        help="Kernel BPF filter for the afpacket backend")
+    parser.add_argument("--queue-size", type=int, default=65536,
+                        help="Capacity of the capture ring buffer")
+    parser.add_argument("--overflow-policy", choices=["drop_newest", "drop_oldest", "sample"],
+                        default="drop_newest", help="What to do when detection falls behind capture")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Shard traffic by destination host across this many worker processes")
+    parser.add_argument("--alert-window", type=float, default=60.0,
+                        help="Aggregate repeats of the same alert over this many seconds (0: log every alert)")
+    parser.add_argument("--alert-dir", help="Write alerts as rotated, gzip-compressed JSONL files in this directory")
+    parser.add_argument("--baselines", choices=["learn", "detect", "adaptive"],
+                        help="Score anomalies against baselines learned per destination service "
+                             "(learn: build baselines only, detect: frozen, adaptive: both)")
+    parser.add_argument("--baseline-file", help="Load learned baselines from and save them to this file")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Instrument the pipeline and log a metrics summary periodically")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics (implies --metrics)")
+    parser.add_argument("--metrics-interval", type=float, default=10.0,
+                        help="Seconds between metrics summary log lines")
+    parser.add_argument("--metrics-sample", type=int, default=1,
+                        help="Time one in N packets in the latency histograms")
+    parser.add_argument("--reassembly", action="store_true",
+                        help="Reassemble TCP streams so payload rules match contents split across segments")
+    parser.add_argument("--stream-window", type=int, default=4096,
+                        help="Bytes of reassembled data kept per stream for payload inspection")
+    parser.add_argument("--stream-memory", type=float, default=64.0,
+                        help="Memory cap in MB for all reassembly buffers")
+    parser.add_argument("--checkpoint", help="Checkpoint flow and detector state to this file periodically "
+                                             "and restore it on startup (flows in progress at shutdown "
+                                             "are exported by the run that restores them)")
+    parser.add_argument("--checkpoint-interval", type=float, default=60.0,
+                        help="Seconds between checkpoints")
+    parser.add_argument("--flow-export", help="Export finished flows as columnar files to this directory "
+                                              "(requires pyarrow)")
+    parser.add_argument("--flow-export-format", choices=["parquet", "arrow"], default="parquet",
+                        help="Flow export file format (arrow: Arrow IPC file)")
+    parser.add_argument("--flow-sample-interval", type=float, default=None,
+                        help="Also export the active flows every this many seconds")
+    parser.add_argument("--store", help="Persist alerts and finished flows to this SQLite database "
+                                        "(query it with ids_store.py)")
+    args = parser.parse_args()
+
+    if args.workers and args.baselines:
+        parser.error("--baselines is not supported with --workers (baselines are learned per process)")
+    if args.workers and args.reassembly:
+        parser.error("--reassembly is not supported with --workers")
+    if args.workers and args.checkpoint:
+        parser.error("--checkpoint is not supported with --workers")
+    if args.workers and args.flow_export:
+        parser.error("--flow-export is not supported with --workers")
+    if args.workers and args.watch_rules:
+        parser.error("--watch-rules is not supported with --workers")
+    if args.workers and (args.metrics or args.metrics_port):
+        parser.error("--metrics is not supported with --workers (see the per-shard statistics instead)")
+    if args.backend == "afpacket" and not args.pcap:
+        from afpacket_capture import compile_bpf
+        try:
+            compile_bpf(args.bpf, args.interface)
+        except ValueError as e:
+            parser.error(f"--bpf: {e}")
+    if args.workers:
+        from sharded_pipeline import ShardedIDS
+        ShardedIDS(args.workers, interface=args.interface, pcap_file=args.pcap,
+                   replay_speed=args.speed, rule_file=args.rules, alert_window=args.alert_window,
+                   alert_dir=args.alert_dir, store_path=args.store, backend=args.backend,
+                   bpf_filter=args.bpf).start()
+        raise SystemExit(0)
+
+    ids = IntrusionDetectionSystem(args.interface, pcap_file=args.pcap, replay_speed=args.speed,
+                                   fast_decode=args.fast_decode, rule_file=args.rules,
+                                   watch_rules=args.watch_rules, queue_size=args.queue_size,
+                                   overflow_policy=args.overflow_policy, backend=args.backend,
+                                   bpf_filter=args.bpf, alert_window=args.alert_window,
+                                   alert_dir=args.alert_dir, store_path=args.store,
+                                   baseline_mode=args.baselines, baseline_file=args.baseline_file,
+                                   metrics=args.metrics, metrics_port=args.metrics_port,
+                                   metrics_interval=args.metrics_interval, metrics_sample=args.metrics_sample,
+                                   reassembly=args.reassembly, stream_window=args.stream_window,
+                                   stream_memory_mb=args.stream_memory, checkpoint_path=args.checkpoint,
+                                   checkpoint_interval=args.checkpoint_interval,
+                                   flow_export_dir=args.flow_export, flow_export_format=args.flow_export_format,
+                                   flow_sample_interval=args.flow_sample_interval)
     ids.start()
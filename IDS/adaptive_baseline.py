@@ -0,0 +1,339 @@
+from collections import OrderedDict
+import bisect
+import logging
+import json
+import math
+import os
+
+from packet_decoder import PROTO_TCP
+from sketches import CountMinSketch
+
+SYN = 0x02
+ACK = 0x10
+
+# Anomaly trigger name -> feature it is learned from
+ANOMALY_FEATURES = (
+    ('packet_size', 'packet_size'),
+    ('packet_rate', 'flow_pkt_rate_1s'),
+    ('byte_rate', 'flow_byte_rate_1s'),
+)
+
+# Baseline modes
+LEARN = 'learn'
+DETECT = 'detect'
+ADAPTIVE = 'adaptive'
+BASELINE_MODES = (LEARN, DETECT, ADAPTIVE)
+
+
+class P2Quantiles:
+    """
+    Streaming estimates of a low quantile, the median and a high quantile with
+    the P-square algorithm (Jain & Chlamtac): five markers (min, low, median,
+    high, max), constant memory and O(1) updates.
+    """
+    __slots__ = ('heights', 'positions', 'increments')
+
+    def __init__(self, low, high):
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        # Desired marker positions after n samples are 1 + (n - 1) * increment
+        self.increments = (0.0, low, 0.5, high, 1.0)
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            bisect.insort(q, x)
+            return
+
+        # Find the cell containing x (extending the extremes) and shift the markers above it
+        n = self.positions
+        if x < q[1]:
+            if x < q[0]:
+                q[0] = x
+            n[1] += 1
+            n[2] += 1
+            n[3] += 1
+        elif x < q[2]:
+            n[2] += 1
+            n[3] += 1
+        elif x < q[3]:
+            n[3] += 1
+        elif x > q[4]:
+            q[4] = x
+        n[4] += 1
+
+        # Move the middle markers towards their desired positions
+        steps = n[4] - 1
+        increments = self.increments
+        for i in (1, 2, 3):
+            d = 1 + steps * increments[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < height < q[i + 1]:
+                    # Parabolic prediction out of order: fall back to linear
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def quantile(self, marker):
+        """
+        Returns the estimate of marker 1 (low), 2 (median) or 3 (high).
+        """
+        q = self.heights
+        if len(q) < 5:
+            # Too few samples for the markers: exact quantile of what was seen
+            return q[min(len(q) - 1, int(self.increments[marker] * len(q)))] if q else 0.0
+        return q[marker]
+
+    def state(self):
+        return [list(self.heights), list(self.positions)]
+
+    @classmethod
+    def from_state(cls, quantiles, state):
+        estimator = cls(*quantiles)
+        estimator.heights, estimator.positions = list(state[0]), list(state[1])
+        return estimator
+
+
+class FeatureBaseline:
+    """
+    Learned distribution of one feature: EWMA mean/variance and streaming
+    low/high quantiles.
+    """
+    __slots__ = ('count', 'mean', 'var', 'quantiles')
+
+    def __init__(self, quantiles):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.quantiles = P2Quantiles(*quantiles)
+
+    def update(self, x, alpha):
+        self.count += 1
+        # Plain running mean until 1/n drops below alpha, so the start is not biased
+        weight = max(alpha, 1.0 / self.count)
+        diff = x - self.mean
+        increment = weight * diff
+        self.mean += increment
+        self.var = (1 - weight) * (self.var + diff * increment)
+        self.quantiles.add(x)
+
+    def score(self, x):
+        """
+        Returns how far x lies outside the learned [low, high] quantile range,
+        in units of the larger of the standard deviation and the range width
+        (0 inside the range).
+        """
+        low = self.quantiles.quantile(1)
+        high = self.quantiles.quantile(3)
+        if x > high:
+            distance = x - high
+        elif x < low:
+            distance = low - x
+        else:
+            return 0.0
+        return distance / max(math.sqrt(self.var), high - low, 1.0)
+
+    def state(self):
+        return [self.count, self.mean, self.var, self.quantiles.state()]
+
+    @classmethod
+    def from_state(cls, quantiles, state):
+        baseline = cls(quantiles)
+        baseline.count, baseline.mean, baseline.var = state[0], state[1], state[2]
+        baseline.quantiles = P2Quantiles.from_state(quantiles, state[3])
+        return baseline
+
+
+class AdaptiveBaselines:
+    def __init__(self, mode=ADAPTIVE, max_services=10000, min_samples=200, alpha=0.01,
+                 threshold=3.0, quantiles=(0.01, 0.99), path=None, admit_after=8, admission_width=8192):
+        """
+        Initializes learned anomaly baselines per destination service (IP:port).
+
+        Each service keeps, per anomaly feature, EWMA mean/variance and P-square
+        estimates of a low quantile, the median and a high quantile. A value is
+        scored by how far it falls outside the learned quantile range; services
+        with too little history are scored against the global baseline.
+
+        Only the server side of a conversation becomes a service, so replies to
+        clients' ephemeral ports do not push real services out of the table: a
+        TCP service is created by a SYN to it, any other by admit_after packets
+        to it within admission_width packets to unknown destinations (counted
+        in a Count-Min sketch). Packets to other destinations are scored
+        against, and learned into, the global baseline only.
+
+        :param mode: 'learn' (update only, no anomalies), 'detect' (score against frozen
+                     baselines) or 'adaptive' (score, and learn from non-anomalous packets).
+        :param max_services: Maximum number of services tracked (least recently seen evicted).
+        :param min_samples: Samples a baseline needs before it is used for scoring.
+        :param alpha: EWMA smoothing factor.
+        :param threshold: Score at which a feature is reported as anomalous.
+        :param quantiles: Low and high quantiles bounding normal values.
+        :param path: Optional baseline file, loaded now if it exists and written by save().
+        :param admit_after: Packets a non-TCP destination needs before it becomes a service.
+        :param admission_width: Width of the admission sketch, which is cleared after this
+                                many packets to unknown non-TCP destinations.
+        """
+        if mode not in BASELINE_MODES:
+            raise ValueError(f"Unknown baseline mode '{mode}', expected one of {BASELINE_MODES}")
+
+        self.mode = mode
+        self.max_services = max_services
+        self.min_samples = min_samples
+        self.alpha = alpha
+        self.threshold = threshold
+        self.quantiles = tuple(quantiles)
+        self.path = path
+        self.admit_after = admit_after
+        self.admission = CountMinSketch(admission_width)
+        self.admission_width = admission_width
+        self.admission_count = 0
+
+        self.global_baseline = self._new_service()
+        self.services = OrderedDict()
+        self.evicted = 0
+
+        self.logger = logging.getLogger(__name__)
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def _new_service(self):
+        return [FeatureBaseline(self.quantiles) for _ in ANOMALY_FEATURES]
+
+    def inspect(self, features):
+        """
+        Scores a packet against its service baseline and learns from it
+        according to the mode.
+
+        :param features: Dictionary containing packet features.
+        :return: An anomaly threat dictionary, or None.
+        """
+        key = (features['dst_ip'], features['dst_port'])
+        services = self.services
+        service = services.get(key)
+        if service is None:
+            if self.mode != DETECT and self._admit(key, features):
+                if len(services) >= self.max_services:
+                    services.popitem(last=False)
+                    self.evicted += 1
+                service = services[key] = self._new_service()
+        else:
+            services.move_to_end(key)
+
+        values = [features.get(name, 0.0) for _, name in ANOMALY_FEATURES]
+
+        triggers = []
+        scores = {}
+        if self.mode != LEARN:
+            model = service if service and service[0].count >= self.min_samples else self.global_baseline
+            if model[0].count >= self.min_samples:
+                for (trigger, _), baseline, value in zip(ANOMALY_FEATURES, model, values):
+                    score = baseline.score(value)
+                    if score >= self.threshold:
+                        triggers.append(trigger)
+                        scores[trigger] = round(score, 2)
+
+        if self.mode == LEARN or (self.mode == ADAPTIVE and not triggers):
+            alpha = self.alpha
+            for global_baseline, value in zip(self.global_baseline, values):
+                global_baseline.update(value, alpha)
+            if service is not None:
+                for baseline, value in zip(service, values):
+                    baseline.update(value, alpha)
+
+        if not triggers:
+            return None
+        # 0.33 per feature at the threshold, growing to 0.66 at twice the threshold
+        confidence = min(1.0, sum(0.33 * min(score / self.threshold, 2.0) for score in scores.values()))
+        return {
+            'type': 'anomaly',
+            'triggers': triggers,
+            'scores': scores,
+            'confidence': round(confidence, 2)
+        }
+
+    def _admit(self, key, features):
+        """
+        Returns whether an unknown destination looks like a server worth a service entry.
+        """
+        if features.get('protocol') == PROTO_TCP:
+            # Only a connection attempt marks the destination as the server side
+            return features.get('tcp_flags', 0) & (SYN | ACK) == SYN
+        self.admission_count += 1
+        if self.admission_count >= self.admission_width:
+            # Forget old counts so scattered replies never add up to an admission
+            self.admission.clear()
+            self.admission_count = 0
+        return self.admission.add(key) >= self.admit_after
+
+    def stats(self):
+        """
+        Returns the learning mode and the number of services and samples learned.
+        """
+        return {
+            'mode': self.mode,
+            'services': len(self.services),
+            'evicted': self.evicted,
+            'global_samples': self.global_baseline[0].count
+        }
+
+    def state(self):
+        """
+        Returns the baselines as a JSON-serializable dictionary.
+        """
+        return {
+            'version': 1,
+            'quantiles': list(self.quantiles),
+            'features': [name for _, name in ANOMALY_FEATURES],
+            'global': [baseline.state() for baseline in self.global_baseline],
+            'services': [[ip, port, [baseline.state() for baseline in service]]
+                         for (ip, port), service in list(self.services.items())]
+        }
+
+    def save(self, path=None):
+        """
+        Writes the baselines to a JSON file (atomically, via a temporary file).
+
+        :param path: Target file (defaults to the path given at construction).
+        """
+        path = path or self.path
+        if not path:
+            raise ValueError("No baseline file path given")
+        data = self.state()
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
+        self.logger.info(f"Saved baselines for {len(self.services)} services to {path}")
+
+    def load(self, path):
+        """
+        Loads baselines written by save(), replacing the current ones.
+
+        :raises ValueError: If the file was written with different quantiles or features.
+        """
+        with open(path) as f:
+            self.restore(json.load(f), path)
+
+    def restore(self, data, source="state"):
+        """
+        Replaces the current baselines with those from state().
+
+        :param source: Where the state came from, for messages.
+        :raises ValueError: If the state was learned with different quantiles or features.
+        """
+        if (tuple(data['quantiles']) != self.quantiles or
+                data['features'] != [name for _, name in ANOMALY_FEATURES]):
+            raise ValueError(f"Baseline {source} was learned with different quantiles or features")
+
+        def baselines(states):
+            return [FeatureBaseline.from_state(self.quantiles, state) for state in states]
+
+        self.global_baseline = baselines(data['global'])
+        self.services = OrderedDict()
+        for ip, port, states in data['services'][-self.max_services:]:
+            self.services[(ip, port)] = baselines(states)
+        self.logger.info(f"Loaded baselines for {len(self.services)} services from {source}")
@@ -0,0 +1,243 @@
+from packet_capture import PacketCapture
+from packet_decoder import LINKTYPE_ETHERNET
+import threading
+import select
+import socket
+import struct
+import ctypes
+import mmap
+
+# Linux packet socket constants (linux/if_packet.h, linux/if_ether.h)
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+SO_ATTACH_FILTER = 26
+
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+
+# sockaddr_ll.sll_pkttype of frames sent by this host; on lo every packet is
+# also seen a second time as incoming
+PACKET_OUTGOING = 4
+
+# tpacket_block_desc: version, offset_to_priv, then tpacket_hdr_v1 starting with
+# block_status, num_pkts, offset_to_first_pkt
+_BLOCK_STATUS_OFFSET = 8
+_BLOCK_HDR = struct.Struct('=II')
+_BLOCK_STATUS = struct.Struct('=I')
+# tpacket3_hdr: next_offset, sec, nsec, snaplen, len, status, mac, net
+_TPACKET3_HDR = struct.Struct('=IIIIIIHH')
+# The sockaddr_ll follows the 48-byte tpacket3_hdr; sll_pkttype is at offset 10 in it
+_SLL_PKTTYPE_OFFSET = 48 + 10
+_TPACKET_REQ3 = struct.Struct('=IIIIIII')
+_TPACKET_STATS_V3 = struct.Struct('=III')
+
+# Classic BPF for "ip and tcp" on Ethernet, used when libpcap is not available
+# to compile filter expressions
+IP_TCP_FILTER = [
+    (0x28, 0, 0, 12),        # ldh [12]           ethertype
+    (0x15, 0, 3, 0x0800),    # jeq #0x800         IPv4?
+    (0x30, 0, 0, 23),        # ldb [23]           IP protocol
+    (0x15, 0, 1, 6),         # jeq #6             TCP?
+    (0x06, 0, 0, 0x40000),   # ret #262144        accept
+    (0x06, 0, 0, 0),         # ret #0             drop
+]
+
+# Classic BPF for DEFAULT_FILTER on Ethernet (IPv6 extension headers are not followed)
+DEFAULT_FILTER = 'tcp or udp or icmp or icmp6'
+IP_DEFAULT_FILTER = [
+    (0x28, 0, 0, 12),        # ldh [12]           ethertype
+    (0x15, 0, 4, 0x0800),    # jeq #0x800         IPv4?
+    (0x30, 0, 0, 23),        # ldb [23]           IP protocol
+    (0x15, 7, 0, 6),         # jeq #6             TCP?
+    (0x15, 6, 0, 17),        # jeq #17            UDP?
+    (0x15, 5, 6, 1),         # jeq #1             ICMP?
+    (0x15, 0, 5, 0x86DD),    # jeq #0x86dd        IPv6?
+    (0x30, 0, 0, 20),        # ldb [20]           next header
+    (0x15, 2, 0, 6),         # jeq #6             TCP?
+    (0x15, 1, 0, 17),        # jeq #17            UDP?
+    (0x15, 0, 1, 58),        # jeq #58            ICMPv6?
+    (0x06, 0, 0, 0x40000),   # ret #262144        accept
+    (0x06, 0, 0, 0),         # ret #0             drop
+]
+
+
+class _SockFilter(ctypes.Structure):
+    _fields_ = [('code', ctypes.c_uint16), ('jt', ctypes.c_uint8),
+                ('jf', ctypes.c_uint8), ('k', ctypes.c_uint32)]
+
+
+class _SockFprog(ctypes.Structure):
+    _fields_ = [('len', ctypes.c_uint16), ('filter', ctypes.POINTER(_SockFilter))]
+
+
+def compile_bpf(bpf_filter, interface=None):
+    """
+    Compiles a tcpdump-style filter expression into classic BPF instructions.
+
+    :param bpf_filter: Filter expression, or a list of (code, jt, jf, k) instructions.
+    :param interface: Interface whose link type the filter is compiled for.
+    :return: List of (code, jt, jf, k) instructions.
+    :raises ValueError: If the expression is invalid, or libpcap is not available
+                        to compile anything but the built-in filters.
+    """
+    if not isinstance(bpf_filter, str):
+        return list(bpf_filter)
+    try:
+        from scapy.arch.common import compile_filter
+        from scapy.error import Scapy_Exception
+        program = compile_filter(bpf_filter, iface=interface)
+    except (ImportError, OSError) as e:
+        if bpf_filter.strip() == 'ip and tcp':
+            return list(IP_TCP_FILTER)
+        if bpf_filter.strip() == DEFAULT_FILTER:
+            return list(IP_DEFAULT_FILTER)
+        raise ValueError(f"cannot compile BPF filter {bpf_filter!r} ({e}); without libpcap only "
+                         f"{DEFAULT_FILTER!r} and 'ip and tcp' are supported") from e
+    except Scapy_Exception as e:
+        raise ValueError(str(e)) from e
+    return [(ins.code, ins.jt, ins.jf, ins.k) for ins in program.bf_insns[:program.bf_len]]
+
+
+def attach_bpf(sock, instructions):
+    """
+    Attaches classic BPF instructions to a socket so the kernel drops
+    non-matching frames before they are copied to user space.
+    """
+    insns = (_SockFilter * len(instructions))(*[_SockFilter(*ins) for ins in instructions])
+    prog = _SockFprog(len(instructions), insns)
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, bytes(prog))
+
+
+class AfPacketCapture(PacketCapture):
+    def __init__(self, interface="eth0", bpf_filter=DEFAULT_FILTER, block_size=1 << 20,
+                 block_count=64, frame_size=2048, block_timeout_ms=100, **kwargs):
+        """
+        Initializes a Linux AF_PACKET capture backend reading from a TPACKET_V3
+        memory-mapped ring.
+
+        The BPF filter runs in the kernel, and frames are read block by block
+        from memory shared with the kernel, so there is no syscall per packet
+        and no Scapy dissection. Frames are passed to the fast header decoder
+        and queued as PacketRecords.
+
+        :param interface: Network interface to capture packets from.
+        :param bpf_filter: tcpdump-style filter expression or list of BPF instructions
+                           (None to capture everything).
+        :param block_size: Size of each ring block in bytes (multiple of the page size).
+        :param block_count: Number of blocks in the ring.
+        :param frame_size: Nominal frame slot size used to size the ring.
+        :param block_timeout_ms: Time after which the kernel retires a partially filled block.
+        :param kwargs: Capture queue options passed to PacketCapture.
+        """
+        kwargs['raw'] = True
+        super().__init__(interface=interface, **kwargs)
+        self.bpf_filter = bpf_filter
+        self.block_size = block_size
+        self.block_count = block_count
+        self.frame_size = frame_size
+        self.block_timeout_ms = block_timeout_ms
+
+        self.sock = None
+        self.ring = None
+        self.kernel_packets = 0
+        self.kernel_drops = 0
+        self.kernel_freezes = 0
+        self.stats_lock = threading.Lock()
+
+    def _open(self):
+        """Creates the socket, attaches the filter and maps the receive ring."""
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            if self.bpf_filter:
+                attach_bpf(sock, compile_bpf(self.bpf_filter, self.interface))
+            sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            frame_count = self.block_size * self.block_count // self.frame_size
+            sock.setsockopt(SOL_PACKET, PACKET_RX_RING, _TPACKET_REQ3.pack(
+                self.block_size, self.block_count, self.frame_size, frame_count,
+                self.block_timeout_ms, 0, 0))
+            self.ring = mmap.mmap(sock.fileno(), self.block_size * self.block_count,
+                                  mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            sock.bind((self.interface, ETH_P_ALL))
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def start_capture(self):
+        """
+        Starts reading the memory-mapped ring in a separate thread.
+        """
+        if self.capture_thread and self.capture_thread.is_alive():
+            self.logger.warning("Capture thread is already running.")
+            return
+
+        self._open()
+        self.finished.clear()
+        self.packet_queue.reopen()
+        self.capture_thread = threading.Thread(target=self._read_ring, daemon=True)
+        self.capture_thread.start()
+        self.logger.info(f"AF_PACKET capture started on interface: {self.interface} "
+                         f"(filter: {self.bpf_filter!r})")
+
+    def _read_ring(self):
+        """Walks the ring block by block, handing each frame to the decoder."""
+        ring = self.ring
+        poller = select.poll()
+        poller.register(self.sock, select.POLLIN | select.POLLERR)
+        block_index = 0
+
+        try:
+            while not self.stop_capture.is_set():
+                base = block_index * self.block_size
+                status = _BLOCK_STATUS.unpack_from(ring, base + _BLOCK_STATUS_OFFSET)[0]
+                if not status & TP_STATUS_USER:
+                    # Only sleep in the kernel when the next block is not ready yet
+                    poller.poll(500)
+                    continue
+
+                num_pkts, offset = _BLOCK_HDR.unpack_from(ring, base + _BLOCK_STATUS_OFFSET + 4)
+                offset += base
+                for _ in range(num_pkts):
+                    next_offset, sec, nsec, snaplen, _, _, mac, _ = _TPACKET3_HDR.unpack_from(ring, offset)
+                    if ring[offset + _SLL_PKTTYPE_OFFSET] != PACKET_OUTGOING:
+                        start = offset + mac
+                        self.frame_callback(ring[start:start + snaplen], sec + nsec * 1e-9, LINKTYPE_ETHERNET)
+                    offset += next_offset
+
+                # Hand the block back to the kernel
+                _BLOCK_STATUS.pack_into(ring, base + _BLOCK_STATUS_OFFSET, TP_STATUS_KERNEL)
+                block_index = (block_index + 1) % self.block_count
+        except Exception as e:
+            self.logger.error(f"Error during packet capture: {e}")
+        finally:
+            self.get_kernel_stats()
+            with self.stats_lock:
+                self.ring.close()
+                self.sock.close()
+                self.ring = None
+                self.sock = None
+            self._finish()
+
+    def get_kernel_stats(self):
+        """
+        Returns the kernel's packet, drop and queue-freeze counters for this socket.
+
+        PACKET_STATISTICS resets the kernel counters on every read, so they are
+        accumulated here.
+        """
+        with self.stats_lock:
+            if self.sock is not None:
+                packets, drops, freezes = _TPACKET_STATS_V3.unpack(
+                    self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, _TPACKET_STATS_V3.size))
+                self.kernel_packets += packets
+                self.kernel_drops += drops
+                self.kernel_freezes += freezes
+            return {
+                'kernel_packets': self.kernel_packets,
+                'kernel_drops': self.kernel_drops,
+                'kernel_freeze_count': self.kernel_freezes
+            }
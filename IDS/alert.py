@@ -1,17 +1,49 @@
+import threading
 import logging
 import json
-from datetime import datetime
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import time
+from alert_aggregator import AlertAggregator
+from alert_writer import AlertWriter, format_alert
+
+# Rules whose sources are typically spoofed: repeats are aggregated per target
+TARGET_KEYED_RULES = {'syn_flood', 'dns_amplification', 'ntp_amplification', 'icmp_flood'}
+# Rules whose destinations change with every packet: repeats are aggregated per source
+SOURCE_KEYED_RULES = {'port_scan', 'host_sweep'}
+
+
+def alert_key(threat, source_ip, destination_ip):
+    """
+    Returns the suppression key of an alert: the threat type and rule (or
+    anomaly triggers) plus the addresses that stay the same across repeats.
+    Floods and anomalies are keyed by destination, scans by source and other
+    threats by both.
+    """
+    rule = threat.get('rule')
+    kind = threat['type']
+    if kind in ('flood', 'anomaly') or rule in TARGET_KEYED_RULES:
+        source_ip = None
+    elif kind == 'scan' or rule in SOURCE_KEYED_RULES:
+        destination_ip = None
+    return kind, rule or tuple(threat.get('triggers', ())), source_ip, destination_ip
+
 
 class AlertSystem:
-    def __init__(self, log_file="ids_alerts.log", email_config=None):
+    def __init__(self, log_file="ids_alerts.log", email_config=None, suppression_window=60.0,
+                 max_alert_keys=10000, alert_dir=None, store=None):
         """
         Initializes the AlertSystem for logging and sending alerts.
         
         :param log_file: Path to the log file where alerts will be saved.
         :param email_config: Dictionary containing email configuration for notifications.
+                             Emails are sent from a background thread, see EmailDispatcher.
+        :param suppression_window: Seconds during which repeats of an alert (same threat type,
+                                   rule or triggers and addresses, see alert_key) are counted
+                                   instead of logged; 0 logs every alert. Windows are closed
+                                   and summarized by a timer, also when no further alerts come.
+        :param max_alert_keys: Maximum number of alert keys tracked for suppression.
+        :param alert_dir: Optional directory for buffered, rotated JSONL alert files (see
+                          AlertWriter). Alerts are then written there instead of to the log file.
+        :param store: Optional IDSStore that alerts are also persisted to for querying.
         """
         self.logger = logging.getLogger("IDS_Alerts")
         self.logger.setLevel(logging.INFO)
@@ -22,8 +54,28 @@ class AlertSystem:
         handler.setFormatter(formatter)
         self.logger.addHandler(handler)
 
+        # Structured alert output written by a background thread (optional)
+        self.alert_writer = AlertWriter(alert_dir) if alert_dir else None
+        self.store = store
+
         # Email notification configuration (optional)
         self.email_config = email_config
+        self.email_dispatcher = None
+        if email_config:
+            # smtplib and the email package are only imported when email is configured
+            from alert_dispatcher import EmailDispatcher
+            self.email_dispatcher = EmailDispatcher(email_config)
+
+        # Repeats are aggregated into one summary alert per suppression window. The
+        # aggregator is shared with the sweep timer (and with capture threads raising
+        # overload alerts), so it is only used under the lock.
+        self.aggregator = AlertAggregator(suppression_window, max_alert_keys, on_summary=self._log_summary)
+        self.lock = threading.Lock()
+        self.stop_sweeping = threading.Event()
+        self.sweeper = None
+        if suppression_window > 0:
+            self.sweeper = threading.Thread(target=self._sweep, daemon=True)
+            self.sweeper.start()
 
     def generate_alert(self, threat, packet_info):
         """
@@ -32,51 +84,87 @@ class AlertSystem:
         :param threat: The threat information containing type and confidence.
         :param packet_info: Packet information such as source and destination IPs.
         """
+        source_ip = packet_info.get('source_ip')
+        destination_ip = packet_info.get('destination_ip')
+        key = alert_key(threat, source_ip, destination_ip)
+        now = time.time()
+        with self.lock:
+            if self.aggregator.suppress(key, now):
+                return
+
         alert = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now,
+            'packet_time': packet_info.get('packet_time', now),
             'threat_type': threat['type'],
-            'source_ip': packet_info.get('source_ip'),
-            'destination_ip': packet_info.get('destination_ip'),
+            'source_ip': source_ip,
+            'destination_ip': destination_ip,
             'confidence': threat.get('confidence', 0.0),
             'details': threat
         }
+        with self.lock:
+            self.aggregator.track(key, alert, now)
+        if self.store:
+            self.store.add_alert(alert)
 
-        # Log alert as a warning
-        self.logger.warning(json.dumps(alert))
+        if self.alert_writer:
+            self.alert_writer.write(alert)
+            message = f"{alert['threat_type']} {source_ip} -> {destination_ip}"
+        else:
+            # Log alert as a warning
+            message = json.dumps(format_alert(alert))
+            self.logger.warning(message)
 
         # If threat confidence is high, log as critical and send notifications
         if threat['confidence'] > 0.8:
-            self.logger.critical(f"High confidence threat detected: {json.dumps(alert)}")
+            self.logger.critical(f"High confidence threat detected: {message}")
             # Send email notification if email_config is provided
             if self.email_config:
                 self.send_email(alert)
 
+    def _sweep(self):
+        """Closes ended suppression windows periodically, so summaries do not wait for new alerts."""
+        while not self.stop_sweeping.wait(self.aggregator.sweep_interval):
+            with self.lock:
+                self.aggregator.sweep()
+
+    def _log_summary(self, summary):
+        """
+        Logs an aggregated alert for repeats suppressed during a window.
+        """
+        if self.store:
+            self.store.add_alert(summary)
+        if self.alert_writer:
+            self.alert_writer.write(summary)
+        else:
+            self.logger.warning(json.dumps(format_alert(summary)))
+
     def send_email(self, alert):
         """
-        Sends an email notification with the alert details.
+        Queues an email notification with the alert details. The email is sent
+        by the dispatcher thread, so this never waits on the SMTP server.
 
         :param alert: The alert details to be sent via email.
         """
-        if not self.email_config:
+        if not self.email_dispatcher:
             return
 
-        # Email setup
-        try:
-            msg = MIMEMultipart()
-            msg['From'] = self.email_config['from_email']
-            msg['To'] = self.email_config['to_email']
-            msg['Subject'] = f"IDS Alert - {alert['threat_type']}"
-
-            body = f"Alert Details:\n\n{json.dumps(alert, indent=4)}"
-            msg.attach(MIMEText(body, 'plain'))
-
-            with smtplib.SMTP(self.email_config['smtp_server'], self.email_config['smtp_port']) as server:
-                server.starttls()
-                server.login(self.email_config['from_email'], self.email_config['password'])
-                text = msg.as_string()
-                server.sendmail(self.email_config['from_email'], self.email_config['to_email'], text)
-
-            self.logger.info(f"Alert email sent for threat: {alert['threat_type']}")
-        except Exception as e:
-            self.logger.error(f"Failed to send email notification: {str(e)}")
+        if not self.email_dispatcher.submit(alert):
+            self.logger.error(f"Email queue full, notification dropped for threat: {alert['threat_type']}")
 
+    def close(self):
+        """
+        Logs summaries for open suppression windows, flushes queued alerts and
+        email notifications and stops the background threads.
+        """
+        if self.sweeper:
+            self.stop_sweeping.set()
+            self.sweeper.join()
+        with self.lock:
+            self.aggregator.flush()
+        self.logger.info(f"Alert aggregation stats: {self.aggregator.stats()}")
+        if self.alert_writer:
+            self.alert_writer.close()
+            self.logger.info(f"Alert writer stats: {self.alert_writer.stats()}")
+        if self.email_dispatcher:
+            self.email_dispatcher.close()
+            self.logger.info(f"Email dispatcher stats: {self.email_dispatcher.stats()}")
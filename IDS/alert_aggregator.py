@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from datetime import datetime
+import time
+
+
+class AlertAggregate:
+    __slots__ = ('alert', 'first_seen', 'last_seen', 'count')
+
+    def __init__(self, alert, now):
+        """
+        Tracks the repeats of one alert key within a suppression window.
+
+        :param alert: The first alert of the window.
+        :param now: Time the window started.
+        """
+        self.alert = alert
+        self.first_seen = now
+        self.last_seen = now
+        self.count = 1
+
+
+class AlertAggregator:
+    def __init__(self, window=60.0, max_keys=10000, on_summary=None, sweep_interval=1.0):
+        """
+        Initializes alert deduplication for a stream of alerts.
+
+        The first alert for a key is passed through; repeats within the
+        suppression window are only counted. When the window closes (or the
+        key is evicted to stay within max_keys), on_summary is called with an
+        aggregated alert carrying the count and first/last-seen times.
+
+        :param window: Suppression window in seconds (0 disables suppression).
+        :param max_keys: Maximum number of alert keys tracked at once.
+        :param on_summary: Callback(alert) for aggregated alerts.
+        :param sweep_interval: Minimum seconds between scans for closed windows.
+        """
+        self.window = window
+        self.max_keys = max_keys
+        self.on_summary = on_summary
+        self.sweep_interval = sweep_interval
+
+        # Keys are kept in window start order, so closed windows are at the front
+        self.aggregates = OrderedDict()
+        self.next_sweep = 0.0
+
+        self.suppressed = 0
+        self.summaries = 0
+        self.evicted = 0
+
+    def suppress(self, key, now=None):
+        """
+        Checks an alert key against its suppression window.
+
+        :param key: Hashable alert key.
+        :param now: Current time (defaults to time.time()).
+        :return: True if the alert is a repeat and should not be emitted.
+        """
+        if now is None:
+            now = time.time()
+        aggregate = self.aggregates.get(key)
+        if aggregate is not None and now - aggregate.first_seen < self.window:
+            aggregate.count += 1
+            aggregate.last_seen = now
+            self.suppressed += 1
+            return True
+
+        if now >= self.next_sweep:
+            self.sweep(now)
+        return False
+
+    def track(self, key, alert, now=None):
+        """
+        Starts a suppression window for an alert that was emitted.
+
+        :param key: Hashable alert key.
+        :param alert: The emitted alert, used as the template for the summary.
+        :param now: Current time (defaults to time.time()).
+        """
+        if self.window <= 0:
+            return
+        if now is None:
+            now = time.time()
+        aggregate = self.aggregates.pop(key, None)
+        if aggregate is not None:
+            self._close(aggregate)
+        elif len(self.aggregates) >= self.max_keys:
+            self.evicted += 1
+            self._close(self.aggregates.popitem(last=False)[1])
+        self.aggregates[key] = AlertAggregate(alert, now)
+
+    def sweep(self, now=None):
+        """
+        Closes all windows that have ended.
+
+        :param now: Current time (defaults to time.time()).
+        """
+        if now is None:
+            now = time.time()
+        self.next_sweep = now + self.sweep_interval
+        aggregates = self.aggregates
+        cutoff = now - self.window
+        while aggregates:
+            key, aggregate = next(iter(aggregates.items()))
+            if aggregate.first_seen > cutoff:
+                break
+            del aggregates[key]
+            self._close(aggregate)
+
+    def flush(self):
+        """
+        Closes all open windows, e.g. on shutdown.
+        """
+        while self.aggregates:
+            self._close(self.aggregates.popitem(last=False)[1])
+
+    def _close(self, aggregate):
+        """Emits a summary if any repeats were suppressed in the window."""
+        if aggregate.count < 2 or self.on_summary is None:
+            return
+        summary = dict(aggregate.alert)
+        summary['count'] = aggregate.count
+        summary['first_seen'] = datetime.fromtimestamp(aggregate.first_seen).isoformat()
+        summary['last_seen'] = datetime.fromtimestamp(aggregate.last_seen).isoformat()
+        summary['aggregated'] = True
+        self.summaries += 1
+        self.on_summary(summary)
+
+    def stats(self):
+        """
+        Returns the number of tracked keys and suppression counters.
+        """
+        return {
+            'keys': len(self.aggregates),
+            'suppressed': self.suppressed,
+            'summaries': self.summaries,
+            'evicted': self.evicted
+        }
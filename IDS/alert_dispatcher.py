@@ -0,0 +1,207 @@
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import threading
+import smtplib
+import logging
+import queue
+import json
+import time
+from alert_writer import format_alert
+
+# Queued by close() to wake a worker that is waiting to fill a digest
+_WAKEUP = object()
+
+
+class EmailDispatcher:
+    def __init__(self, email_config, max_queue=1000, batch_window=5.0, max_batch=50,
+                 max_retries=5, backoff_base=1.0, backoff_max=60.0, idle_timeout=60.0):
+        """
+        Initializes a background email dispatcher for alert notifications.
+
+        Alerts are queued without blocking the caller. A single worker thread
+        keeps one SMTP connection open (reconnecting when it drops), groups
+        bursts of alerts into digest emails, and retries failed sends with
+        exponential backoff.
+
+        :param email_config: Dictionary with smtp_server, smtp_port, from_email, to_email and,
+                             optionally, password (login is skipped without one) and
+                             use_tls (STARTTLS, default True).
+        :param max_queue: Maximum number of alerts waiting to be sent; further alerts are dropped.
+        :param batch_window: Seconds to keep collecting alerts into one digest after the first.
+        :param max_batch: Maximum number of alerts in one digest email.
+        :param max_retries: Send attempts per email before giving up.
+        :param backoff_base: Delay in seconds before the first retry; doubles on each retry.
+        :param backoff_max: Upper bound for the retry delay.
+        :param idle_timeout: Seconds without sends after which the SMTP connection is closed.
+        """
+        self.email_config = email_config
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.idle_timeout = idle_timeout
+
+        self.alert_queue = queue.Queue(maxsize=max_queue)
+        self.stop_event = threading.Event()
+        self.server = None
+        self.last_used = 0.0
+
+        # Delivery counters
+        self.emails_sent = 0
+        self.alerts_sent = 0
+        self.alerts_dropped = 0
+        self.alerts_failed = 0
+        self.retries = 0
+        self.connections_opened = 0
+
+        self.logger = logging.getLogger(__name__)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, alert):
+        """
+        Queues an alert for notification without blocking.
+
+        :param alert: The alert details to be sent via email.
+        :return: False if the queue was full and the alert was dropped.
+        """
+        try:
+            self.alert_queue.put_nowait(alert)
+            return True
+        except queue.Full:
+            self.alerts_dropped += 1
+            return False
+
+    def _run(self):
+        """Worker loop: collect a batch, send it, repeat."""
+        while not (self.stop_event.is_set() and self.alert_queue.empty()):
+            try:
+                alert = self.alert_queue.get(timeout=1)
+            except queue.Empty:
+                if self.server and time.monotonic() - self.last_used > self.idle_timeout:
+                    self._disconnect()
+                continue
+            if alert is _WAKEUP:
+                continue
+
+            batch = [alert]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                # Once stopping, only take what is already queued
+                remaining = 0 if self.stop_event.is_set() else deadline - time.monotonic()
+                try:
+                    alert = (self.alert_queue.get(timeout=remaining) if remaining > 0
+                             else self.alert_queue.get_nowait())
+                except queue.Empty:
+                    break
+                if alert is not _WAKEUP:
+                    batch.append(alert)
+
+            self._deliver(batch)
+        self._disconnect()
+
+    def _build_message(self, batch):
+        """
+        Builds a single alert email, or a digest for several alerts.
+        """
+        msg = MIMEMultipart()
+        msg['From'] = self.email_config['from_email']
+        msg['To'] = self.email_config['to_email']
+
+        if len(batch) == 1:
+            alert = format_alert(batch[0])
+            msg['Subject'] = f"IDS Alert - {alert['threat_type']}"
+            body = f"Alert Details:\n\n{json.dumps(alert, indent=4)}"
+        else:
+            types = sorted({alert['threat_type'] for alert in batch})
+            msg['Subject'] = f"IDS Alert Digest - {len(batch)} alerts ({', '.join(types)})"
+            body = f"{len(batch)} alerts:\n\n" + "\n\n".join(json.dumps(format_alert(alert), indent=4) for alert in batch)
+
+        msg.attach(MIMEText(body, 'plain'))
+        return msg
+
+    def _connect(self):
+        """Opens (and authenticates) the SMTP connection if it is not open."""
+        if self.server is not None:
+            return self.server
+        config = self.email_config
+        server = smtplib.SMTP(config['smtp_server'], config['smtp_port'], timeout=30)
+        try:
+            if config.get('use_tls', True):
+                server.starttls()
+            if config.get('password'):
+                server.login(config['from_email'], config['password'])
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        self.connections_opened += 1
+        return server
+
+    def _disconnect(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
+
+    def _deliver(self, batch):
+        """
+        Sends one email for the batch, reconnecting and backing off on failure.
+        """
+        msg = self._build_message(batch)
+        text = msg.as_string()
+        delay = self.backoff_base
+
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                server = self._connect()
+                server.sendmail(self.email_config['from_email'], self.email_config['to_email'], text)
+                self.last_used = time.monotonic()
+                self.emails_sent += 1
+                self.alerts_sent += len(batch)
+                self.logger.info(f"Alert email sent with {len(batch)} alert(s)")
+                return True
+            except Exception as e:
+                # Drop the (possibly broken) connection and retry on a fresh one
+                self._disconnect()
+                if attempt == self.max_retries:
+                    self.alerts_failed += len(batch)
+                    self.logger.error(f"Failed to send email notification after {attempt} attempts: {e}")
+                    return False
+                self.retries += 1
+                self.logger.warning(f"Email send attempt {attempt} failed ({e}), retrying in {delay:.1f}s")
+                # Returns early on shutdown; close() bounds the total wait
+                self.stop_event.wait(delay)
+                delay = min(delay * 2, self.backoff_max)
+
+    def stats(self):
+        """
+        Returns delivery counters and the number of queued alerts.
+        """
+        return {
+            'queued': self.alert_queue.qsize(),
+            'emails_sent': self.emails_sent,
+            'alerts_sent': self.alerts_sent,
+            'alerts_dropped': self.alerts_dropped,
+            'alerts_failed': self.alerts_failed,
+            'retries': self.retries,
+            'connections_opened': self.connections_opened
+        }
+
+    def close(self, timeout=30.0):
+        """
+        Flushes queued alerts and stops the dispatcher. A digest that is still
+        being collected is sent right away instead of at the end of its batch window.
+
+        :param timeout: Maximum seconds to wait for the queue to drain.
+        """
+        self.stop_event.set()
+        try:
+            self.alert_queue.put(_WAKEUP, timeout=timeout)
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
@@ -0,0 +1,232 @@
+from datetime import datetime
+import threading
+import logging
+import shutil
+import queue
+import gzip
+import json
+import time
+import os
+
+try:
+    import orjson
+except ImportError:  # orjson is an optional, faster serializer
+    orjson = None
+
+_STOP = object()
+
+
+def format_alert(alert):
+    """
+    Returns a copy of an alert with its epoch timestamp formatted as ISO 8601.
+
+    Alerts carry a time.time() timestamp so formatting is left to the sinks,
+    off the packet processing thread where possible.
+    """
+    timestamp = alert.get('timestamp')
+    if isinstance(timestamp, float):
+        alert = dict(alert)
+        alert['timestamp'] = datetime.fromtimestamp(timestamp).isoformat()
+    return alert
+
+
+def _json_serializer(alert):
+    return json.dumps(alert, separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8')
+
+
+def _orjson_serializer(alert):
+    return orjson.dumps(alert, default=str)
+
+
+def get_serializer(serializer="auto"):
+    """
+    Resolves a serializer name to a function returning one JSON document as bytes.
+
+    :param serializer: 'json', 'orjson', 'auto' (orjson if installed) or a callable.
+    """
+    if callable(serializer):
+        return serializer
+    if serializer == 'orjson' or (serializer == 'auto' and orjson is not None):
+        if orjson is None:
+            raise ImportError("orjson is not installed (pip install orjson)")
+        return _orjson_serializer
+    if serializer in ('json', 'auto'):
+        return _json_serializer
+    raise ValueError(f"Unknown serializer '{serializer}', expected 'json', 'orjson' or 'auto'")
+
+
+class AlertWriter:
+    def __init__(self, directory="alerts", prefix="alerts", max_bytes=64 * 1024 * 1024,
+                 rotate_interval=3600.0, compress=True, serializer="auto", queue_size=100000,
+                 buffer_bytes=1024 * 1024, flush_interval=1.0):
+        """
+        Initializes a background writer that stores alerts as newline-delimited JSON.
+
+        Alerts are queued by the caller and serialized, buffered and written in
+        large chunks by a dedicated thread. Segments are named
+        <prefix>-<YYYYmmddTHHMMSS>-<seq>.jsonl and, once closed, gzip-compressed
+        to .jsonl.gz. Each line is one UTF-8 JSON object with the keys
+        timestamp (ISO 8601), packet_time (epoch seconds of the triggering
+        packet), threat_type, source_ip, destination_ip, confidence and
+        details; aggregated alerts add count, first_seen, last_seen and
+        aggregated. The format does not depend on the serializer.
+
+        :param directory: Directory for the segment files (created if missing).
+        :param prefix: Segment file name prefix.
+        :param max_bytes: Segment size after which a new segment is started.
+        :param rotate_interval: Seconds after which a new segment is started.
+        :param compress: Gzip closed segments.
+        :param serializer: 'json', 'orjson', 'auto' (orjson if installed) or a callable
+                           returning bytes.
+        :param queue_size: Maximum number of queued alerts; further alerts are dropped.
+        :param buffer_bytes: Buffered bytes that trigger a write.
+        :param flush_interval: Maximum seconds an alert stays buffered.
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.compress = compress
+        self.serialize = get_serializer(serializer)
+        self.buffer_bytes = buffer_bytes
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self.alert_queue = queue.Queue(maxsize=queue_size)
+        self.file = None
+        self.path = None
+        self.segment_bytes = 0
+        self.segment_opened = 0.0
+        self.sequence = 0
+        self.compressors = []
+
+        self.alerts_written = 0
+        self.alerts_dropped = 0
+        self.bytes_written = 0
+        self.segments_closed = 0
+
+        self.logger = logging.getLogger(__name__)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, alert):
+        """
+        Queues an alert for writing without blocking.
+
+        :param alert: Alert dictionary (timestamp as time.time() or ISO string).
+        :return: False if the queue was full and the alert was dropped.
+        """
+        try:
+            self.alert_queue.put_nowait(alert)
+            return True
+        except queue.Full:
+            self.alerts_dropped += 1
+            return False
+
+    def _run(self):
+        """Writer loop: serialize into a buffer, write it out in chunks."""
+        pending = []
+        pending_bytes = 0
+        serialize = self.serialize
+        next_flush = time.monotonic() + self.flush_interval
+
+        while True:
+            try:
+                alert = self.alert_queue.get(timeout=max(0.0, next_flush - time.monotonic()))
+            except queue.Empty:
+                alert = None
+            if alert is _STOP:
+                break
+
+            if alert is not None:
+                try:
+                    line = serialize(format_alert(alert)) + b'\n'
+                except Exception as e:
+                    self.logger.error(f"Failed to serialize alert: {e}")
+                    continue
+                pending.append(line)
+                pending_bytes += len(line)
+                # Write early if the buffer would push the segment past max_bytes
+                limit = min(self.buffer_bytes, self.max_bytes - self.segment_bytes)
+                if pending_bytes < limit and time.monotonic() < next_flush:
+                    continue
+
+            self._flush(pending)
+            pending = []
+            pending_bytes = 0
+            next_flush = time.monotonic() + self.flush_interval
+
+        self._flush(pending)
+        self._close_segment()
+
+    def _flush(self, lines):
+        """Writes buffered lines to the current segment and rotates if due."""
+        if lines:
+            if self.file is None:
+                self._open_segment()
+            chunk = b''.join(lines)
+            try:
+                self.file.write(chunk)
+                self.file.flush()
+            except OSError as e:
+                self.logger.error(f"Failed to write alerts to {self.path}: {e}")
+                return
+            self.segment_bytes += len(chunk)
+            self.bytes_written += len(chunk)
+            self.alerts_written += len(lines)
+
+        if self.file is not None and (self.segment_bytes >= self.max_bytes or
+                                      time.monotonic() - self.segment_opened >= self.rotate_interval):
+            self._close_segment()
+
+    def _open_segment(self):
+        self.sequence += 1
+        name = f"{self.prefix}-{time.strftime('%Y%m%dT%H%M%S')}-{self.sequence:04d}.jsonl"
+        self.path = os.path.join(self.directory, name)
+        self.file = open(self.path, 'ab')
+        self.segment_bytes = 0
+        self.segment_opened = time.monotonic()
+
+    def _close_segment(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        self.segments_closed += 1
+        if self.compress:
+            # Compress off the writer thread so writing is never stalled by gzip
+            compressor = threading.Thread(target=self._compress, args=(self.path,), daemon=True)
+            compressor.start()
+            self.compressors = [t for t in self.compressors if t.is_alive()] + [compressor]
+
+    def _compress(self, path):
+        """Gzips a closed segment to <path>.gz and removes the original."""
+        try:
+            with open(path, 'rb') as src, gzip.open(path + '.gz.tmp', 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(path + '.gz.tmp', path + '.gz')
+            os.remove(path)
+        except OSError as e:
+            self.logger.error(f"Failed to compress alert segment {path}: {e}")
+
+    def stats(self):
+        """
+        Returns the writer's queue depth and counters.
+        """
+        return {
+            'queued': self.alert_queue.qsize(),
+            'alerts_written': self.alerts_written,
+            'alerts_dropped': self.alerts_dropped,
+            'bytes_written': self.bytes_written,
+            'segments_closed': self.segments_closed
+        }
+
+    def close(self):
+        """
+        Writes out all queued alerts, closes (and compresses) the last segment
+        and stops the writer thread.
+        """
+        self.alert_queue.put(_STOP)
+        self.thread.join()
+        for compressor in self.compressors:
+            compressor.join()
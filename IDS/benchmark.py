@@ -0,0 +1,518 @@
+import subprocess
+import argparse
+import logging
+import tempfile
+import resource
+import random
+import json
+import time
+import sys
+import os
+from rule_compiler import RuleSet, compile_rule
+from payload_matcher import PayloadMatcher, PayloadPattern
+from traffic_generator import SCENARIOS
+
+
+def _random_rules(count, rng):
+    """
+    Generates declarative rules spread over destination ports and flag combinations.
+    """
+    flag_choices = ['S', 'SA', 'A', 'PA', 'FA', 'R']
+    rules = []
+    for i in range(count):
+        rule = {
+            'id': f'rule_{i}',
+            'protocol': 'tcp',
+            'tcp_flags': rng.choice(flag_choices),
+            'dst_port': rng.randint(1, 65535),
+            'conditions': [{'feature': 'src_pkt_rate_1s', 'op': '>', 'value': rng.randint(10, 1000)}]
+        }
+        if i % 4 == 0:
+            rule['dst_cidr'] = f'10.{rng.randint(0, 255)}.0.0/16'
+        rules.append(rule)
+    return rules
+
+
+def _random_features(count, rng):
+    flags = [0x02, 0x12, 0x10, 0x18, 0x11, 0x04]
+    return [{
+        'protocol': 6,
+        'tcp_flags': rng.choice(flags),
+        'src_ip': f'192.168.1.{rng.randint(1, 254)}',
+        'dst_ip': f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.1',
+        'src_port': rng.randint(1024, 65535),
+        'dst_port': rng.choice((22, 80, 443, rng.randint(1, 65535))),
+        'src_pkt_rate_1s': rng.random() * 1000
+    } for _ in range(count)]
+
+
+def _linear_match(rules, features):
+    """Reference evaluation that tests every rule against the packet."""
+    matched = []
+    protocol = features['protocol']
+    flags = features['tcp_flags']
+    dst_port = features['dst_port']
+    for rule in rules:
+        for rule_proto, rule_flags, rule_port in rule.keys:
+            if ((rule_proto is None or rule_proto == protocol) and
+                    (rule_flags is None or rule_flags == flags) and
+                    (rule_port is None or rule_port == dst_port)):
+                if rule.matches(features):
+                    matched.append(rule)
+                break
+    return matched
+
+
+def bench_rules(rule_counts, packets, seed=1):
+    """
+    Compares per-packet cost of the indexed rule evaluator against a linear scan.
+
+    :param rule_counts: Rule set sizes to measure.
+    :param packets: Number of synthetic packets evaluated per measurement.
+    :param seed: Random seed for reproducible rule sets and traffic.
+    """
+    rng = random.Random(seed)
+    traffic = _random_features(packets, rng)
+
+    print(f"{'rules':>8} {'indexed us/pkt':>15} {'linear us/pkt':>15}")
+    for count in rule_counts:
+        definitions = _random_rules(count, rng)
+        rule_set = RuleSet(definitions)
+        compiled = [compile_rule(d, i) for i, d in enumerate(definitions)]
+
+        start = time.perf_counter()
+        for features in traffic:
+            rule_set.match(features)
+        indexed = (time.perf_counter() - start) / packets * 1e6
+
+        start = time.perf_counter()
+        for features in traffic:
+            _linear_match(compiled, features)
+        linear = (time.perf_counter() - start) / packets * 1e6
+
+        print(f"{count:>8} {indexed:>15.2f} {linear:>15.2f}")
+
+
+_TOKEN_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789/_-.'
+
+
+def _random_token(rng, low, high):
+    return ''.join(rng.choice(_TOKEN_CHARS) for _ in range(rng.randint(low, high)))
+
+
+def _random_payloads(count, size, signatures, rng):
+    """
+    Generates HTTP-like payloads; about 1 in 100 contains one of the signatures.
+    """
+    payloads = []
+    for _ in range(count):
+        text = (f"GET /{_random_token(rng, 4, 30)}?{_random_token(rng, 2, 8)}={_random_token(rng, 2, 20)} "
+                f"HTTP/1.1\r\nHost: {_random_token(rng, 5, 15)}.example\r\nUser-Agent: Mozilla/5.0\r\n")
+        while len(text) < size:
+            text += f"X-{_random_token(rng, 3, 10)}: {_random_token(rng, 5, 40)}\r\n"
+        payload = text[:size].encode()
+        if signatures and rng.random() < 0.01:
+            signature = rng.choice(signatures).pattern
+            position = rng.randint(0, size - len(signature))
+            payload = payload[:position] + signature + payload[position + len(signature):]
+        payloads.append(payload)
+    return payloads
+
+
+def bench_payload(signature_counts, packets, payload_size, seed=1):
+    """
+    Compares per-packet cost of Aho-Corasick payload matching against
+    searching for each signature separately.
+
+    :param signature_counts: Signature set sizes to measure.
+    :param packets: Number of payloads scanned per measurement.
+    :param payload_size: Bytes per payload.
+    """
+    rng = random.Random(seed)
+    print(f"{'signatures':>10} {'mode':>10} {'states':>8} {'build ms':>9} {'matcher us/pkt':>15} "
+          f"{'per-signature us/pkt':>21} {'matches':>8}")
+    for count in signature_counts:
+        signatures = [PayloadPattern(f'sig_{i}', _random_token(rng, 8, 20).encode(), nocase=i % 4 == 0)
+                      for i in range(count)]
+        payloads = _random_payloads(packets, payload_size, signatures, rng)
+
+        start = time.perf_counter()
+        matcher = PayloadMatcher(signatures)
+        build = (time.perf_counter() - start) * 1000
+
+        matches = 0
+        start = time.perf_counter()
+        for payload in payloads:
+            matches += len(matcher.scan(payload))
+        scanned = (time.perf_counter() - start) / packets * 1e6
+
+        # Reference: one bytes.find per signature (on a lowercased copy for nocase ones)
+        exact = [s.pattern for s in signatures if not s.nocase]
+        nocase = [s.pattern.lower() for s in signatures if s.nocase]
+        sample = payloads[:max(1, packets // 10)]
+        start = time.perf_counter()
+        for payload in sample:
+            lowered = payload.lower()
+            [pattern for pattern in exact if payload.find(pattern) >= 0]
+            [pattern for pattern in nocase if lowered.find(pattern) >= 0]
+        separate = (time.perf_counter() - start) / len(sample) * 1e6
+
+        states = sum(len(automaton) for automaton in matcher.automata)
+        mode = 'automaton' if matcher.automata else 'find'
+        print(f"{count:>10} {mode:>10} {states:>8} {build:>9.1f} {scanned:>15.1f} {separate:>21.1f} {matches:>8}")
+
+
+def _quiet_detection_logs():
+    logging.basicConfig(level=logging.WARNING)
+    for name in ('detection_engine', 'scan_detector', 'traffic_analyzer'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def bench_alerts(alerts, seed=1):
+    """
+    Compares sustained alert throughput of the logging file handler against
+    the buffered JSONL alert writer.
+
+    :param alerts: Number of distinct (never suppressed) alerts to generate.
+    :param seed: Random seed for reproducible alerts.
+    """
+    from alert import AlertSystem
+
+    rng = random.Random(seed)
+    threats = [({'type': 'signature', 'rule': f'rule_{i % 100}', 'confidence': rng.random()},
+                {'source_ip': f'192.168.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+                 'destination_ip': f'10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}'})
+               for i in range(alerts)]
+    alert_logger = logging.getLogger("IDS_Alerts")
+    alert_logger.propagate = False
+
+    print(f"{'sink':>12} {'caller alerts/sec':>18} {'total alerts/sec':>17} {'bytes':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for sink in ('log file', 'jsonl'):
+            directory = os.path.join(tmp, sink.replace(' ', '_'))
+            os.makedirs(directory)
+            alert_system = AlertSystem(log_file=os.path.join(directory, 'ids_alerts.log'),
+                                       suppression_window=0,
+                                       alert_dir=directory if sink == 'jsonl' else None)
+            start = time.perf_counter()
+            for threat, packet_info in threats:
+                alert_system.generate_alert(threat, packet_info)
+            caller = time.perf_counter() - start
+            alert_system.close()
+            total = time.perf_counter() - start
+
+            for handler in list(alert_logger.handlers):
+                handler.close()
+                alert_logger.removeHandler(handler)
+            size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+            print(f"{sink:>12} {alerts / caller:>18.0f} {alerts / total:>17.0f} {size:>12}")
+
+
+SUITE_STAGES = ('analyzer', 'detection', 'alerts', 'pipeline')
+
+
+def _timed(items, func, histogram):
+    """Calls func on every item, recording per-call latency; returns the wall time."""
+    clock = time.perf_counter_ns
+    start = time.perf_counter()
+    for item in items:
+        started = clock()
+        func(item)
+        histogram.record(clock() - started)
+    return time.perf_counter() - start
+
+
+def run_suite_stage(scenario, stage, packets, seed=1):
+    """
+    Runs one pipeline stage on one generated scenario in this process.
+
+    The 'pipeline' stage replays the scenario through the whole IDS (decoding
+    on the replay thread, the capture ring, analysis, detection and alerting),
+    timed until the last packet is processed.
+
+    :return: Dictionary with pps, p50/p99 per-packet latency (us) and peak RSS (MB).
+    """
+    from traffic_generator import generate, write_pcap
+    from packet_decoder import decode
+    from metrics import Histogram
+    from traffic_analyzer import TrafficAnalyzer
+    from detection_engine import DetectionEngine
+    from alert import AlertSystem
+
+    frames = list(generate(scenario, packets, seed))
+    histogram = Histogram('latency', 'per-packet latency')
+
+    if stage == 'pipeline':
+        from IDS_detection import IntrusionDetectionSystem
+        write_pcap('bench.pcap', frames)
+        del frames
+        ids = IntrusionDetectionSystem(pcap_file='bench.pcap', fast_decode=True, metrics=True,
+                                       metrics_interval=3600)
+        ids.start()
+        histogram = ids.metrics.metrics['ids_packet_seconds']
+        count, elapsed = ids.packets_processed, ids.elapsed
+    else:
+        _quiet_detection_logs()
+        logging.getLogger("IDS_Alerts").propagate = False
+        records = [decode(frame, timestamp) for timestamp, frame in frames]
+        del frames
+        analyzer = TrafficAnalyzer()
+        if stage == 'analyzer':
+            count = len(records)
+            elapsed = _timed(records, analyzer.analyze_packet, histogram)
+        else:
+            features = [f for f in map(analyzer.analyze_packet, records) if f]
+            engine = DetectionEngine()
+            if stage == 'detection':
+                count = len(features)
+                elapsed = _timed(features, engine.detect_threats, histogram)
+            elif stage == 'alerts':
+                alert_system = AlertSystem(log_file='ids_alerts.log')
+                work = [(threat, {'source_ip': f['src_ip'], 'destination_ip': f['dst_ip']})
+                        for f in features for threat in engine.detect_threats(f)]
+                count = len(work)
+                elapsed = _timed(work, lambda item: alert_system.generate_alert(*item), histogram)
+                alert_system.close()
+            else:
+                raise ValueError(f"Unknown stage '{stage}', expected one of {SUITE_STAGES}")
+
+    return {
+        'packets': count,
+        'pps': count / elapsed if elapsed > 0 else 0.0,
+        'p50_us': histogram.quantile(0.5) / 1000,
+        'p99_us': histogram.quantile(0.99) / 1000,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def bench_suite(scenarios, stages, packets, seed=1, baseline=None, save_baseline=None, tolerance=0.15):
+    """
+    Runs every stage on every scenario, each in a fresh process so peak RSS is
+    per run, and optionally compares against a stored baseline.
+
+    :param baseline: JSON file from an earlier --save-baseline run to compare against.
+    :param save_baseline: JSON file to store this run's results in.
+    :param tolerance: Relative pps drop or peak RSS growth reported as a regression.
+    :return: Number of regressions against the baseline.
+    """
+    reference = {}
+    if baseline:
+        with open(baseline) as f:
+            stored = json.load(f)
+        if stored['packets'] != packets or stored['seed'] != seed:
+            print(f"Warning: baseline was recorded with {stored['packets']} packets, seed {stored['seed']}")
+        reference = stored['results']
+
+    results = {}
+    regressions = 0
+    print(f"{'scenario':>16} {'stage':>10} {'packets/sec':>12} {'p50 us':>8} {'p99 us':>8} {'peak MB':>8}  vs baseline")
+    with tempfile.TemporaryDirectory() as tmp:
+        for scenario in scenarios:
+            for stage in stages:
+                run = subprocess.run([sys.executable, os.path.abspath(__file__), 'suite-run', scenario, stage,
+                                      '--packets', str(packets), '--seed', str(seed)],
+                                     cwd=tmp, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+                if run.returncode:
+                    print(f"{scenario:>16} {stage:>10} failed (exit code {run.returncode})")
+                    regressions += 1
+                    continue
+                result = json.loads(run.stdout.strip().splitlines()[-1])
+                key = f"{scenario}/{stage}"
+                results[key] = result
+
+                comparison = ""
+                base = reference.get(key)
+                if base:
+                    pps_change = result['pps'] / base['pps'] - 1 if base['pps'] else 0.0
+                    rss_change = result['peak_rss_mb'] / base['peak_rss_mb'] - 1
+                    p99_change = result['p99_us'] / base['p99_us'] - 1 if base['p99_us'] else 0.0
+                    comparison = f"pps {pps_change:+.1%}, p99 {p99_change:+.1%}, rss {rss_change:+.1%}"
+                    if pps_change < -tolerance or rss_change > tolerance:
+                        comparison += "  REGRESSION"
+                        regressions += 1
+                print(f"{scenario:>16} {stage:>10} {result['pps']:>12.0f} {result['p50_us']:>8.1f} "
+                      f"{result['p99_us']:>8.1f} {result['peak_rss_mb']:>8.1f}  {comparison}")
+
+    if save_baseline:
+        with open(save_baseline, 'w') as f:
+            json.dump({'packets': packets, 'seed': seed, 'python': sys.version.split()[0],
+                       'results': results}, f, indent=2)
+        print(f"Saved baseline to {save_baseline}")
+    if baseline:
+        print(f"{regressions} regression(s) beyond {tolerance:.0%}")
+    return regressions
+
+
+# Runs in a fresh interpreter: times the IDS import and the first packet reaching
+# the analyzer, measured on the system-wide monotonic clock from process launch
+_STARTUP_PROBE = '''
+import json, resource, sys, time
+launched = float(sys.argv[1])
+started = time.monotonic()
+import IDS_detection
+imported = time.monotonic()
+import traffic_analyzer
+analyze = traffic_analyzer.TrafficAnalyzer.analyze_packet
+first = []
+def first_packet(self, packet):
+    if not first:
+        first.append(time.monotonic())
+    return analyze(self, packet)
+traffic_analyzer.TrafficAnalyzer.analyze_packet = first_packet
+IDS_detection.IntrusionDetectionSystem(pcap_file=sys.argv[2], fast_decode=sys.argv[3] == 'fast').start()
+print(json.dumps({
+    'interpreter_ms': (started - launched) * 1000,
+    'import_ms': (imported - started) * 1000,
+    'first_packet_ms': (first[0] - launched) * 1000,
+    'scapy_modules': sum(1 for name in sys.modules if name.split('.')[0] == 'scapy'),
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+}))
+'''
+
+
+def bench_startup(runs, packets=100):
+    """
+    Measures cold start, from process launch to the first processed packet,
+    for fast-decode and Scapy-dissected pcap replay (median of several runs).
+    """
+    from traffic_generator import generate, write_pcap
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                       env.get('PYTHONPATH')]))
+    print(f"{'mode':>8} {'interpreter ms':>15} {'import ms':>10} {'first packet ms':>16} "
+          f"{'scapy modules':>14} {'peak MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        write_pcap(os.path.join(tmp, 'startup.pcap'), generate('web', packets))
+        for mode in ('fast', 'scapy'):
+            results = []
+            for _ in range(runs):
+                launched = time.monotonic()
+                run = subprocess.run([sys.executable, '-c', _STARTUP_PROBE, repr(launched), 'startup.pcap', mode],
+                                     cwd=tmp, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     text=True, check=True)
+                results.append(json.loads(run.stdout.strip().splitlines()[-1]))
+            results.sort(key=lambda result: result['first_packet_ms'])
+            median = results[len(results) // 2]
+            print(f"{mode:>8} {median['interpreter_ms']:>15.1f} {median['import_ms']:>10.1f} "
+                  f"{median['first_packet_ms']:>16.1f} {median['scapy_modules']:>14} {median['peak_rss_mb']:>8.1f}")
+
+
+def bench_checkpoint(flow_counts, lookups, seed=1):
+    """
+    Measures checkpoint write time and size, the time to open a checkpoint
+    for a warm restart, and the cost of restoring flows from it on first
+    packet (flows in the checkpoint) or ruling them out (new flows).
+
+    :param flow_counts: Flow table sizes to measure.
+    :param lookups: Number of hit and of miss lookups per measurement.
+    """
+    from checkpoint import FlowCheckpoint, write_checkpoint
+    from traffic_analyzer import TrafficAnalyzer
+    from flow_table import FlowRecord
+    from rate_counter import RateCounter
+
+    rng = random.Random(seed)
+    print(f"{'flows':>9} {'write ms':>9} {'size MB':>8} {'open ms':>8} {'hit us':>7} {'miss us':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'flows.ckpt')
+        for count in flow_counts:
+            analyzer = TrafficAnalyzer(max_flows=count)
+            flows = analyzer.flow_stats.flows
+            for i in range(count):
+                key = (f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", f"192.168.{rng.randrange(256)}.1",
+                       rng.randrange(1024, 65536), rng.choice((22, 80, 443)), 6)
+                flow = FlowRecord(key, 1000.0 + i / count)
+                flow.packet_count = rng.randrange(1, 100)
+                flow.byte_count = flow.packet_count * 500
+                flow.rates = RateCounter()
+                flow.rates.update(flow.last_time, 500)
+                flows[key] = flow
+
+            start = time.perf_counter()
+            write_checkpoint(path, analyzer)
+            written = (time.perf_counter() - start) * 1000
+            size = os.path.getsize(path) / 1e6
+            keys = list(flows)
+            del analyzer, flows
+
+            start = time.perf_counter()
+            checkpoint = FlowCheckpoint(path, now=1001.0)
+            opened = (time.perf_counter() - start) * 1000
+
+            sample = rng.sample(keys, min(lookups, count))
+            start = time.perf_counter()
+            restored = sum(1 for key in sample if checkpoint.lookup(key, 1001.0) is not None)
+            hit = (time.perf_counter() - start) / len(sample) * 1e6
+            assert restored == len(sample)
+
+            misses = [("172.16.0.1", "192.168.0.1", port, 80, 6) for port in range(lookups)]
+            start = time.perf_counter()
+            for key in misses:
+                checkpoint.lookup(key, 1001.0)
+            miss = (time.perf_counter() - start) / len(misses) * 1e6
+            checkpoint.close()
+            print(f"{count:>9} {written:>9.0f} {size:>8.1f} {opened:>8.2f} {hit:>7.1f} {miss:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IDS microbenchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    rules_parser = subparsers.add_parser("rules", help="Indexed vs linear signature rule evaluation")
+    rules_parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    rules_parser.add_argument("--packets", type=int, default=20000)
+
+    alerts_parser = subparsers.add_parser("alerts", help="Logging file handler vs buffered JSONL alert writer")
+    alerts_parser.add_argument("--alerts", type=int, default=100000)
+
+    payload_parser = subparsers.add_parser("payload", help="Aho-Corasick vs per-signature payload matching")
+    payload_parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    payload_parser.add_argument("--packets", type=int, default=2000)
+    payload_parser.add_argument("--payload-size", type=int, default=512)
+
+    suite_parser = subparsers.add_parser("suite", help="Per-stage and end-to-end benchmarks on generated traffic")
+    suite_parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    suite_parser.add_argument("--stages", nargs="+", default=list(SUITE_STAGES), choices=SUITE_STAGES)
+    suite_parser.add_argument("--packets", type=int, default=50000)
+    suite_parser.add_argument("--seed", type=int, default=1)
+    suite_parser.add_argument("--baseline", help="Compare against results saved with --save-baseline")
+    suite_parser.add_argument("--save-baseline", help="Save the results to this JSON file")
+    suite_parser.add_argument("--tolerance", type=float, default=0.15,
+                              help="Relative pps drop or peak RSS growth counted as a regression")
+
+    startup_parser = subparsers.add_parser("startup", help="Cold start time to the first processed packet")
+    startup_parser.add_argument("--runs", type=int, default=5)
+
+    checkpoint_parser = subparsers.add_parser("checkpoint", help="Flow checkpoint write, open and restore cost")
+    checkpoint_parser.add_argument("--flows", type=int, nargs="+", default=[100000, 1000000])
+    checkpoint_parser.add_argument("--lookups", type=int, default=20000)
+
+    # Internal: one suite stage in a fresh process, result printed as JSON
+    run_parser = subparsers.add_parser("suite-run")
+    run_parser.add_argument("scenario", choices=SCENARIOS)
+    run_parser.add_argument("stage", choices=SUITE_STAGES)
+    run_parser.add_argument("--packets", type=int, default=50000)
+    run_parser.add_argument("--seed", type=int, default=1)
+
+    args = parser.parse_args()
+    if args.benchmark == "rules":
+        bench_rules(args.counts, args.packets)
+    elif args.benchmark == "alerts":
+        bench_alerts(args.alerts)
+    elif args.benchmark == "payload":
+        bench_payload(args.counts, args.packets, args.payload_size)
+    elif args.benchmark == "suite":
+        regressions = bench_suite(args.scenarios, args.stages, args.packets, args.seed,
+                                  args.baseline, args.save_baseline, args.tolerance)
+        sys.exit(1 if regressions else 0)
+    elif args.benchmark == "startup":
+        bench_startup(args.runs)
+    elif args.benchmark == "checkpoint":
+        bench_checkpoint(args.flows, args.lookups)
+    elif args.benchmark == "suite-run":
+        print(json.dumps(run_suite_stage(args.scenario, args.stage, args.packets, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+from flow_table import FlowRecord, EXPIRED_IDLE
+from rate_counter import RateCounter, RATE_WINDOWS
+from ids_store import ip_key
+import threading
+import logging
+import socket
+import struct
+import mmap
+import json
+import math
+import time
+import zlib
+import os
+
+# File layout (little-endian):
+#   header
+#   flow records, sorted by their 37-byte key (src, dst as 16-byte addresses, ports, protocol)
+#   flow key filter: one bit per hashed key, so most new flows skip the binary search
+#   source host records, destination host records (least recently seen first)
+#   JSON detector state (learned baselines, table counters)
+MAGIC = b'IDSCKPT1'
+VERSION = 2
+
+_HEADER = struct.Struct('<8sIIddQQQQQ')
+_KEY = struct.Struct('>16s16sHHB')
+_FLOW = struct.Struct('<%dsQQdd%dd' % (_KEY.size, 1 + 2 * len(RATE_WINDOWS)))
+_HOST = struct.Struct('<16s%dd' % (1 + 2 * len(RATE_WINDOWS)))
+
+_IPV4_MAPPED = b'\x00' * 10 + b'\xff\xff'
+
+# Host rates decay by exp(-age / window); after five of the longest windows they are ~0
+HOST_MAX_AGE = 5 * max(RATE_WINDOWS)
+
+
+def _ip_text(key):
+    if key[:12] == _IPV4_MAPPED:
+        return socket.inet_ntoa(key[12:])
+    return socket.inet_ntop(socket.AF_INET6, key)
+
+
+def flow_key_bytes(key):
+    """
+    Encodes a flow key (src, dst, sport, dport, protocol) as the 37-byte checkpoint key.
+
+    :return: The key bytes, or None if the addresses are not IP addresses.
+    """
+    src, dst = ip_key(key[0]), ip_key(key[1])
+    if src is None or dst is None:
+        return None
+    return _KEY.pack(src, dst, key[2], key[3], key[4])
+
+
+def flow_key_from_bytes(key_bytes):
+    """
+    Decodes a 37-byte checkpoint key back into a flow key tuple.
+    """
+    src, dst, sport, dport, protocol = _KEY.unpack(key_bytes)
+    return _ip_text(src), _ip_text(dst), sport, dport, protocol
+
+
+def _rate_fields(counter):
+    if counter is None:
+        return (math.nan,) + (0.0,) * (2 * len(RATE_WINDOWS))
+    last_time = counter.last_time if counter.last_time is not None else math.nan
+    return (last_time, *counter.packets, *counter.bytes)
+
+
+def _rate_counter(fields):
+    counter = RateCounter()
+    if not math.isnan(fields[0]):
+        counter.last_time = fields[0]
+    count = len(RATE_WINDOWS)
+    counter.packets = list(fields[1:1 + count])
+    counter.bytes = list(fields[1 + count:1 + 2 * count])
+    return counter
+
+
+def write_checkpoint(path, analyzer, detection_engine=None):
+    """
+    Writes a checkpoint of the analyzer's flow table and host rates, and the
+    detection engine's learned baselines (atomically, via a temporary file).
+
+    The analyzer lock is only held to copy the table references; records are
+    encoded afterwards, so the packet thread is never blocked for long.
+
+    Every call rewrites the whole file (about 1.8s per million flows); there
+    are no incremental snapshots, so the interval should grow with the table.
+
+    :param path: Checkpoint file.
+    :param analyzer: TrafficAnalyzer to checkpoint.
+    :param detection_engine: Optional DetectionEngine whose adaptive baselines are included.
+    :return: Number of flows written.
+    """
+    with analyzer.lock:
+        flows = list(analyzer.flow_stats.flows.values())
+        src_hosts = list(analyzer.src_rates.counters.items())
+        dst_hosts = list(analyzer.dst_rates.counters.items())
+        packet_time = flows[-1].last_time if flows else 0.0
+        counters = analyzer.flow_stats.stats()
+    wall_time = time.time()
+
+    pack_flow = _FLOW.pack
+    records = []
+    for flow in flows:
+        key = flow_key_bytes(flow.key)
+        if key is not None:
+            records.append(pack_flow(key, flow.packet_count, flow.byte_count, flow.start_time,
+                                     flow.last_time, *_rate_fields(flow.rates)))
+    records.sort()
+
+    # One filter bit per flow (about 12% false positives)
+    filter_bits = max(64, len(records) * 8)
+    key_filter = bytearray(filter_bits // 8)
+    for record in records:
+        bit = zlib.crc32(record[:_KEY.size]) % filter_bits
+        key_filter[bit >> 3] |= 1 << (bit & 7)
+
+    def host_records(hosts):
+        packed = []
+        for host, counter in hosts:
+            key = ip_key(host)
+            if key is not None:
+                packed.append(_HOST.pack(key, *_rate_fields(counter)))
+        return packed
+
+    src_records = host_records(src_hosts)
+    dst_records = host_records(dst_hosts)
+
+    state = {'flow_table': counters}
+    adaptive = detection_engine.adaptive_baselines if detection_engine else None
+    if adaptive:
+        state['baselines'] = adaptive.state()
+    state = json.dumps(state).encode()
+
+    header = _HEADER.pack(MAGIC, VERSION, len(RATE_WINDOWS), packet_time, wall_time, len(records),
+                          filter_bits, len(src_records), len(dst_records), len(state))
+    with open(path + '.tmp', 'wb') as f:
+        f.write(header)
+        f.writelines(records)
+        f.write(key_filter)
+        f.writelines(src_records)
+        f.writelines(dst_records)
+        f.write(state)
+    os.replace(path + '.tmp', path)
+    return len(records)
+
+
+class FlowCheckpoint:
+    def __init__(self, path, idle_timeout=15.0, now=None):
+        """
+        Opens a checkpoint written by write_checkpoint for a warm restart.
+
+        The file is memory-mapped and flows are not loaded up front: a flow is
+        restored the first time a packet of it arrives, by a filter check and a
+        binary search over the sorted records. Opening therefore takes the
+        same time for any number of flows. Flows that would have gone idle by
+        now are not restored, and the file is released once every flow in it
+        would have.
+
+        Flows in the checkpoint are only exported (to the flow table's expiry
+        callback) by the run that restores it: restored flows when they end,
+        flows that went stale or were never seen again as idle when they are
+        looked up or the checkpoint is closed. Each flow is thus exported once,
+        with its counts across the restart.
+
+        :param path: Checkpoint file.
+        :param idle_timeout: Idle timeout of the flow table the flows are restored into.
+        :param now: Current time in the packet clock (default: the snapshot's packet
+                    time plus the wall time elapsed since it was written).
+        :raises ValueError: If the file is not a compatible checkpoint.
+        """
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.logger = logging.getLogger(__name__)
+        self.flow_table = None
+        self.on_expire = None
+        self.lock = threading.Lock()
+
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < _HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not an IDS checkpoint")
+        (magic, version, windows, self.packet_time, self.wall_time, self.flow_count, self.filter_bits,
+         src_count, dst_count, state_length) = _HEADER.unpack_from(self.mm)
+        expected = (_HEADER.size + self.flow_count * _FLOW.size + self.filter_bits // 8 +
+                    (src_count + dst_count) * _HOST.size + state_length)
+        if magic != MAGIC or version != VERSION or windows != len(RATE_WINDOWS) or len(self.mm) != expected:
+            self.close()
+            raise ValueError(f"{path} is not a compatible IDS checkpoint")
+
+        self.now = now if now is not None else self.packet_time + max(0.0, time.time() - self.wall_time)
+        # Every flow in the file is idle after this time
+        self.expires_at = self.packet_time + idle_timeout
+
+        self.flow_offset = _HEADER.size
+        self.filter_offset = self.flow_offset + self.flow_count * _FLOW.size
+        self.hosts_offset = self.filter_offset + self.filter_bits // 8
+        self.src_count = src_count
+        self.dst_count = dst_count
+        state_offset = self.hosts_offset + (src_count + dst_count) * _HOST.size
+        self.state = json.loads(self.mm[state_offset:state_offset + state_length])
+
+        self.restored = bytearray((self.flow_count + 7) // 8)  # Records already handed out
+        self.restored_flows = 0
+        self.stale_flows = 0
+        self.expired_flows = 0
+        self.aged_out = False
+
+    def attach(self, flow_table):
+        """
+        Makes the flow table restore flows it does not have from this checkpoint,
+        until they have all aged out. Flows that are not restored are passed to
+        the table's expiry callback.
+        """
+        self.flow_table = flow_table
+        self.on_expire = flow_table.on_expire
+        flow_table.restore = self.lookup
+
+    def restore_hosts(self, analyzer):
+        """
+        Loads the source and destination host rates into the analyzer, skipping
+        hosts whose rates have decayed to nothing.
+
+        :return: Number of hosts restored.
+        """
+        restored = 0
+        offset = self.hosts_offset
+        for table, count in ((analyzer.src_rates, self.src_count), (analyzer.dst_rates, self.dst_count)):
+            end = offset + count * _HOST.size
+            for fields in _HOST.iter_unpack(self.mm[offset:end]):
+                if not fields[1] >= self.now - HOST_MAX_AGE:  # Also skips NaN
+                    continue
+                if len(table.counters) >= table.max_hosts:
+                    table.counters.popitem(last=False)
+                table.counters[_ip_text(fields[0])] = _rate_counter(fields[1:])
+                restored += 1
+            offset = end
+        return restored
+
+    def restore_detector_state(self, detection_engine):
+        """
+        Loads the learned baselines into the detection engine, if both have them.
+        """
+        adaptive = detection_engine.adaptive_baselines
+        if adaptive and 'baselines' in self.state:
+            adaptive.restore(self.state['baselines'], self.path)
+
+    def lookup(self, key, timestamp):
+        """
+        Returns the checkpointed FlowRecord of a flow the flow table does not
+        have, or None. Each record is handed out at most once.
+
+        :param key: Flow key.
+        :param timestamp: Timestamp of the packet that is looking the flow up.
+        """
+        if self.mm is None or self.aged_out:
+            return None
+        if timestamp > self.expires_at:
+            self.aged_out = True
+            self.logger.info(f"Checkpoint {self.path} fully aged out: {self.restored_flows} flows restored, "
+                             f"{self.stale_flows} stale")
+            # Expiring the flows never seen again scans the file, so it is left to a thread
+            threading.Thread(target=self.close, daemon=True).start()
+            return None
+
+        key_bytes = flow_key_bytes(key)
+        if key_bytes is None:
+            return None
+        bit = zlib.crc32(key_bytes) % self.filter_bits
+        mm = self.mm
+        if not mm[self.filter_offset + (bit >> 3)] & (1 << (bit & 7)):
+            return None
+
+        # Binary search over the sorted records
+        size = _FLOW.size
+        key_size = _KEY.size
+        base = self.flow_offset
+        low, high = 0, self.flow_count
+        while low < high:
+            middle = (low + high) >> 1
+            start = base + middle * size
+            found = mm[start:start + key_size]
+            if found < key_bytes:
+                low = middle + 1
+            elif found > key_bytes:
+                high = middle
+            else:
+                return self._take(middle, key, timestamp)
+        return None
+
+    def _take(self, index, key, timestamp):
+        if self.restored[index >> 3] & (1 << (index & 7)):
+            return None
+        self.restored[index >> 3] |= 1 << (index & 7)
+
+        fields = _FLOW.unpack_from(self.mm, self.flow_offset + index * _FLOW.size)
+        flow = self._flow(key, fields)
+        if timestamp - flow.last_time > self.idle_timeout:
+            # Went idle while the IDS was down: export it as the table would have
+            self.stale_flows += 1
+            if self.on_expire:
+                self.on_expire(flow, EXPIRED_IDLE)
+            return None
+        self.restored_flows += 1
+        return flow
+
+    @staticmethod
+    def _flow(key, fields):
+        _, packet_count, byte_count, start_time, last_time = fields[:5]
+        flow = FlowRecord(key, start_time)
+        flow.packet_count = packet_count
+        flow.byte_count = byte_count
+        flow.last_time = last_time
+        flow.rates = _rate_counter(fields[5:])
+        return flow
+
+    def _expire_remaining(self):
+        """Exports the flows that were never looked up as idle."""
+        restored = self.restored
+        unpack_from = _FLOW.unpack_from
+        for index in range(self.flow_count):
+            if restored[index >> 3] & (1 << (index & 7)):
+                continue
+            fields = unpack_from(self.mm, self.flow_offset + index * _FLOW.size)
+            self.on_expire(self._flow(flow_key_from_bytes(fields[0]), fields), EXPIRED_IDLE)
+            self.expired_flows += 1
+
+    def stats(self):
+        """
+        Returns the number of flows in the checkpoint, restored and found stale.
+        """
+        return {
+            'flows': self.flow_count,
+            'restored': self.restored_flows,
+            'stale': self.stale_flows,
+            'expired': self.expired_flows,
+            'open': self.mm is not None
+        }
+
+    def close(self):
+        """
+        Stops restoring flows, exports the ones never restored and releases the file.
+        """
+        with self.lock:
+            if self.flow_table is not None:
+                self.flow_table.restore = None
+                self.flow_table = None
+            if self.mm is not None:
+                if self.on_expire:
+                    self._expire_remaining()
+                self.mm.close()
+                self.mm = None
+
+
+class Checkpointer:
+    def __init__(self, path, analyzer, detection_engine=None, interval=60.0):
+        """
+        Periodically checkpoints the analyzer and detection state from a
+        background thread.
+
+        :param path: Checkpoint file.
+        :param analyzer: TrafficAnalyzer to checkpoint.
+        :param detection_engine: Optional DetectionEngine whose learned baselines are included.
+        :param interval: Seconds between checkpoints.
+        """
+        self.path = path
+        self.analyzer = analyzer
+        self.detection_engine = detection_engine
+        self.interval = interval
+        self.checkpoints = 0
+        self.last_duration = 0.0
+        self.last_flows = 0
+        self.source = None  # FlowCheckpoint restored from
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def restore(self):
+        """
+        Restores host rates and learned baselines from the checkpoint file, if
+        it exists, and attaches it to the flow table for lazy flow restores.
+
+        :return: The FlowCheckpoint, or None if there is nothing to restore.
+        """
+        if not os.path.exists(self.path):
+            return None
+        started = time.perf_counter()
+        try:
+            checkpoint = FlowCheckpoint(self.path, self.analyzer.flow_stats.idle_timeout)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Ignoring checkpoint {self.path}: {e}")
+            return None
+        hosts = checkpoint.restore_hosts(self.analyzer)
+        if self.detection_engine:
+            checkpoint.restore_detector_state(self.detection_engine)
+        checkpoint.attach(self.analyzer.flow_stats)
+        self.source = checkpoint
+        self.logger.info(f"Restored checkpoint {self.path} in {(time.perf_counter() - started) * 1000:.1f}ms: "
+                         f"{checkpoint.flow_count} flows (restored on first packet), {hosts} hosts, "
+                         f"snapshot {checkpoint.now - checkpoint.packet_time:.0f}s old")
+        return checkpoint
+
+    def checkpoint(self):
+        """
+        Writes one checkpoint now.
+        """
+        with self.lock:
+            started = time.perf_counter()
+            self.last_flows = write_checkpoint(self.path, self.analyzer, self.detection_engine)
+            self.last_duration = time.perf_counter() - started
+            self.checkpoints += 1
+        self.logger.debug(f"Checkpointed {self.last_flows} flows in {self.last_duration * 1000:.0f}ms")
+
+    def start(self):
+        """
+        Starts checkpointing every interval seconds.
+        """
+        def run():
+            while not self.stop_event.wait(self.interval):
+                try:
+                    self.checkpoint()
+                except Exception as e:
+                    self.logger.error(f"Checkpoint to {self.path} failed: {e}")
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def stop(self, final=True):
+        """
+        Stops the checkpoint thread, writing a last checkpoint if final is set.
+        """
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        if self.source is not None:
+            self.logger.info(f"Restored from checkpoint: {self.source.stats()}")
+            self.source.close()
+        if final:
+            self.checkpoint()
+            self.logger.info(f"Checkpointed {self.last_flows} flows to {self.path} "
+                             f"in {self.last_duration * 1000:.0f}ms")
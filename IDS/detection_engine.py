@@ -1,17 +1,52 @@
 from collections import defaultdict
+from scan_detector import ScanDetector
+from rule_compiler import RuleSet, load_rule_file, load_config
+from rule_watcher import RuleWatcher
+from adaptive_baseline import AdaptiveBaselines
+import threading
 import logging
+import time
 
 class DetectionEngine:
-    def __init__(self):
+    def __init__(self, rule_file=None, baseline_mode=None, baseline_file=None):
         """
         Initializes the DetectionEngine with signature rules and normal baseline values.
+
+        :param rule_file: Optional JSON/YAML file with declarative signature rules.
+        :param baseline_mode: Optional 'learn', 'detect' or 'adaptive' to score anomalies against
+                              baselines learned per destination service instead of the static
+                              normal_baselines (see AdaptiveBaselines).
+        :param baseline_file: Optional file the learned baselines are loaded from and saved to.
         """
         self.signature_rules = self.load_signature_rules()
+        self.rule_definitions = load_rule_file(rule_file) if rule_file else []
+        self.rule_set = RuleSet(self.rule_definitions, self.signature_rules)
         self.normal_baselines = {
             'max_packet_size': 1500,  # Example baseline values
             'max_packet_rate': 100,
             'max_byte_rate': 100000
         }
+        self.adaptive_baselines = AdaptiveBaselines(baseline_mode, path=baseline_file) if baseline_mode else None
+
+        # Hot reload state: a new rule set is staged by the watcher thread and
+        # swapped in by the packet thread before the next packet
+        self.rule_set_version = 1
+        self.pending_reload = None
+        self.reload_lock = threading.Lock()
+        self.rule_watcher = None
+        self.reload_info = {
+            'version': self.rule_set_version,
+            'source': rule_file,
+            'rules': len(self.rule_set),
+            'activated_at': time.time(),
+            'compile_seconds': 0.0,
+            'reload_latency': 0.0,
+            'rejected': 0,
+            'last_error': None
+        }
+
+        # Sketch-based fan-out and half-open tracking with fixed memory
+        self.scan_detector = ScanDetector()
         
         # Set up logging for detected threats
         logging.basicConfig(level=logging.INFO)
@@ -20,19 +55,42 @@ class DetectionEngine:
     def load_signature_rules(self):
         """
         Loads the predefined signature-based rules for detecting attacks.
+        Rules naming a protocol are only evaluated for packets of that protocol.
         """
         return {
             'syn_flood': {
+                'protocol': 'tcp',
                 'condition': lambda features: (
                     features['tcp_flags'] == 2 and  # SYN flag
-                    features['packet_rate'] > 100
+                    features['dst_pkt_rate_1s'] > 100
                 )
             },
             'port_scan': {
+                'protocol': ['tcp', 'udp'],
                 'condition': lambda features: (
                     features['packet_size'] < 100 and
-                    features['packet_rate'] > 50
+                    features['src_pkt_rate_1s'] > 50
                 )
+            },
+            'dns_amplification': {
+                'protocol': 'udp',
+                'condition': lambda features: (
+                    features['src_port'] == 53 and
+                    features['payload_size'] > 512 and  # Larger than a plain DNS response
+                    features['dst_udp_byte_rate_1s'] > 1000000
+                )
+            },
+            'ntp_amplification': {
+                'protocol': 'udp',
+                'condition': lambda features: (
+                    features['src_port'] == 123 and
+                    features['payload_size'] > 200 and  # Time responses are 48 bytes, monlist replies 440
+                    features['dst_udp_pkt_rate_1s'] > 100
+                )
+            },
+            'icmp_flood': {
+                'protocol': ['icmp', 'icmpv6'],
+                'condition': lambda features: features['dst_icmp_pkt_rate_1s'] > 100
             }
         }
 
@@ -43,18 +101,31 @@ class DetectionEngine:
         :param features: Dictionary containing packet features.
         :return: List of detected threats.
         """
+        if self.pending_reload is not None:
+            self.apply_pending_reload()
+
         threats = []
 
-        # Signature-based detection (matches known patterns)
-        for rule_name, rule in self.signature_rules.items():
-            if rule['condition'](features):
-                threat = {
-                    'type': 'signature',
-                    'rule': rule_name,
-                    'confidence': 1.0
-                }
+        # Signature-based detection (only the indexed candidate rules are evaluated)
+        for rule in self.rule_set.match(features):
+            threat = {
+                'type': 'signature',
+                'rule': rule.rule_id,
+                'confidence': rule.confidence
+            }
+            threats.append(threat)
+            self.logger.debug(f"Threat detected: {rule.rule_id} (Signature-based)")
+
+        # Sketch-based scan and SYN flood detection
+        threats.extend(self.scan_detector.inspect(features))
+
+        # Anomaly detection against learned baselines
+        if self.adaptive_baselines:
+            threat = self.adaptive_baselines.inspect(features)
+            if threat:
                 threats.append(threat)
-                self.logger.info(f"Threat detected: {rule_name} (Signature-based)")
+                self.logger.debug(f"Anomaly detected: {', '.join(threat['triggers'])} (Baseline-based)")
+            return threats
 
         # Threshold-based anomaly detection
         anomaly_flags = []
@@ -63,10 +134,10 @@ class DetectionEngine:
             features['packet_size'] < self.normal_baselines['max_packet_size'] * 0.3):
             anomaly_flags.append('packet_size')
             
-        if features['packet_rate'] > self.normal_baselines['max_packet_rate'] * 1.5:
+        if features['flow_pkt_rate_1s'] > self.normal_baselines['max_packet_rate'] * 1.5:
             anomaly_flags.append('packet_rate')
             
-        if features['byte_rate'] > self.normal_baselines['max_byte_rate'] * 1.5:
+        if features['flow_byte_rate_1s'] > self.normal_baselines['max_byte_rate'] * 1.5:
             anomaly_flags.append('byte_rate')
 
         # If anomalies are found, create a threat
@@ -77,7 +148,7 @@ class DetectionEngine:
                 'triggers': anomaly_flags,
                 'confidence': confidence
             })
-            self.logger.info(f"Anomaly detected: {', '.join(anomaly_flags)} (Threshold-based)")
+            self.logger.debug(f"Anomaly detected: {', '.join(anomaly_flags)} (Threshold-based)")
 
         return threats
 
@@ -88,8 +159,105 @@ class DetectionEngine:
         :param new_rules: Dictionary of new signature rules to be added.
         """
         self.signature_rules.update(new_rules)
+        self.rule_set = RuleSet(self.rule_definitions, self.signature_rules)
         self.logger.info(f"Signature rules updated: {list(new_rules.keys())}")
 
+    def load_rules(self, rule_file):
+        """
+        Replaces the declarative signature rules with those from a rule file.
+
+        :param rule_file: Path to a JSON or YAML rule file.
+        """
+        definitions = load_rule_file(rule_file)
+        self.rule_set = RuleSet(definitions, self.signature_rules)
+        self.rule_definitions = definitions
+        self.logger.info(f"Loaded {len(definitions)} rules from {rule_file}")
+
+    def watch_config(self, config_file, interval=1.0):
+        """
+        Watches a rule/baseline config file and hot-reloads it on change.
+
+        The new rule set is compiled on the watcher thread and swapped in between
+        packets; an invalid file is rejected and the active rules are kept.
+
+        :param config_file: Path to a JSON or YAML file with 'rules' and optional 'baselines'.
+        :param interval: Polling interval in seconds.
+        """
+        self.stop_watching()
+        self.rule_watcher = RuleWatcher(config_file, self.reload_config, interval)
+        self.rule_watcher.start()
+
+    def stop_watching(self):
+        """
+        Stops watching the config file, if any.
+        """
+        if self.rule_watcher:
+            self.rule_watcher.stop()
+            self.rule_watcher = None
+
+    def reload_config(self, config_file):
+        """
+        Compiles a config file and stages it for activation before the next packet.
+
+        :param config_file: Path to a JSON or YAML file with 'rules' and optional 'baselines'.
+        :return: True if the config was valid and staged.
+        """
+        detected_at = time.perf_counter()
+        try:
+            config = load_config(config_file)
+            rule_set = RuleSet(config['rules'], self.signature_rules)
+        except Exception as e:
+            self.reload_info['rejected'] += 1
+            self.reload_info['last_error'] = str(e)
+            self.logger.error(f"Rejected rule config {config_file}, keeping version "
+                              f"{self.rule_set_version}: {e}")
+            return False
+
+        baselines = dict(self.normal_baselines)
+        baselines.update(config['baselines'])
+        compile_seconds = time.perf_counter() - detected_at
+        with self.reload_lock:
+            self.pending_reload = (rule_set, config['rules'], baselines, config_file,
+                                   detected_at, compile_seconds)
+        return True
+
+    def apply_pending_reload(self):
+        """
+        Activates a staged rule set. Called on the packet thread between packets;
+        the IDS loop also calls it when idle so reloads take effect without traffic.
+        """
+        with self.reload_lock:
+            # Taken and cleared in one step, so a config staged meanwhile is not lost
+            pending, self.pending_reload = self.pending_reload, None
+        if pending is None:
+            return
+
+        rule_set, definitions, baselines, source, detected_at, compile_seconds = pending
+        self.rule_set = rule_set
+        self.rule_definitions = definitions
+        self.normal_baselines = baselines
+        self.rule_set_version += 1
+
+        latency = time.perf_counter() - detected_at
+        self.reload_info.update({
+            'version': self.rule_set_version,
+            'source': source,
+            'rules': len(rule_set),
+            'activated_at': time.time(),
+            'compile_seconds': compile_seconds,
+            'reload_latency': latency,
+            'last_error': None
+        })
+        self.logger.info(f"Rule set version {self.rule_set_version} active: {len(rule_set)} rules "
+                         f"from {source} (compiled in {compile_seconds * 1000:.1f}ms, "
+                         f"active after {latency * 1000:.1f}ms)")
+
+    def get_rule_set_info(self):
+        """
+        Returns the active rule set version and the last reload's latency and status.
+        """
+        return dict(self.reload_info)
+
     def set_baselines(self, max_packet_size=None, max_packet_rate=None, max_byte_rate=None):
         """
         Allows dynamic adjustment of baseline values for anomaly detection.
@@ -105,3 +273,11 @@ class DetectionEngine:
         if max_byte_rate:
             self.normal_baselines['max_byte_rate'] = max_byte_rate
         self.logger.info("Baseline values updated.")
+
+    def save_baselines(self):
+        """
+        Saves the learned baselines to their file, if adaptive baselines are
+        enabled with a file.
+        """
+        if self.adaptive_baselines and self.adaptive_baselines.path:
+            self.adaptive_baselines.save()
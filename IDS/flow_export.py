@@ -0,0 +1,246 @@
+import threading
+import logging
+import queue
+import time
+import os
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pyarrow is only needed for flow export
+    pyarrow = None
+
+_STOP = object()
+
+EXPORT_FORMATS = ('parquet', 'arrow')
+
+# Reason of flow records sampled while the flow is still active
+SAMPLED = 'sample'
+
+# Column name and Arrow type name, in row order
+FLOW_COLUMNS = (
+    ('start_ts', 'timestamp'),
+    ('end_ts', 'timestamp'),
+    ('src_ip', 'string'),
+    ('dst_ip', 'string'),
+    ('src_port', 'uint16'),
+    ('dst_port', 'uint16'),
+    ('protocol', 'uint8'),
+    ('packets', 'uint64'),
+    ('bytes', 'uint64'),
+    ('reason', 'string'),
+)
+
+
+def flow_schema():
+    """
+    Returns the Arrow schema of exported flow records. Timestamps are UTC
+    with microsecond resolution.
+    """
+    types = {
+        'timestamp': pyarrow.timestamp('us', tz='UTC'),
+        'string': pyarrow.string(),
+        'uint8': pyarrow.uint8(),
+        'uint16': pyarrow.uint16(),
+        'uint64': pyarrow.uint64()
+    }
+    return pyarrow.schema([(name, types[kind]) for name, kind in FLOW_COLUMNS])
+
+
+class FlowExporter:
+    def __init__(self, directory="flows", export_format="parquet", prefix="flows", batch_rows=65536,
+                 max_rows=4000000, rotate_interval=3600.0, compression="zstd", queue_size=200000,
+                 snapshot=None, snapshot_interval=None):
+        """
+        Initializes a background exporter that writes flow records as columnar
+        Apache Arrow IPC or Parquet files for offline analysis (pandas, DuckDB).
+
+        Flows are queued by the caller and converted by a writer thread into
+        record batches of batch_rows rows (one Parquet row group each).
+        Files are named <prefix>-<YYYYmmddTHHMMSS>-<seq>.parquet (or .arrow)
+        and are written under a .part suffix until closed, so a directory
+        glob only picks up complete files. Memory is bounded by the queue and
+        one batch; when the queue is full flows are dropped and counted
+        rather than blocking the packet loop.
+
+        :param directory: Directory for the export files (created if missing).
+        :param export_format: 'parquet' or 'arrow' (Arrow IPC file format).
+        :param prefix: File name prefix.
+        :param batch_rows: Rows per record batch.
+        :param max_rows: Rows after which a new file is started.
+        :param rotate_interval: Seconds after which a new file is started.
+        :param compression: Codec ('zstd', 'lz4', and for Parquet also 'snappy' or 'gzip'),
+                            or None.
+        :param queue_size: Maximum number of queued flows; further flows are dropped.
+        :param snapshot: Optional callable returning the active FlowRecords, which are
+                         exported with reason 'sample' every snapshot_interval seconds.
+        :param snapshot_interval: Seconds between samples of the active flows.
+        :raises ImportError: If pyarrow is not installed.
+        """
+        if pyarrow is None:
+            raise ImportError("pyarrow is not installed (pip install pyarrow)")
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format '{export_format}', expected 'parquet' or 'arrow'")
+        self.directory = directory
+        self.export_format = export_format
+        self.prefix = prefix
+        self.batch_rows = batch_rows
+        self.max_rows = max_rows
+        self.rotate_interval = rotate_interval
+        self.compression = compression
+        self.snapshot = snapshot
+        self.snapshot_interval = snapshot_interval if snapshot else None
+        self.schema = flow_schema()
+        os.makedirs(directory, exist_ok=True)
+
+        self.flow_queue = queue.Queue(maxsize=queue_size)
+        self.writer = None
+        self.path = None
+        self.file_rows = 0
+        self.file_opened = 0.0
+        self.sequence = 0
+
+        self.flows_written = 0
+        self.flows_dropped = 0
+        self.flows_sampled = 0
+        self.batches_written = 0
+        self.files_closed = 0
+
+        self.logger = logging.getLogger(__name__)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add_flow(self, flow, reason):
+        """
+        Queues a finished flow for export without blocking. The signature
+        matches TrafficAnalyzer's on_flow_expired callback.
+
+        :param flow: FlowRecord with a (src, dst, sport, dport, protocol) key.
+        :param reason: Why the flow was finished (idle, active, capacity, flush).
+        """
+        src, dst, sport, dport, protocol = flow.key
+        try:
+            self.flow_queue.put_nowait((flow.start_time, flow.last_time, src, dst, sport, dport, protocol,
+                                        flow.packet_count, flow.byte_count, reason))
+        except queue.Full:
+            self.flows_dropped += 1
+
+    def _run(self):
+        """Writer loop: gather rows into batches, write them and rotate files."""
+        rows = []
+        now = time.monotonic()
+        next_check = now + 1.0
+        next_snapshot = now + self.snapshot_interval if self.snapshot_interval else None
+
+        while True:
+            deadline = next_check if next_snapshot is None else min(next_check, next_snapshot)
+            try:
+                row = self.flow_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                row = None
+            if row is _STOP:
+                break
+            if row is not None:
+                rows.append(row)
+                if len(rows) >= self.batch_rows:
+                    self._write(rows)
+                    rows = []
+                    if self.file_rows >= self.max_rows:
+                        self._close_file()
+
+            now = time.monotonic()
+            if next_snapshot is not None and now >= next_snapshot:
+                next_snapshot = now + self.snapshot_interval
+                rows = self._sample(rows)
+            if now >= next_check:
+                next_check = now + 1.0
+                if self.writer is not None and now - self.file_opened >= self.rotate_interval:
+                    self._write(rows)
+                    rows = []
+                    self._close_file()
+
+        self._write(rows)
+        self._close_file()
+
+    def _sample(self, rows):
+        """Adds the active flows to the pending rows, writing full batches."""
+        try:
+            flows = self.snapshot()
+        except Exception as e:
+            self.logger.error(f"Failed to sample active flows: {e}")
+            return rows
+        for flow in flows:
+            src, dst, sport, dport, protocol = flow.key
+            rows.append((flow.start_time, flow.last_time, src, dst, sport, dport, protocol,
+                         flow.packet_count, flow.byte_count, SAMPLED))
+            if len(rows) >= self.batch_rows:
+                self._write(rows)
+                rows = []
+        self.flows_sampled += len(flows)
+        return rows
+
+    def _write(self, rows):
+        """Converts rows to a record batch and appends it to the current file."""
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        columns[0] = [int(ts * 1000000) for ts in columns[0]]
+        columns[1] = [int(ts * 1000000) for ts in columns[1]]
+        try:
+            batch = pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+                schema=self.schema)
+            if self.writer is None:
+                self._open_file()
+            self.writer.write_batch(batch)
+        except (OSError, pyarrow.ArrowException) as e:
+            self.logger.error(f"Failed to export {len(rows)} flows to {self.path}: {e}")
+            return
+        self.file_rows += len(rows)
+        self.flows_written += len(rows)
+        self.batches_written += 1
+
+    def _open_file(self):
+        self.sequence += 1
+        name = f"{self.prefix}-{time.strftime('%Y%m%dT%H%M%S')}-{self.sequence:04d}.{self.export_format}"
+        self.path = os.path.join(self.directory, name)
+        if self.export_format == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(self.path + '.part', self.schema,
+                                                        compression=self.compression or 'none')
+        else:
+            options = pyarrow.ipc.IpcWriteOptions(compression=self.compression)
+            self.writer = pyarrow.ipc.new_file(self.path + '.part', self.schema, options=options)
+        self.file_rows = 0
+        self.file_opened = time.monotonic()
+
+    def _close_file(self):
+        if self.writer is None:
+            return
+        try:
+            self.writer.close()
+            os.replace(self.path + '.part', self.path)
+        except (OSError, pyarrow.ArrowException) as e:
+            self.logger.error(f"Failed to close flow export {self.path}: {e}")
+        self.writer = None
+        self.files_closed += 1
+
+    def stats(self):
+        """
+        Returns the exporter's queue depth and counters.
+        """
+        return {
+            'queued': self.flow_queue.qsize(),
+            'flows_written': self.flows_written,
+            'flows_dropped': self.flows_dropped,
+            'flows_sampled': self.flows_sampled,
+            'batches_written': self.batches_written,
+            'files_closed': self.files_closed
+        }
+
+    def close(self):
+        """
+        Writes out all queued flows, closes the last file and stops the writer thread.
+        """
+        self.flow_queue.put(_STOP)
+        self.thread.join()
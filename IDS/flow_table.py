@@ -0,0 +1,178 @@
+from collections import OrderedDict
+
+# Reasons a flow record leaves the table
+EXPIRED_IDLE = 'idle'
+EXPIRED_ACTIVE = 'active'
+EXPIRED_CAPACITY = 'capacity'
+EXPIRED_FLUSH = 'flush'
+
+
+class FlowRecord:
+    """
+    Per-flow counters, kept in slots instead of a dict to keep the table compact.
+    """
+    __slots__ = ('key', 'packet_count', 'byte_count', 'start_time', 'last_time', 'rates')
+
+    def __init__(self, key, start_time):
+        self.key = key
+        self.packet_count = 0
+        self.byte_count = 0
+        self.start_time = start_time
+        self.last_time = start_time
+        self.rates = None  # Sliding-window RateCounter, attached by the analyzer
+
+    def as_dict(self):
+        """
+        Returns the flow statistics as a plain dictionary.
+        """
+        return {
+            'packet_count': self.packet_count,
+            'byte_count': self.byte_count,
+            'start_time': self.start_time,
+            'last_time': self.last_time
+        }
+
+    def __repr__(self):
+        return f"FlowRecord({self.key}, packets={self.packet_count}, bytes={self.byte_count})"
+
+
+class FlowTable:
+    def __init__(self, max_flows=100000, idle_timeout=15.0, active_timeout=1800.0,
+                 on_expire=None, sweep_interval=1.0):
+        """
+        Initializes a bounded flow table with NetFlow-style expiry.
+
+        Flows are kept in least-recently-updated order, so idle flows are always
+        at the front and expiry only touches the flows that actually expire.
+
+        :param max_flows: Maximum number of flows; the least recently updated flow
+                          is evicted when a new flow would exceed it.
+        :param idle_timeout: Seconds without packets after which a flow expires.
+        :param active_timeout: Seconds after which a long-lived flow is exported and
+                               restarted, even if it is still active.
+        :param on_expire: Optional callback(flow_record, reason) for finished flows.
+        :param sweep_interval: Seconds of packet time between idle-expiry sweeps.
+        """
+        self.flows = OrderedDict()
+        # Optional callback(key, timestamp) returning a FlowRecord to continue a flow
+        # the table does not have (e.g. from a checkpoint), or None
+        self.restore = None
+        self.max_flows = max_flows
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.on_expire = on_expire
+        self.sweep_interval = sweep_interval
+        self.last_sweep = None
+
+        # Eviction counters
+        self.expired_idle = 0
+        self.expired_active = 0
+        self.evicted_capacity = 0
+
+    def update(self, key, length, timestamp):
+        """
+        Accounts a packet to its flow, creating or restarting the flow as needed.
+
+        :param key: Flow key tuple.
+        :param length: Packet length in bytes.
+        :param timestamp: Packet capture timestamp.
+        :return: The FlowRecord the packet was accounted to.
+        """
+        flows = self.flows
+        flow = flows.get(key)
+
+        if flow is None:
+            if len(flows) >= self.max_flows:
+                _, oldest = flows.popitem(last=False)
+                self.evicted_capacity += 1
+                self._emit(oldest, EXPIRED_CAPACITY)
+            if self.restore is not None:
+                flow = self.restore(key, timestamp)
+            if flow is None:
+                flow = FlowRecord(key, timestamp)
+            flows[key] = flow
+        elif timestamp - flow.start_time >= self.active_timeout:
+            # Export the long-lived flow and continue counting in a fresh record
+            self.expired_active += 1
+            self._emit(flow, EXPIRED_ACTIVE)
+            rates = flow.rates
+            flow = FlowRecord(key, timestamp)
+            flow.rates = rates  # Windowed rates continue across the restart
+            flows[key] = flow
+            flows.move_to_end(key)
+        else:
+            flows.move_to_end(key)
+
+        flow.packet_count += 1
+        flow.byte_count += length
+        flow.last_time = timestamp
+
+        if self.last_sweep is None:
+            self.last_sweep = timestamp
+        elif timestamp - self.last_sweep >= self.sweep_interval:
+            self.expire(timestamp)
+
+        return flow
+
+    def expire(self, now):
+        """
+        Removes flows that have been idle for longer than the idle timeout.
+
+        :param now: Current time in the same clock as the packet timestamps.
+        :return: Number of flows expired.
+        """
+        self.last_sweep = now
+        flows = self.flows
+        deadline = now - self.idle_timeout
+        expired = 0
+
+        while flows:
+            key = next(iter(flows))
+            flow = flows[key]
+            if flow.last_time > deadline:
+                break
+            del flows[key]
+            expired += 1
+            self._emit(flow, EXPIRED_IDLE)
+
+        self.expired_idle += expired
+        return expired
+
+    def flush(self):
+        """
+        Emits and removes every flow, e.g. on shutdown.
+        """
+        while self.flows:
+            _, flow = self.flows.popitem(last=False)
+            self._emit(flow, EXPIRED_FLUSH)
+
+    def _emit(self, flow, reason):
+        if self.on_expire:
+            self.on_expire(flow, reason)
+
+    def get(self, key, default=None):
+        return self.flows.get(key, default)
+
+    def stats(self):
+        """
+        Returns the table size and eviction counters.
+        """
+        return {
+            'active_flows': len(self.flows),
+            'max_flows': self.max_flows,
+            'expired_idle': self.expired_idle,
+            'expired_active': self.expired_active,
+            'evicted_capacity': self.evicted_capacity
+        }
+
+    def __len__(self):
+        return len(self.flows)
+
+    def __contains__(self, key):
+        return key in self.flows
+
+    def __iter__(self):
+        return iter(self.flows)
+
+    def items(self):
+        return self.flows.items()
@@ -0,0 +1,532 @@
+from datetime import datetime, timedelta, timezone
+import threading
+import argparse
+import logging
+import sqlite3
+import socket
+import queue
+import json
+import time
+import sys
+import re
+from packet_decoder import PROTO_TCP, PROTO_UDP, PROTO_ICMP, PROTO_ICMPV6
+
+_STOP = object()
+_ALERT = 0
+_FLOW = 1
+
+_ALERT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        ts REAL NOT NULL,
+        threat_type TEXT NOT NULL,
+        rule TEXT,
+        src_ip TEXT,
+        dst_ip TEXT,
+        src_key BLOB,
+        dst_key BLOB,
+        confidence REAL,
+        count INTEGER NOT NULL DEFAULT 1,
+        details TEXT
+    );
+    CREATE INDEX IF NOT EXISTS {table}_ts ON {table} (ts);
+    CREATE INDEX IF NOT EXISTS {table}_src ON {table} (src_key, ts);
+    CREATE INDEX IF NOT EXISTS {table}_dst ON {table} (dst_key, ts);
+    CREATE INDEX IF NOT EXISTS {table}_rule ON {table} (rule, ts);
+    CREATE INDEX IF NOT EXISTS {table}_type ON {table} (threat_type, ts);
+"""
+
+_FLOW_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        start_ts REAL NOT NULL,
+        end_ts REAL NOT NULL,
+        src_ip TEXT,
+        dst_ip TEXT,
+        src_key BLOB,
+        dst_key BLOB,
+        src_port INTEGER,
+        dst_port INTEGER,
+        protocol INTEGER,
+        packets INTEGER,
+        bytes INTEGER,
+        reason TEXT
+    );
+    CREATE INDEX IF NOT EXISTS {table}_end ON {table} (end_ts);
+    CREATE INDEX IF NOT EXISTS {table}_src ON {table} (src_key, end_ts);
+    CREATE INDEX IF NOT EXISTS {table}_dst ON {table} (dst_key, end_ts);
+    CREATE INDEX IF NOT EXISTS {table}_port ON {table} (dst_port, protocol, end_ts);
+"""
+
+_PARTITION_NAME = re.compile(r'^(alerts|flows)_(\d{8})$')
+
+PROTOCOL_NAMES = {'tcp': PROTO_TCP, 'udp': PROTO_UDP, 'icmp': PROTO_ICMP, 'icmp6': PROTO_ICMPV6}
+
+
+def ip_key(ip):
+    """
+    Encodes an IP address as a 16-byte big-endian key (IPv4 as IPv4-mapped IPv6),
+    so address ranges of either family are contiguous, indexable BLOB ranges.
+
+    :return: The key, or None if ip is not an address.
+    """
+    if not ip:
+        return None
+    try:
+        return b'\x00' * 10 + b'\xff\xff' + socket.inet_pton(socket.AF_INET, ip)
+    except OSError:
+        try:
+            return socket.inet_pton(socket.AF_INET6, ip)
+        except OSError:
+            return None
+
+
+def cidr_range(cidr):
+    """
+    Returns the (first, last) ip_key of an address or CIDR block such as 10.0.0.0/24.
+
+    :raises ValueError: If cidr is not a valid address or network.
+    """
+    address, _, prefix = cidr.partition('/')
+    first = ip_key(address)
+    if first is None:
+        raise ValueError(f"Invalid address or CIDR: {cidr}")
+    host_bits = 128 - int(prefix) - (96 if ':' not in address else 0) if prefix else 0
+    if not 0 <= host_bits <= 128:
+        raise ValueError(f"Invalid prefix length in CIDR: {cidr}")
+    value = int.from_bytes(first, 'big') >> host_bits << host_bits
+    return value.to_bytes(16, 'big'), (value | ((1 << host_bits) - 1)).to_bytes(16, 'big')
+
+
+def _day(ts):
+    """Partition day (UTC) of a timestamp, as YYYYMMDD."""
+    return time.strftime('%Y%m%d', time.gmtime(ts))
+
+
+class IDSStore:
+    def __init__(self, path="ids_store.db", retention_days=30, batch_size=5000,
+                 flush_interval=1.0, queue_size=200000, readonly=False):
+        """
+        Initializes an embedded SQLite (WAL mode) store for alerts and finished flows.
+
+        Rows are queued by the caller and inserted in batched transactions by a
+        writer thread. Tables are partitioned by UTC day (alerts_YYYYMMDD,
+        flows_YYYYMMDD) so retention drops whole tables, and queries only touch
+        the partitions overlapping the requested time range. IP addresses are
+        also stored as 16-byte keys so CIDR filters are index range scans.
+
+        Both tables use packet time (the alert's packet_time, the flow's end
+        time), so a replayed capture lands in the days it was recorded, and
+        retention counts back from the newest stored day rather than from
+        the wall clock.
+
+        :param path: SQLite database file.
+        :param retention_days: Days of partitions kept, counted back from the newest
+                               partition (None keeps everything).
+        :param batch_size: Maximum rows per insert transaction.
+        :param flush_interval: Maximum seconds a row waits before being committed.
+        :param queue_size: Maximum number of queued rows; further rows are dropped.
+        :param readonly: Open for queries only, without a writer thread.
+        """
+        self.path = path
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.row_queue = queue.Queue(maxsize=queue_size)
+        self.partitions = set()
+        # Partitions written since startup, which retention never drops
+        self.written = set()
+        self.next_retention = 0.0
+
+        self.alerts_stored = 0
+        self.flows_stored = 0
+        self.rows_dropped = 0
+        self.partitions_dropped = 0
+
+        self.logger = logging.getLogger(__name__)
+        self.connection = None
+        self.thread = None
+        if not readonly:
+            self.connection = self._connect()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _connect(self, readonly=False):
+        if readonly:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        else:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def add_alert(self, alert):
+        """
+        Queues an alert for insertion without blocking.
+
+        :param alert: Alert dictionary as built by AlertSystem.
+        """
+        self._offer((_ALERT, alert))
+
+    def add_flow(self, flow, reason):
+        """
+        Queues a finished flow for insertion without blocking. The signature
+        matches TrafficAnalyzer's on_flow_expired callback.
+
+        :param flow: FlowRecord with a (src, dst, sport, dport, protocol) key. For
+                     ICMP and ICMPv6, dport holds the message type and code.
+        :param reason: Why the flow was finished (idle, active, capacity, flush).
+        """
+        src, dst, sport, dport, protocol = flow.key
+        self._offer((_FLOW, (flow.start_time, flow.last_time, src, dst, sport, dport, protocol,
+                             flow.packet_count, flow.byte_count, reason)))
+
+    def _offer(self, item):
+        try:
+            self.row_queue.put_nowait(item)
+        except queue.Full:
+            self.rows_dropped += 1
+
+    def _run(self):
+        """Writer loop: gather rows and insert them in one transaction per batch."""
+        while True:
+            try:
+                item = self.row_queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._apply_retention_if_due()
+                continue
+            stop = item is _STOP
+            batch = [] if stop else [item]
+
+            deadline = time.monotonic() + self.flush_interval
+            while not stop and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self.row_queue.get(timeout=remaining) if remaining > 0 else self.row_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            if batch:
+                try:
+                    self._insert(batch)
+                except sqlite3.Error as e:
+                    self.logger.error(f"Failed to store {len(batch)} rows: {e}")
+            self._apply_retention_if_due()
+            if stop:
+                break
+
+    def _insert(self, batch):
+        """Inserts a batch into its day partitions in a single transaction."""
+        rows = {}
+        for kind, item in batch:
+            if kind == _ALERT:
+                details = item.get('details') or {}
+                rule = details.get('rule') or ','.join(details.get('triggers', ())) or None
+                ts = item.get('packet_time')
+                if ts is None:
+                    ts = item['timestamp'] if isinstance(item['timestamp'], float) else time.time()
+                rows.setdefault(f"alerts_{_day(ts)}", []).append((
+                    ts, item['threat_type'], rule, item.get('source_ip'), item.get('destination_ip'),
+                    ip_key(item.get('source_ip')), ip_key(item.get('destination_ip')),
+                    item.get('confidence'), item.get('count', 1), json.dumps(details, default=str)))
+            else:
+                start, end, src, dst, sport, dport, protocol, packets, byte_count, reason = item
+                rows.setdefault(f"flows_{_day(end)}", []).append((
+                    start, end, src, dst, ip_key(src), ip_key(dst), sport, dport, protocol,
+                    packets, byte_count, reason))
+
+        with self.connection:
+            for table, values in rows.items():
+                self._ensure_partition(table)
+                self.written.add(table)
+                if table.startswith('alerts_'):
+                    self.connection.executemany(f"INSERT INTO {table} VALUES (?,?,?,?,?,?,?,?,?,?)", values)
+                    self.alerts_stored += len(values)
+                else:
+                    self.connection.executemany(f"INSERT INTO {table} VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", values)
+                    self.flows_stored += len(values)
+
+    def _ensure_partition(self, table):
+        if table in self.partitions:
+            return
+        schema = _ALERT_SCHEMA if table.startswith('alerts_') else _FLOW_SCHEMA
+        for statement in schema.format(table=table).split(';'):
+            if statement.strip():
+                self.connection.execute(statement)
+        self.partitions.add(table)
+
+    def _apply_retention_if_due(self):
+        now = time.monotonic()
+        if now >= self.next_retention:
+            self.next_retention = now + 3600
+            self.apply_retention()
+
+    def apply_retention(self):
+        """
+        Drops alert and flow partitions more than retention_days older than the
+        newest partition. Partitions written since startup are kept.
+
+        Only call this from the writer thread; it shares the writer's connection.
+        """
+        if self.retention_days is None:
+            return
+        tables = self._list_partitions(self.connection)
+        if not tables:
+            return
+        newest = max(_PARTITION_NAME.match(table).group(2) for table in tables)
+        newest_ts = datetime.strptime(newest, '%Y%m%d').replace(tzinfo=timezone.utc).timestamp()
+        cutoff = _day(newest_ts - self.retention_days * 86400)
+        for table in tables:
+            if _PARTITION_NAME.match(table).group(2) < cutoff and table not in self.written:
+                self.connection.execute(f"DROP TABLE IF EXISTS {table}")
+                self.partitions.discard(table)
+                self.partitions_dropped += 1
+                self.logger.info(f"Dropped expired partition {table}")
+        self.connection.commit()
+
+    @staticmethod
+    def _list_partitions(connection, kind=None, since=None, until=None):
+        """Returns partition table names, optionally limited to a kind and time range."""
+        names = []
+        for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'"):
+            match = _PARTITION_NAME.match(name)
+            if not match or (kind and match.group(1) != kind):
+                continue
+            if since is not None and match.group(2) < _day(since):
+                continue
+            if until is not None and match.group(2) > _day(until):
+                continue
+            names.append(name)
+        return sorted(names)
+
+    def query_alerts(self, since=None, until=None, src=None, dst=None, rule=None,
+                     threat_type=None, limit=1000):
+        """
+        Returns matching alerts, newest first.
+
+        :param since: Start of the time range (epoch seconds, on packet time).
+        :param until: End of the time range (epoch seconds).
+        :param src: Source address or CIDR block.
+        :param dst: Destination address or CIDR block.
+        :param rule: Rule id (or comma-separated anomaly triggers).
+        :param threat_type: Threat type, e.g. 'signature' or 'scan'.
+        :param limit: Maximum number of alerts returned.
+        :return: List of alert dictionaries.
+        """
+        conditions, params = self._time_filter('ts', since, until)
+        for column, cidr in (('src_key', src), ('dst_key', dst)):
+            if cidr:
+                conditions.append(f"{column} BETWEEN ? AND ?")
+                params.extend(cidr_range(cidr))
+        if rule:
+            conditions.append("rule = ?")
+            params.append(rule)
+        if threat_type:
+            conditions.append("threat_type = ?")
+            params.append(threat_type)
+
+        # Newest rows of each partition, then newest overall
+        columns = "ts, threat_type, rule, src_ip, dst_ip, confidence, count, details"
+        rows = self._query_partitions('alerts', since, until, columns, conditions, params + [limit],
+                                      "ORDER BY ts DESC LIMIT ?", "ORDER BY ts DESC LIMIT ?", [limit])
+        return [{
+            'timestamp': ts,
+            'threat_type': threat,
+            'rule': rule_id,
+            'source_ip': src_ip,
+            'destination_ip': dst_ip,
+            'confidence': confidence,
+            'count': count,
+            'details': json.loads(details) if details else None
+        } for ts, threat, rule_id, src_ip, dst_ip, confidence, count, details in rows]
+
+    def top_talkers(self, since=None, until=None, dst=None, dst_port=None, protocol=None,
+                    by='bytes', limit=10):
+        """
+        Returns the sources with the most traffic in finished flows.
+
+        :param since: Start of the time range (epoch seconds, on flow end time).
+        :param until: End of the time range (epoch seconds).
+        :param dst: Destination address or CIDR block.
+        :param dst_port: Destination port (ICMP type << 8 | code for ICMP flows).
+        :param protocol: IP protocol number, e.g. 6 for TCP.
+        :param by: Ranking: 'bytes', 'packets' or 'flows'.
+        :param limit: Number of sources returned.
+        :return: List of {'src_ip', 'flows', 'packets', 'bytes'} dictionaries.
+        """
+        if by not in ('bytes', 'packets', 'flows'):
+            raise ValueError(f"Unknown ranking '{by}', expected 'bytes', 'packets' or 'flows'")
+        conditions, params = self._time_filter('end_ts', since, until)
+        if dst:
+            conditions.append("dst_key BETWEEN ? AND ?")
+            params.extend(cidr_range(dst))
+        if dst_port is not None:
+            conditions.append("dst_port = ?")
+            params.append(dst_port)
+        if protocol is not None:
+            conditions.append("protocol = ?")
+            params.append(protocol)
+
+        # Aggregate per partition, then across partitions
+        columns = "src_ip, COUNT(*) AS flows, SUM(packets) AS packets, SUM(bytes) AS bytes"
+        rows = self._query_partitions('flows', since, until, columns, conditions, params, "GROUP BY src_ip",
+                                      f"GROUP BY src_ip ORDER BY SUM({by}) DESC LIMIT ?", [limit],
+                                      "src_ip, SUM(flows), SUM(packets), SUM(bytes)")
+        return [{'src_ip': src_ip, 'flows': flows, 'packets': packets, 'bytes': byte_count}
+                for src_ip, flows, packets, byte_count in rows]
+
+    @staticmethod
+    def _time_filter(column, since, until):
+        conditions, params = [], []
+        if since is not None:
+            conditions.append(f"{column} >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append(f"{column} < ?")
+            params.append(until)
+        return conditions, params
+
+    def _reader(self):
+        """Opens a read-only connection; WAL lets reads run alongside the writer."""
+        return _closing(self._connect(readonly=True))
+
+    def _query_partitions(self, kind, since, until, columns, conditions, params, inner_suffix,
+                          outer_suffix, outer_params, outer_columns="*"):
+        """
+        Runs a query over the partitions overlapping the time range: the inner
+        query runs per partition, and the outer one over their UNION ALL.
+        """
+        with self._reader() as connection:
+            tables = self._list_partitions(connection, kind, since, until)
+            if not tables:
+                return []
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            union = " UNION ALL ".join(
+                f"SELECT * FROM (SELECT {columns} FROM {table}{where} {inner_suffix})" for table in tables)
+            return connection.execute(f"SELECT {outer_columns} FROM ({union}) {outer_suffix}",
+                                      params * len(tables) + outer_params).fetchall()
+
+    def stats(self):
+        """
+        Returns the store's queue depth and counters.
+        """
+        return {
+            'queued': self.row_queue.qsize(),
+            'alerts_stored': self.alerts_stored,
+            'flows_stored': self.flows_stored,
+            'rows_dropped': self.rows_dropped,
+            'partitions_dropped': self.partitions_dropped
+        }
+
+    def close(self):
+        """
+        Commits all queued rows and stops the writer thread.
+        """
+        if self.thread is None:
+            return
+        self.row_queue.put(_STOP)
+        self.thread.join()
+        self.connection.close()
+
+
+class _closing:
+    """Context manager closing a connection (sqlite3's own only commits)."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, *exc):
+        self.connection.close()
+
+
+def _parse_duration(text):
+    """Parses durations like 90s, 30m, 1h or 7d into seconds."""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([smhd])', text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid duration '{text}', expected e.g. 30m, 1h, 7d")
+    return float(match.group(1)) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+
+
+def _parse_protocol(text):
+    """Parses a protocol name (tcp, udp, icmp, icmp6) or number."""
+    protocol = PROTOCOL_NAMES.get(text.lower())
+    if protocol is None:
+        if not text.isdigit():
+            raise argparse.ArgumentTypeError(f"Unknown protocol '{text}', expected "
+                                             f"{', '.join(PROTOCOL_NAMES)} or a number")
+        protocol = int(text)
+    return protocol
+
+
+def _time_range(args):
+    """Resolves --last, --day, --since and --until into an epoch (since, until) range."""
+    if args.last:
+        return time.time() - args.last, None
+    if args.day:
+        today = datetime.now().date()
+        day = {'today': today, 'yesterday': today - timedelta(days=1)}.get(args.day)
+        if day is None:
+            day = datetime.strptime(args.day, '%Y-%m-%d').date()
+        start = datetime(day.year, day.month, day.day).timestamp()
+        return start, start + 86400
+    since = datetime.fromisoformat(args.since).timestamp() if args.since else None
+    until = datetime.fromisoformat(args.until).timestamp() if args.until else None
+    return since, until
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the IDS alert and flow store")
+    parser.add_argument("database", help="SQLite store written by the IDS (--store)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_time_arguments(subparser):
+        group = subparser.add_mutually_exclusive_group()
+        group.add_argument("--last", type=_parse_duration, help="Only the last duration, e.g. 1h")
+        group.add_argument("--day", help="today, yesterday or YYYY-MM-DD (local time)")
+        group.add_argument("--since", help="ISO 8601 start time")
+        subparser.add_argument("--until", help="ISO 8601 end time (with --since)")
+        subparser.add_argument("--limit", type=int, default=100)
+
+    alerts_parser = subparsers.add_parser("alerts", help="List alerts, newest first")
+    add_time_arguments(alerts_parser)
+    alerts_parser.add_argument("--src", help="Source address or CIDR, e.g. 10.0.0.0/24")
+    alerts_parser.add_argument("--dst", help="Destination address or CIDR")
+    alerts_parser.add_argument("--rule", help="Rule id")
+    alerts_parser.add_argument("--type", dest="threat_type", help="Threat type")
+
+    talkers_parser = subparsers.add_parser("top-talkers", help="Sources with the most traffic")
+    add_time_arguments(talkers_parser)
+    talkers_parser.add_argument("--dst", help="Destination address or CIDR")
+    talkers_parser.add_argument("--dst-port", type=int)
+    talkers_parser.add_argument("--protocol", type=_parse_protocol,
+                                help="tcp, udp, icmp, icmp6 or a protocol number")
+    talkers_parser.add_argument("--by", choices=["bytes", "packets", "flows"], default="bytes")
+
+    args = parser.parse_args()
+    store = IDSStore(args.database, readonly=True)
+    since, until = _time_range(args)
+
+    start = time.perf_counter()
+    if args.command == "alerts":
+        rows = store.query_alerts(since, until, src=args.src, dst=args.dst, rule=args.rule,
+                                  threat_type=args.threat_type, limit=args.limit)
+        for row in rows:
+            row['timestamp'] = datetime.fromtimestamp(row['timestamp']).isoformat()
+    else:
+        rows = store.top_talkers(since, until, dst=args.dst, dst_port=args.dst_port,
+                                 protocol=args.protocol, by=args.by, limit=args.limit)
+    elapsed = time.perf_counter() - start
+
+    for row in rows:
+        print(json.dumps(row))
+    print(f"{len(rows)} rows in {elapsed * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import logging
+import time
+
+# Sub-buckets per power of two (3 bits: at most 12.5% relative error)
+_SUB_BITS = 3
+_SUB_BUCKETS = 1 << _SUB_BITS
+_BUCKETS = 42 * _SUB_BUCKETS  # Up to 2^42 ns (~73 minutes)
+
+
+class Histogram:
+    """
+    Latency histogram with HDR-style log-linear buckets over integer
+    nanoseconds: exact below 16ns, then 8 buckets per power of two. Recording
+    is a bit_length, a shift and a list increment.
+    """
+    __slots__ = ('name', 'help', 'counts', 'count', 'total')
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total = 0
+
+    def record(self, value):
+        """
+        Records one duration in nanoseconds.
+        """
+        if value < 2 * _SUB_BUCKETS:
+            index = value if value > 0 else 0
+        else:
+            shift = value.bit_length() - _SUB_BITS - 1
+            index = (shift << _SUB_BITS) + (value >> shift)
+            if index >= _BUCKETS:
+                index = _BUCKETS - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+
+    @staticmethod
+    def bucket_upper(index):
+        """Exclusive upper bound in nanoseconds of a bucket."""
+        if index < 2 * _SUB_BUCKETS:
+            return index + 1
+        shift = (index >> _SUB_BITS) - 1
+        return ((index - (shift << _SUB_BITS)) + 1) << shift
+
+    def quantile(self, q):
+        """
+        Returns the upper bound (in nanoseconds) of the bucket holding quantile q.
+        """
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return self.bucket_upper(index)
+        return self.bucket_upper(_BUCKETS - 1)
+
+    def render(self):
+        """Prometheus histogram exposition, with one bucket per power of two."""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        counts = self.counts
+        cumulative = 0
+        power = 4
+        for index in range(_BUCKETS):
+            cumulative += counts[index]
+            # Emit a bucket at every power-of-two boundary (2^power ns)
+            if index + 1 == (power - 2) << _SUB_BITS:
+                lines.append(f'{self.name}_bucket{{le="{(1 << power) / 1e9:.9g}"}} {cumulative}')
+                power += 1
+                if cumulative == self.count:
+                    break
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.total / 1e9:.9g}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class Counter:
+    """
+    Monotonic counter, either incremented directly or read from a function at
+    scrape time.
+    """
+    __slots__ = ('name', 'help', 'value', 'func')
+
+    def __init__(self, name, help_text, func=None):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self.func = func
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def get(self):
+        return self.func() if self.func else self.value
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter",
+                f"{self.name} {self.get()}"]
+
+
+class Gauge:
+    """
+    Point-in-time value, either set directly or read from a function at scrape time.
+    """
+    __slots__ = ('name', 'help', 'value', 'func')
+
+    def __init__(self, name, help_text, func=None):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self.func = func
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.func() if self.func else self.value
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge",
+                f"{self.name} {self.get()}"]
+
+
+class Metrics:
+    def __init__(self, sample_rate=1):
+        """
+        Initializes a registry of counters, gauges and latency histograms.
+
+        :param sample_rate: Time one in N packets in the per-stage histograms
+                            (counters and gauges are always exact).
+        """
+        self.sample_rate = max(1, int(sample_rate))
+        self.metrics = {}
+        self.server = None
+        self.reporter = None
+        self.stop_event = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    def _register(self, metric):
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, func=None):
+        return self._register(Counter(name, help_text, func))
+
+    def gauge(self, name, help_text, func=None):
+        return self._register(Gauge(name, help_text, func))
+
+    def histogram(self, name, help_text):
+        return self._register(Histogram(name, help_text))
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                self.logger.debug(f"Failed to render metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        Returns a one-line summary: counters and gauges, and p50/p99 of each histogram.
+        """
+        parts = []
+        for metric in list(self.metrics.values()):
+            if isinstance(metric, Histogram):
+                if metric.count:
+                    parts.append(f"{metric.name} p50={metric.quantile(0.5) / 1000:.1f}us "
+                                 f"p99={metric.quantile(0.99) / 1000:.1f}us")
+            else:
+                parts.append(f"{metric.name}={metric.get()}")
+        return ", ".join(parts)
+
+    def start_http_server(self, port, host="127.0.0.1"):
+        """
+        Serves the metrics at http://host:port/metrics from a daemon thread.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.logger.info(f"Serving metrics on http://{host}:{self.server.server_port}/metrics")
+
+    def start_reporter(self, interval, logger, rate_counter=None):
+        """
+        Logs a summary line every interval seconds.
+
+        :param interval: Seconds between summary lines.
+        :param logger: Logger the summary is written to.
+        :param rate_counter: Optional counter name whose per-second rate is included (e.g. packets).
+        """
+        def report():
+            last_value = None
+            last_time = time.monotonic()
+            while not self.stop_event.wait(interval):
+                line = self.summary()
+                if rate_counter in self.metrics:
+                    value = self.metrics[rate_counter].get()
+                    now = time.monotonic()
+                    if last_value is not None:
+                        line = f"{(value - last_value) / (now - last_time):.0f} pps, {line}"
+                    last_value, last_time = value, now
+                logger.info(f"Metrics: {line}")
+
+        self.reporter = threading.Thread(target=report, daemon=True)
+        self.reporter.start()
+
+    def stop(self):
+        """
+        Stops the summary reporter and the HTTP endpoint.
+        """
+        self.stop_event.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
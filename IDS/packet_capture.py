@@ -1,18 +1,43 @@
-from scapy.all import sniff, IP, TCP
+from packet_decoder import decode, dissect, scapy_layers, record_from_packet, PacketRecord, IDS_PROTOCOLS
+from ring_buffer import PacketRing, DROP_NEWEST
 import threading
+import select
 import queue
 import logging
 
+def flow_key(packet):
+    """
+    Returns the flow key of a queued packet, used for per-flow sampling.
+
+    :param packet: Scapy packet or PacketRecord.
+    """
+    if not isinstance(packet, PacketRecord):
+        packet = record_from_packet(packet)
+        if packet is None:
+            return None
+    return packet.src, packet.dst, packet.sport, packet.dport, packet.proto
+
+
 class PacketCapture:
-    def __init__(self, interface="eth0"):
+    def __init__(self, interface="eth0", raw=False, queue_size=65536,
+                 overflow_policy=DROP_NEWEST, sample_rate=8, on_overload=None):
         """
         Initializes the PacketCapture instance.
 
         :param interface: Network interface to capture packets from (default is eth0).
+        :param raw: If True, frames are decoded by the Scapy-free header decoder and
+                    queued as PacketRecords; Scapy is only used as a fallback.
+        :param queue_size: Number of packets the capture ring can hold.
+        :param overflow_policy: 'drop_newest', 'drop_oldest' or 'sample' when the consumer falls behind.
+        :param sample_rate: Keep 1-in-N packets per flow under the 'sample' policy.
+        :param on_overload: Optional callback(stats) run when packets start being dropped.
         """
-        self.packet_queue = queue.Queue()
+        self.packet_queue = PacketRing(queue_size, policy=overflow_policy, sample_rate=sample_rate,
+                                       key_func=flow_key, on_overload=on_overload)
         self.stop_capture = threading.Event()
+        self.finished = threading.Event()
         self.interface = interface
+        self.raw = raw
         self.capture_thread = None
 
         # Set up basic logging
@@ -25,10 +50,36 @@ class PacketCapture:
 
         :param packet: Scapy packet to process.
         """
-        if IP in packet and TCP in packet:
-            self.packet_queue.put(packet)
+        scapy = scapy_layers()
+        if scapy.IP in packet or scapy.IPv6 in packet:
+            self._enqueue(packet)
             self.logger.debug(f"Packet captured: {packet.summary()}")
 
+    def frame_callback(self, frame, timestamp, linktype, layer=None):
+        """
+        Callback for raw frames in the fast decoding pipeline.
+
+        :param frame: Raw frame bytes.
+        :param timestamp: Capture timestamp of the frame.
+        :param linktype: pcap link-layer header type of the frame.
+        :param layer: Scapy class to dissect the frame with if the decoder cannot.
+        """
+        record = decode(frame, timestamp, linktype)
+        if record is None:
+            # Unusual encapsulation, let Scapy dissect it
+            self.packet_callback(dissect(frame, timestamp, linktype, layer))
+        elif record.proto in IDS_PROTOCOLS:
+            self._enqueue(record)
+
+    def _enqueue(self, item):
+        """
+        Hands a captured packet or PacketRecord to the consumer, applying the
+        ring's overflow policy if the consumer has fallen behind.
+
+        :param item: Scapy packet or PacketRecord.
+        """
+        self.packet_queue.offer(item)
+
     def start_capture(self):
         """
         Starts the packet capture in a separate thread.
@@ -37,33 +88,74 @@ class PacketCapture:
             self.logger.warning("Capture thread is already running.")
             return
 
+        self.finished.clear()
+        self.packet_queue.reopen()
+
         def capture_thread():
             """Function to capture packets using Scapy."""
             try:
-                sniff(iface=self.interface,
+                scapy_layers().sniff(iface=self.interface,
                       prn=self.packet_callback,
                       store=0,
                       stop_filter=lambda _: self.stop_capture.is_set())
             except Exception as e:
                 self.logger.error(f"Error during packet capture: {e}")
+            finally:
+                self._finish()
+
+        def raw_capture_thread():
+            """Function to read undissected frames from a Scapy L2 socket."""
+            sock = None
+            try:
+                conf = scapy_layers().conf
+                sock = conf.L2listen(iface=self.interface)
+                linktype = conf.l2types.layer2num.get(sock.LL, 1)
+                while not self.stop_capture.is_set():
+                    readable, _, _ = select.select([sock], [], [], 0.5)
+                    if not readable:
+                        continue
+                    layer, frame, timestamp = sock.recv_raw()
+                    if frame:
+                        self.frame_callback(frame, timestamp, linktype, layer)
+            except Exception as e:
+                self.logger.error(f"Error during packet capture: {e}")
+            finally:
+                if sock is not None:
+                    sock.close()
+                self._finish()
 
         # Start the capture thread
-        self.capture_thread = threading.Thread(target=capture_thread, daemon=True)
+        target = raw_capture_thread if self.raw else capture_thread
+        self.capture_thread = threading.Thread(target=target, daemon=True)
         self.capture_thread.start()
         self.logger.info(f"Packet capture started on interface: {self.interface}")
 
+    def _finish(self):
+        """
+        Marks the capture as finished and wakes the consumer waiting on the queue.
+        """
+        self.finished.set()
+        self.packet_queue.close()
+
     def stop(self):
         """
         Stops the packet capture thread.
         """
         if not self.capture_thread or not self.capture_thread.is_alive():
-            self.logger.warning("No active capture thread to stop.")
+            if not self.finished.is_set():
+                self.logger.warning("No active capture thread to stop.")
             return
 
         self.stop_capture.set()
         self.capture_thread.join()
         self.logger.info("Packet capture stopped.")
 
+    def get_queue_stats(self):
+        """
+        Returns the capture ring's depth, high-water mark and enqueue/drop counters.
+        """
+        return self.packet_queue.stats()
+
     def get_packet(self, timeout=1):
         """
         Retrieve a packet from the queue.
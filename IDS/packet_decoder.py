@@ -0,0 +1,254 @@
+from types import SimpleNamespace
+import socket
+import struct
+
+# Link-layer header types (see pcap-linktype(7))
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+VLAN_ETHERTYPES = (0x8100, 0x88A8, 0x9100)
+
+PROTO_ICMP = 1
+PROTO_TCP = 6
+PROTO_UDP = 17
+PROTO_ICMPV6 = 58
+
+# Transport protocols the IDS tracks flows for
+IDS_PROTOCOLS = frozenset((PROTO_TCP, PROTO_UDP, PROTO_ICMP, PROTO_ICMPV6))
+
+# IPv6 extension headers that can be skipped to reach the transport header
+IPV6_EXT_HEADERS = (0, 43, 60)
+IPV6_FRAGMENT = 44
+
+_ETHERTYPE = struct.Struct('!H')
+_IPV4 = struct.Struct('!BBHHHBBH4s4s')
+_IPV6 = struct.Struct('!IHBB16s16s')
+_PORTS = struct.Struct('!HH')
+_TCP = struct.Struct('!HHIIBBH')
+
+# Scapy is only imported when a dissecting path first needs it (see scapy_layers)
+_scapy = None
+
+
+def scapy_layers():
+    """
+    Imports the parts of Scapy the IDS uses on first call. Only the IPv4 and
+    IPv6 layers (which pull in the link layers, sniff and the L2 sockets) are
+    loaded, not the full scapy.all, and raw-frame paths never load them.
+
+    :return: Namespace with IP, IPv6, conf and sniff.
+    """
+    global _scapy
+    if _scapy is None:
+        from scapy.config import conf
+        from scapy.layers.inet import IP
+        from scapy.layers.inet6 import IPv6
+        from scapy.sendrecv import sniff
+        _scapy = SimpleNamespace(IP=IP, IPv6=IPv6, conf=conf, sniff=sniff)
+    return _scapy
+
+
+def dissect(frame, timestamp, linktype, layer=None):
+    """
+    Dissects a raw frame with Scapy, for encapsulations the decoder does not handle.
+
+    :param layer: Scapy class to dissect with (defaults to the class registered for linktype).
+    :return: Scapy packet.
+    """
+    conf = scapy_layers().conf
+    packet = (layer or conf.l2types.get(linktype, conf.raw_layer))(frame)
+    packet.time = timestamp
+    return packet
+
+
+class PacketRecord:
+    """
+    Compact, Scapy-free view of the headers the IDS cares about.
+
+    The payload is data[payload_offset:payload_end]; payload_end excludes
+    link-layer padding (None means the end of data).
+
+    ICMP and ICMPv6 have no ports; as in NetFlow, sport is 0 and dport holds
+    the message type and code (type << 8 | code).
+    """
+    __slots__ = ('time', 'length', 'ip_version', 'src', 'dst', 'proto',
+                 'sport', 'dport', 'tcp_flags', 'window', 'payload_offset', 'data',
+                 'seq', 'payload_end')
+
+    def __init__(self, time, length, ip_version, src, dst, proto,
+                 sport=0, dport=0, tcp_flags=0, window=0, payload_offset=0, data=b'',
+                 seq=0, payload_end=None):
+        self.time = time
+        self.length = length
+        self.ip_version = ip_version
+        self.src = src
+        self.dst = dst
+        self.proto = proto
+        self.sport = sport
+        self.dport = dport
+        self.tcp_flags = tcp_flags
+        self.window = window
+        self.payload_offset = payload_offset
+        self.data = data
+        self.seq = seq
+        self.payload_end = payload_end
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return (f"PacketRecord({self.src}:{self.sport} -> {self.dst}:{self.dport} "
+                f"proto={self.proto} len={self.length})")
+
+
+def decode(data, timestamp=0.0, linktype=LINKTYPE_ETHERNET):
+    """
+    Decodes Ethernet/IPv4/IPv6/TCP/UDP/ICMP/ICMPv6 headers directly from a raw frame.
+
+    Header fields are unpacked in place through a memoryview, so the frame is
+    never copied or dissected into layer objects.
+
+    :param data: Raw frame bytes as captured on the wire.
+    :param timestamp: Capture timestamp of the frame.
+    :param linktype: pcap link-layer header type of the frame.
+    :return: A PacketRecord, or None if the frame uses an encapsulation this
+             decoder does not handle (callers should fall back to Scapy).
+    """
+    view = memoryview(data)
+    size = len(view)
+
+    # Link layer
+    if linktype == LINKTYPE_ETHERNET:
+        if size < 14:
+            return None
+        offset = 12
+        ethertype = _ETHERTYPE.unpack_from(view, offset)[0]
+        while ethertype in VLAN_ETHERTYPES:
+            offset += 4
+            if offset + 2 > size:
+                return None
+            ethertype = _ETHERTYPE.unpack_from(view, offset)[0]
+        offset += 2
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        if size < 1:
+            return None
+        offset = 0
+        ethertype = ETH_P_IPV6 if view[0] >> 4 == 6 else ETH_P_IP
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if size < 16:
+            return None
+        offset = 16
+        ethertype = _ETHERTYPE.unpack_from(view, 14)[0]
+    elif linktype == LINKTYPE_NULL:
+        if size < 5:
+            return None
+        offset = 4
+        ethertype = ETH_P_IPV6 if view[offset] >> 4 == 6 else ETH_P_IP
+    else:
+        return None
+
+    # Network layer
+    if ethertype == ETH_P_IP:
+        if offset + 20 > size:
+            return None
+        ver_ihl, _, total_length, _, frag, _, proto, _, src, dst = _IPV4.unpack_from(view, offset)
+        if ver_ihl >> 4 != 4 or frag & 0x1FFF:
+            return None  # Not IPv4 or a non-first fragment
+        ip_version = 4
+        # Total length 0 is seen with segmentation offload; trust the capture length then
+        ip_end = min(size, offset + total_length) if total_length else size
+        src = socket.inet_ntoa(src)
+        dst = socket.inet_ntoa(dst)
+        offset += (ver_ihl & 0x0F) * 4
+    elif ethertype == ETH_P_IPV6:
+        if offset + 40 > size:
+            return None
+        _, payload_length, proto, _, src, dst = _IPV6.unpack_from(view, offset)
+        ip_version = 6
+        ip_end = min(size, offset + 40 + payload_length) if payload_length else size
+        src = socket.inet_ntop(socket.AF_INET6, src)
+        dst = socket.inet_ntop(socket.AF_INET6, dst)
+        offset += 40
+        while proto in IPV6_EXT_HEADERS or proto == IPV6_FRAGMENT:
+            if offset + 8 > size:
+                return None
+            if proto == IPV6_FRAGMENT:
+                if _ETHERTYPE.unpack_from(view, offset + 2)[0] & 0xFFF8:
+                    return None  # Non-first fragment
+                next_proto, hdr_len = view[offset], 8
+            else:
+                next_proto, hdr_len = view[offset], (view[offset + 1] + 1) * 8
+            proto = next_proto
+            offset += hdr_len
+    else:
+        return None
+
+    # Transport layer
+    if proto == PROTO_TCP:
+        if offset + 20 > size:
+            return None
+        sport, dport, seq, _, data_offset, flags, window = _TCP.unpack_from(view, offset)
+        tcp_flags = flags | ((data_offset & 0x01) << 8)  # Include the NS bit like Scapy
+        return PacketRecord(timestamp, size, ip_version, src, dst, proto, sport, dport,
+                            tcp_flags, window, offset + (data_offset >> 4) * 4, data, seq, ip_end)
+
+    if proto == PROTO_UDP:
+        if offset + 8 > size:
+            return None
+        sport, dport = _PORTS.unpack_from(view, offset)
+        return PacketRecord(timestamp, size, ip_version, src, dst, proto, sport, dport,
+                            payload_offset=offset + 8, data=data, payload_end=ip_end)
+
+    if proto == PROTO_ICMP or proto == PROTO_ICMPV6:
+        if offset + 4 > size:
+            return None
+        icmp_type_code = view[offset] << 8 | view[offset + 1]
+        return PacketRecord(timestamp, size, ip_version, src, dst, proto, 0, icmp_type_code,
+                            payload_offset=offset + 8, data=data, payload_end=ip_end)
+
+    return PacketRecord(timestamp, size, ip_version, src, dst, proto,
+                        payload_offset=offset, data=data, payload_end=ip_end)
+
+
+def record_from_packet(packet):
+    """
+    Builds a PacketRecord from an already dissected Scapy IPv4 or IPv6 packet.
+    The transport payload is copied into data, with a payload_offset of 0.
+
+    :param packet: Scapy packet.
+    :return: A PacketRecord, or None if the packet is not IPv4 or IPv6.
+    """
+    scapy = scapy_layers()
+    if scapy.IP in packet:
+        ip = packet[scapy.IP]
+        ip_version, proto = 4, ip.proto
+    elif scapy.IPv6 in packet:
+        ip = packet[scapy.IPv6]
+        ip_version, proto = 6, ip.nh
+    else:
+        return None
+
+    layer = ip.payload
+    while ip_version == 6 and (proto in IPV6_EXT_HEADERS or proto == IPV6_FRAGMENT) and layer:
+        proto, layer = layer.nh, layer.payload
+
+    try:
+        if proto == PROTO_TCP:
+            return PacketRecord(packet.time, len(packet), ip_version, ip.src, ip.dst, proto,
+                                layer.sport, layer.dport, int(layer.flags), layer.window, 0,
+                                bytes(layer.payload), layer.seq)
+        if proto == PROTO_UDP:
+            return PacketRecord(packet.time, len(packet), ip_version, ip.src, ip.dst, proto,
+                                layer.sport, layer.dport, data=bytes(layer.payload))
+        if proto == PROTO_ICMP or proto == PROTO_ICMPV6:
+            return PacketRecord(packet.time, len(packet), ip_version, ip.src, ip.dst, proto,
+                                0, layer.type << 8 | layer.code, data=bytes(layer.payload))
+    except AttributeError:
+        return None  # Transport header not dissected (e.g. a non-first fragment)
+    return PacketRecord(packet.time, len(packet), ip_version, ip.src, ip.dst, proto, data=bytes(layer))
@@ -0,0 +1,266 @@
+from collections import deque
+
+# Lowercase ASCII letter -> uppercase, for case-insensitive automata
+_UPPER = {lower: upper for lower, upper in zip(b'abcdefghijklmnopqrstuvwxyz', b'ABCDEFGHIJKLMNOPQRSTUVWXYZ')}
+
+
+def parse_content(definition):
+    """
+    Returns the byte pattern of a payload rule: 'content' is text (UTF-8),
+    'content_hex' is hex digits (spaces allowed).
+
+    :param definition: Rule dictionary as loaded from a rule file.
+    :return: The pattern bytes, or None if the rule has no payload content.
+    """
+    content = definition.get('content')
+    content_hex = definition.get('content_hex')
+    if content is not None and content_hex is not None:
+        raise ValueError("use either 'content' or 'content_hex', not both")
+    if content is not None:
+        if not isinstance(content, str):
+            raise ValueError("'content' must be a string")
+        pattern = content.encode('utf-8')
+    elif content_hex is not None:
+        try:
+            pattern = bytes.fromhex(str(content_hex))
+        except ValueError:
+            raise ValueError(f"invalid 'content_hex' {content_hex!r}")
+    else:
+        return None
+    if not pattern:
+        raise ValueError("payload content must not be empty")
+    return pattern
+
+
+class PayloadPattern:
+    """
+    A payload signature: the bytes to find and where in the payload they may occur.
+
+    offset is the first payload position the match may start at; depth, if
+    set, limits the match to the depth bytes starting at offset.
+    """
+    __slots__ = ('rule_id', 'pattern', 'nocase', 'offset', 'depth')
+
+    def __init__(self, rule_id, pattern, nocase=False, offset=0, depth=None):
+        self.rule_id = rule_id
+        self.pattern = pattern
+        self.nocase = nocase
+        self.offset = offset
+        self.depth = depth
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError("'offset' must be a non-negative integer")
+        if depth is not None:
+            if not isinstance(depth, int) or depth < len(pattern):
+                raise ValueError("'depth' must be an integer at least as long as the content")
+
+    @property
+    def limit(self):
+        """Payload position the match must end by, or None."""
+        return None if self.depth is None else self.offset + self.depth
+
+
+class AhoCorasick:
+    def __init__(self, patterns, nocase=False):
+        """
+        Builds an Aho-Corasick automaton that finds all patterns in one pass.
+
+        The failure links are folded into the transitions, except those back to
+        the start state: each state holds its own and its failure chain's
+        transitions, and a byte without one continues from the start state.
+        This keeps the scan to one or two dict lookups per byte without the
+        memory of a full 256-way table per state.
+
+        :param patterns: List of (pattern bytes, output) pairs.
+        :param nocase: Match ASCII letters case-insensitively.
+        """
+        self.nocase = nocase
+        goto = [{}]
+        outputs = [[]]
+        for pattern, output in patterns:
+            if nocase:
+                pattern = pattern.lower()
+            state = 0
+            for byte in pattern:
+                following = goto[state].get(byte)
+                if following is None:
+                    following = len(goto)
+                    goto[state][byte] = following
+                    goto.append({})
+                    outputs.append([])
+                state = following
+            outputs[state].append(output)
+
+        # Breadth-first, so failure states are complete before the states that use them
+        fail = [0] * len(goto)
+        transitions = [dict(edges) for edges in goto]
+        pending = deque(goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for byte, following in goto[state].items():
+                target = fail[state]
+                while target and byte not in goto[target]:
+                    target = fail[target]
+                fail[following] = goto[target].get(byte, 0)
+                outputs[following] = outputs[following] + outputs[fail[following]]
+                pending.append(following)
+            if fail[state]:
+                for byte, following in transitions[fail[state]].items():
+                    transitions[state].setdefault(byte, following)
+
+        if nocase:
+            # Both cases of a letter lead to the same state, so input needs no folding
+            for edges in transitions:
+                for byte in [byte for byte in edges if byte in _UPPER]:
+                    edges[_UPPER[byte]] = edges[byte]
+
+        self.transitions = transitions
+        self.outputs = [tuple(output) if output else None for output in outputs]
+
+    def __len__(self):
+        return len(self.transitions)
+
+    def scan(self, view):
+        """
+        Finds the patterns in a buffer.
+
+        :param view: memoryview (or bytes) to scan.
+        :return: Iterator of (end position, output) for every occurrence.
+        """
+        transitions = self.transitions
+        start = transitions[0]
+        outputs = self.outputs
+        state = 0
+        position = 0
+        for byte in view:
+            position += 1
+            following = transitions[state].get(byte)
+            state = following if following is not None else start.get(byte, 0)
+            found = outputs[state]
+            if found is not None:
+                for output in found:
+                    yield position, output
+
+
+class PayloadMatcher:
+    def __init__(self, patterns, automaton_threshold=256):
+        """
+        Compiles payload signatures into Aho-Corasick automata (one for
+        case-sensitive and one for case-insensitive patterns), so each payload
+        is scanned once regardless of the number of signatures.
+
+        The automaton walks the payload in Python, so for small signature sets
+        one C-level bytes.find per signature is faster; those are searched
+        that way instead (see benchmark.py payload for the crossover).
+
+        :param patterns: List of PayloadPatterns.
+        :param automaton_threshold: Minimum number of signatures for the automata to be used.
+        """
+        self.patterns = list(patterns)
+        self.automata = []
+        if len(self.patterns) >= automaton_threshold:
+            groups = {False: [], True: []}
+            for pattern in self.patterns:
+                groups[pattern.nocase].append(
+                    (pattern.pattern, (pattern.rule_id, len(pattern.pattern), pattern.offset, pattern.limit)))
+            self.automata = [AhoCorasick(group, nocase) for nocase, group in groups.items() if group]
+        self.has_nocase = any(pattern.nocase for pattern in self.patterns)
+        self.searches = [(pattern.rule_id, pattern.pattern.lower() if pattern.nocase else pattern.pattern,
+                          pattern.nocase, pattern.offset, pattern.limit) for pattern in self.patterns]
+
+        # Nothing past the deepest limited match can match, unless some pattern is unlimited
+        limits = [pattern.limit for pattern in self.patterns]
+        self.scan_limit = None if None in limits or not limits else max(limits)
+        self.max_length = max((len(pattern.pattern) for pattern in self.patterns), default=1)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def scan(self, data, start=0, end=None, position=0, fresh=0):
+        """
+        Scans one payload, or the part of a reassembled stream around its newest bytes.
+
+        :param data: Buffer holding the payload (e.g. the whole frame).
+        :param start: Position in data where the scanned region starts.
+        :param end: Position in data where it ends (default: the end of data).
+        :param position: Payload or stream position of data[start], which offset
+                         and depth are checked against.
+        :param fresh: Only matches ending after this position are reported, so
+                      stream bytes that were already inspected are not reported again.
+        :return: Set of ids of the rules whose content was found within their offset/depth.
+        """
+        if end is None:
+            end = len(data)
+        hits = set()
+        if self.scan_limit is not None:
+            if fresh >= self.scan_limit:
+                return hits
+            end = min(end, start + self.scan_limit - position)
+        if end <= start:
+            return hits
+
+        if not self.automata:
+            if not isinstance(data, (bytes, bytearray)):
+                data = bytes(data)
+            lowered = data[start:end].lower() if self.has_nocase else None
+            for rule_id, pattern, nocase, offset, limit in self.searches:
+                low = start + max(0, offset - position, fresh - len(pattern) + 1 - position)
+                high = end if limit is None else min(end, start + limit - position)
+                if high - low < len(pattern):
+                    continue
+                if nocase:
+                    found = lowered.find(pattern, low - start, high - start)
+                else:
+                    found = data.find(pattern, low, high)
+                if found >= 0:
+                    hits.add(rule_id)
+            return hits
+
+        view = memoryview(data)[start:end]
+        for automaton in self.automata:
+            for match_end, (rule_id, length, offset, limit) in automaton.scan(view):
+                match_end += position
+                if (match_end - length >= offset and match_end > fresh and
+                        (limit is None or match_end <= limit)):
+                    hits.add(rule_id)
+        return hits
+
+    def matches(self, features):
+        """
+        Returns the rule ids whose content is in the packet's payload, scanning
+        the payload on first use and caching the result in the features.
+
+        With stream reassembly the new in-order bytes of the stream are scanned
+        together with enough of the preceding bytes to find contents split
+        across segments, and offset/depth are positions in the stream.
+
+        :param features: Dictionary containing packet features, including
+                         'packet_data', 'payload_offset' and 'payload_end', or
+                         'stream_data', 'stream_end' and 'stream_new'.
+        """
+        cached = features.get('payload_matches')
+        if cached is not None and cached[0] is self:
+            return cached[1]
+        if 'stream_data' in features:
+            data = features['stream_data']
+            if data:
+                new = features['stream_new']
+                start = max(0, len(data) - new - self.max_length + 1)
+                stream_start = features['stream_end'] - len(data)
+                hits = self.scan(data, start, len(data), stream_start + start, features['stream_end'] - new)
+            else:
+                hits = set()  # Retransmitted or out-of-order segment, nothing new to inspect
+        else:
+            data = features.get('packet_data')
+            hits = self.scan(data, features.get('payload_offset', 0),
+                             features.get('payload_end')) if data else set()
+        features['payload_matches'] = (self, hits)
+        return hits
+
+    def check(self, rule_id):
+        """
+        Builds the rule check for one payload rule.
+        """
+        def check(features):
+            return rule_id in self.matches(features)
+
+        return check
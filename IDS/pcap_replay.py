@@ -0,0 +1,234 @@
+from packet_capture import PacketCapture
+from packet_decoder import dissect
+import threading
+import struct
+import queue
+import mmap
+import time
+
+# Classic pcap magic numbers (microsecond and nanosecond resolution)
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+
+# pcapng block types
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_OPB = 0x00000002
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_OPT_IF_TSRESOL = 9
+
+
+def iter_pcap_frames(pcap_file):
+    """
+    Streams frames from a pcap or pcapng file through a read-only memory map,
+    so multi-GB captures are paged in on demand instead of loaded up front.
+
+    :param pcap_file: Path to the pcap or pcapng file.
+    :return: Generator of (timestamp, linktype, frame_bytes) tuples.
+    """
+    with open(pcap_file, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # Empty file, nothing to replay
+
+        try:
+            if len(mm) >= 4 and struct.unpack_from('<I', mm, 0)[0] == PCAPNG_SHB:
+                yield from _iter_pcapng(mm)
+            else:
+                yield from _iter_pcap(mm)
+        finally:
+            mm.close()
+
+
+def _iter_pcap(mm):
+    """
+    Walks the records of a classic pcap file.
+
+    :param mm: Memory map of the whole file.
+    """
+    if len(mm) < 24:
+        raise ValueError("File is too short to be a pcap file")
+
+    magic = struct.unpack_from('<I', mm, 0)[0]
+    if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+        endian = '<'
+    else:
+        magic = struct.unpack_from('>I', mm, 0)[0]
+        if magic not in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            raise ValueError("Not a pcap or pcapng file")
+        endian = '>'
+
+    divisor = 1e9 if magic == PCAP_MAGIC_NSEC else 1e6
+    linktype = struct.unpack_from(endian + 'I', mm, 20)[0] & 0x0FFFFFFF
+    record = struct.Struct(endian + 'IIII')
+
+    offset = 24
+    size = len(mm)
+    while offset + 16 <= size:
+        ts_sec, ts_frac, cap_len, _ = record.unpack_from(mm, offset)
+        offset += 16
+        if offset + cap_len > size:
+            break  # Truncated trailing record
+        yield ts_sec + ts_frac / divisor, linktype, mm[offset:offset + cap_len]
+        offset += cap_len
+
+
+def _iter_pcapng(mm):
+    """
+    Walks the blocks of a pcapng file, yielding frames from enhanced, simple
+    and obsolete packet blocks.
+
+    :param mm: Memory map of the whole file.
+    """
+    endian = '<'
+    interfaces = []  # (linktype, timestamp divisor) per interface id
+    last_ts = 0.0
+    offset = 0
+    size = len(mm)
+
+    while offset + 12 <= size:
+        if struct.unpack_from('<I', mm, offset)[0] == PCAPNG_SHB:
+            # A new section may switch byte order and resets interface ids
+            bom = struct.unpack_from('<I', mm, offset + 8)[0]
+            endian = '<' if bom == PCAPNG_BYTE_ORDER_MAGIC else '>'
+            interfaces = []
+
+        block_type, block_len = struct.unpack_from(endian + 'II', mm, offset)
+        if block_len < 12 or offset + block_len > size:
+            break  # Corrupt or truncated block
+
+        if block_type == PCAPNG_IDB:
+            linktype = struct.unpack_from(endian + 'H', mm, offset + 8)[0]
+            divisor = _idb_ts_divisor(mm, endian, offset + 16, offset + block_len - 4)
+            interfaces.append((linktype, divisor))
+
+        elif block_type == PCAPNG_EPB:
+            iface, ts_high, ts_low, cap_len, _ = struct.unpack_from(endian + 'IIIII', mm, offset + 8)
+            linktype, divisor = interfaces[iface] if iface < len(interfaces) else (1, 1e6)
+            last_ts = ((ts_high << 32) | ts_low) / divisor
+            start = offset + 28
+            yield last_ts, linktype, mm[start:start + cap_len]
+
+        elif block_type == PCAPNG_SPB:
+            # Simple packet blocks carry no timestamp; reuse the previous one
+            orig_len = struct.unpack_from(endian + 'I', mm, offset + 8)[0]
+            cap_len = min(orig_len, block_len - 16)
+            linktype = interfaces[0][0] if interfaces else 1
+            start = offset + 12
+            yield last_ts, linktype, mm[start:start + cap_len]
+
+        elif block_type == PCAPNG_OPB:
+            iface, _, ts_high, ts_low, cap_len, _ = struct.unpack_from(endian + 'HHIIII', mm, offset + 8)
+            linktype, divisor = interfaces[iface] if iface < len(interfaces) else (1, 1e6)
+            last_ts = ((ts_high << 32) | ts_low) / divisor
+            start = offset + 28
+            yield last_ts, linktype, mm[start:start + cap_len]
+
+        offset += block_len
+
+
+def _idb_ts_divisor(mm, endian, offset, end):
+    """
+    Reads the if_tsresol option of an interface description block.
+
+    :return: Number of timestamp units per second (default microseconds).
+    """
+    while offset + 4 <= end:
+        code, length = struct.unpack_from(endian + 'HH', mm, offset)
+        if code == 0:
+            break
+        if code == PCAPNG_OPT_IF_TSRESOL and length >= 1:
+            resol = mm[offset + 4]
+            if resol & 0x80:
+                return float(2 ** (resol & 0x7F))
+            return float(10 ** resol)
+        offset += 4 + ((length + 3) & ~3)
+    return 1e6
+
+
+class PcapReplayCapture(PacketCapture):
+    def __init__(self, pcap_file, speed=None, queue_size=10000, raw=False):
+        """
+        Initializes a replay source that feeds packets from a capture file
+        through the same interface as the live PacketCapture.
+
+        :param pcap_file: Path to the pcap or pcapng file to replay.
+        :param speed: None to replay as fast as possible, or a multiplier of the
+                      original capture speed (e.g. 1.0 for real time, 10.0 for 10x).
+        :param queue_size: Maximum number of queued packets before the reader waits
+                           for the consumer.
+        :param raw: If True, frames are queued as PacketRecords from the fast
+                    header decoder instead of Scapy packets.
+        """
+        super().__init__(interface=pcap_file, raw=raw, queue_size=queue_size)
+        self.pcap_file = pcap_file
+        self.speed = speed
+
+        # Replay statistics
+        self.packets_read = 0
+        self.replay_elapsed = 0.0
+
+    def _enqueue(self, item):
+        """
+        Queues a replayed packet, waiting for the consumer instead of dropping it.
+
+        :param item: Scapy packet or PacketRecord.
+        """
+        while not self.stop_capture.is_set():
+            try:
+                self.packet_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def start_capture(self):
+        """
+        Starts replaying the capture file in a separate thread.
+        """
+        if self.capture_thread and self.capture_thread.is_alive():
+            self.logger.warning("Replay thread is already running.")
+            return
+
+        self.finished.clear()
+        self.packet_queue.reopen()
+        self.capture_thread = threading.Thread(target=self._replay, daemon=True)
+        self.capture_thread.start()
+
+        mode = "as fast as possible" if not self.speed else f"at {self.speed}x original speed"
+        self.logger.info(f"Replaying {self.pcap_file} {mode}")
+
+    def _replay(self):
+        """Reads frames from the capture file, dissects and paces them."""
+        first_ts = None
+        wall_start = time.perf_counter()
+
+        try:
+            for ts, linktype, frame in iter_pcap_frames(self.pcap_file):
+                if self.stop_capture.is_set():
+                    break
+
+                if self.speed:
+                    if first_ts is None:
+                        first_ts = ts
+                    delay = wall_start + (ts - first_ts) / self.speed - time.perf_counter()
+                    if delay > 0.001:
+                        time.sleep(delay)
+
+                self.packets_read += 1
+                if self.raw:
+                    self.frame_callback(frame, ts, linktype)
+                    continue
+
+                # Keep capture timestamps so flow rates stay correct
+                self.packet_callback(dissect(frame, ts, linktype))
+        except Exception as e:
+            self.logger.error(f"Error during pcap replay: {e}")
+        finally:
+            self.replay_elapsed = time.perf_counter() - wall_start
+            rate = self.packets_read / self.replay_elapsed if self.replay_elapsed > 0 else 0.0
+            self.logger.info(f"Replay finished: {self.packets_read} packets read "
+                             f"in {self.replay_elapsed:.2f}s ({rate:.0f} packets/sec)")
+            self._finish()
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import math
+
+# Time windows (in seconds) the rates are tracked over
+RATE_WINDOWS = (1.0, 10.0, 60.0)
+
+
+class RateCounter:
+    """
+    Exponentially decayed packet and byte counters over several time windows.
+
+    Each update decays the counters by exp(-dt / window) and adds the new
+    packet, so a counter holds roughly the traffic seen in the last window
+    and count / window is the current rate. Updates are O(1) per window and
+    need no per-packet history.
+    """
+    __slots__ = ('last_time', 'packets', 'bytes')
+
+    def __init__(self, windows=RATE_WINDOWS):
+        self.last_time = None
+        self.packets = [0.0] * len(windows)
+        self.bytes = [0.0] * len(windows)
+
+    def update(self, timestamp, length, windows=RATE_WINDOWS):
+        """
+        Accounts one packet.
+
+        :param timestamp: Packet capture timestamp.
+        :param length: Packet length in bytes.
+        :param windows: Windows the counter was created with.
+        """
+        packets = self.packets
+        byte_counts = self.bytes
+        last_time = self.last_time
+
+        if last_time is not None and timestamp > last_time:
+            dt = float(timestamp - last_time)
+            for i, window in enumerate(windows):
+                decay = math.exp(-dt / window)
+                packets[i] *= decay
+                byte_counts[i] *= decay
+
+        if last_time is None or timestamp > last_time:
+            self.last_time = timestamp
+
+        for i in range(len(windows)):
+            packets[i] += 1.0
+            byte_counts[i] += length
+
+    def packet_rates(self, windows=RATE_WINDOWS):
+        """
+        Returns the packets/sec rate for each window as of the last update.
+        """
+        return [count / window for count, window in zip(self.packets, windows)]
+
+    def byte_rates(self, windows=RATE_WINDOWS):
+        """
+        Returns the bytes/sec rate for each window as of the last update.
+        """
+        return [count / window for count, window in zip(self.bytes, windows)]
+
+
+class HostRateTable:
+    def __init__(self, max_hosts=65536, windows=RATE_WINDOWS):
+        """
+        Initializes a bounded table of per-host rate counters.
+
+        :param max_hosts: Maximum number of hosts tracked; the least recently
+                          seen host is dropped when the table is full.
+        :param windows: Time windows (in seconds) to track rates over.
+        """
+        self.counters = OrderedDict()
+        self.max_hosts = max_hosts
+        self.windows = windows
+        self.evicted = 0
+
+    def update(self, host, timestamp, length):
+        """
+        Accounts one packet to a host.
+
+        :param host: Host address.
+        :param timestamp: Packet capture timestamp.
+        :param length: Packet length in bytes.
+        :return: The host's RateCounter.
+        """
+        counters = self.counters
+        counter = counters.get(host)
+        if counter is None:
+            if len(counters) >= self.max_hosts:
+                counters.popitem(last=False)
+                self.evicted += 1
+            counter = RateCounter(self.windows)
+            counters[host] = counter
+        else:
+            counters.move_to_end(host)
+
+        counter.update(timestamp, length, self.windows)
+        return counter
+
+    def get(self, host):
+        return self.counters.get(host)
+
+    def __len__(self):
+        return len(self.counters)
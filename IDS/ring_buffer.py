@@ -0,0 +1,196 @@
+import threading
+import queue
+import time
+
+# Overflow policies
+DROP_NEWEST = 'drop_newest'
+DROP_OLDEST = 'drop_oldest'
+SAMPLE = 'sample'
+OVERFLOW_POLICIES = (DROP_NEWEST, DROP_OLDEST, SAMPLE)
+
+
+class PacketRing:
+    def __init__(self, capacity=65536, policy=DROP_NEWEST, sample_rate=8, sample_threshold=0.8,
+                 key_func=None, on_overload=None, overload_rearm=10.0):
+        """
+        Initializes a bounded, preallocated ring buffer between the capture thread
+        and the consumer. It is a drop-in replacement for queue.Queue (put, get,
+        get_nowait, empty, qsize) with an overflow policy for non-blocking offers.
+
+        :param capacity: Number of packet slots.
+        :param policy: What offer() does when the ring is full: 'drop_newest' drops the
+                       incoming packet, 'drop_oldest' overwrites the oldest queued one,
+                       'sample' keeps 1-in-N packets per flow once the ring is filling up
+                       (and drops the newest if it is still full).
+        :param sample_rate: N for the 'sample' policy.
+        :param sample_threshold: Fill ratio above which the 'sample' policy starts sampling.
+        :param key_func: Function returning a packet's flow key (used by 'sample').
+        :param on_overload: Optional callback(stats) run when packets start being dropped.
+        :param overload_rearm: Seconds without drops before another overload is reported.
+        """
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}', expected one of {OVERFLOW_POLICIES}")
+        if policy == SAMPLE and key_func is None:
+            raise ValueError("The 'sample' policy needs a key_func returning the flow key")
+
+        self.capacity = capacity
+        self.policy = policy
+        self.sample_rate = sample_rate
+        self.sample_start = int(capacity * sample_threshold)
+        self.key_func = key_func
+        self.on_overload = on_overload
+        self.overload_rearm = overload_rearm
+
+        self.slots = [None] * capacity
+        self.head = 0
+        self.size = 0
+        self.sample_counters = [0] * 4096
+
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+
+        # Accounting
+        self.enqueued = 0
+        self.dropped = 0
+        self.high_water = 0
+        self.overloaded = False
+        self.last_drop_time = 0.0
+
+        # Set by the producer once it is done, so consumers stop waiting
+        self.closed = False
+
+    def _append(self, item):
+        """Stores an item at the tail. Must hold the lock and have room."""
+        self.slots[(self.head + self.size) % self.capacity] = item
+        self.size += 1
+        self.enqueued += 1
+        if self.size > self.high_water:
+            self.high_water = self.size
+        self.not_empty.notify()
+
+    def _note_drop(self):
+        """Counts a drop. Must hold the lock; returns True if an overload should be reported."""
+        self.dropped += 1
+        now = time.monotonic()
+        report = not self.overloaded or now - self.last_drop_time >= self.overload_rearm
+        self.overloaded = True
+        self.last_drop_time = now
+        return report
+
+    def offer(self, item):
+        """
+        Enqueues an item without blocking, applying the overflow policy.
+
+        :param item: Packet or PacketRecord.
+        :return: True if the item was enqueued.
+        """
+        report = False
+        with self.lock:
+            if self.policy == SAMPLE and self.size >= self.sample_start:
+                counters = self.sample_counters
+                slot = hash(self.key_func(item)) % len(counters)
+                counters[slot] += 1
+                if (counters[slot] - 1) % self.sample_rate:  # Keep the first of every N
+                    report = self._note_drop()
+                    accepted = False
+                else:
+                    accepted = True
+            else:
+                accepted = True
+
+            if accepted and self.size >= self.capacity:
+                if self.policy == DROP_OLDEST:
+                    self.slots[self.head] = None
+                    self.head = (self.head + 1) % self.capacity
+                    self.size -= 1
+                    report = self._note_drop()
+                else:
+                    report = self._note_drop()
+                    accepted = False
+
+            if accepted:
+                self._append(item)
+
+        if report and self.on_overload:
+            self.on_overload(self.stats())
+        return accepted
+
+    def put(self, item, block=True, timeout=None):
+        """
+        Enqueues an item, waiting for space like queue.Queue.put (no drops).
+
+        :raises queue.Full: If no space became available in time.
+        """
+        with self.not_full:
+            if self.size >= self.capacity:
+                if not block:
+                    raise queue.Full
+                if not self.not_full.wait_for(lambda: self.size < self.capacity, timeout):
+                    raise queue.Full
+            self._append(item)
+
+    def get(self, block=True, timeout=None):
+        """
+        Removes and returns the oldest item like queue.Queue.get.
+
+        :raises queue.Empty: If no item became available in time, or at once if the
+                             ring is empty and closed.
+        """
+        with self.not_empty:
+            if not self.size:
+                if not block:
+                    raise queue.Empty
+                if not self.not_empty.wait_for(lambda: self.size or self.closed, timeout) or not self.size:
+                    raise queue.Empty
+            item = self.slots[self.head]
+            self.slots[self.head] = None
+            self.head = (self.head + 1) % self.capacity
+            self.size -= 1
+            self.not_full.notify()
+            return item
+
+    def close(self):
+        """
+        Marks the end of the input: waiting consumers wake up, and gets on the
+        empty ring fail at once instead of waiting out their timeout.
+        """
+        with self.lock:
+            self.closed = True
+            self.not_empty.notify_all()
+
+    def reopen(self):
+        """
+        Clears close() when a producer starts again.
+        """
+        with self.lock:
+            self.closed = False
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        return self.size
+
+    def empty(self):
+        return not self.size
+
+    def full(self):
+        return self.size >= self.capacity
+
+    def stats(self):
+        """
+        Returns the ring's depth and exact enqueue/drop counters.
+        """
+        with self.lock:
+            if self.overloaded and time.monotonic() - self.last_drop_time >= self.overload_rearm:
+                self.overloaded = False
+            return {
+                'capacity': self.capacity,
+                'policy': self.policy,
+                'depth': self.size,
+                'high_water': self.high_water,
+                'enqueued': self.enqueued,
+                'dropped': self.dropped,
+                'overloaded': self.overloaded
+            }
@@ -0,0 +1,353 @@
+from functools import lru_cache
+from payload_matcher import PayloadMatcher, PayloadPattern, parse_content
+import ipaddress
+import operator
+import json
+import os
+
+PROTOCOLS = {'icmp': 1, 'tcp': 6, 'udp': 17, 'icmpv6': 58}
+
+TCP_FLAG_BITS = {'F': 0x01, 'S': 0x02, 'R': 0x04, 'P': 0x08, 'A': 0x10,
+                 'U': 0x20, 'E': 0x40, 'C': 0x80, 'N': 0x100}
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+RULE_FIELDS = {'id', 'description', 'protocol', 'tcp_flags', 'src_port', 'dst_port',
+               'src_cidr', 'dst_cidr', 'conditions', 'confidence', 'enabled',
+               'content', 'content_hex', 'nocase', 'offset', 'depth'}
+
+BASELINE_FIELDS = {'max_packet_size', 'max_packet_rate', 'max_byte_rate'}
+
+# Wildcard combinations of the indexed fields (protocol, tcp_flags, dst_port)
+INDEX_MASKS = [(p, f, d) for p in (True, False) for f in (True, False) for d in (True, False)]
+
+
+@lru_cache(maxsize=65536)
+def _ip_to_int(address):
+    ip = ipaddress.ip_address(address)
+    return ip.version, int(ip)
+
+
+def parse_tcp_flags(value):
+    """
+    Converts a TCP flag specification ("SA", "S", 18) into its integer value.
+
+    :param value: Flag letters (FSRPAUECN) or an integer.
+    :return: Integer flag value.
+    """
+    if isinstance(value, int):
+        return value
+    flags = 0
+    for letter in str(value).upper():
+        if letter not in TCP_FLAG_BITS:
+            raise ValueError(f"Unknown TCP flag '{letter}' in '{value}'")
+        flags |= TCP_FLAG_BITS[letter]
+    return flags
+
+
+def load_rule_file(path):
+    """
+    Loads declarative rule definitions from a JSON or YAML file.
+
+    :param path: Path to a .json, .yml or .yaml rule file.
+    :return: List of rule definition dictionaries.
+    """
+    return load_config(path)['rules']
+
+
+def load_config(path):
+    """
+    Loads a detection config file holding rule definitions and, optionally,
+    anomaly baselines.
+
+    :param path: Path to a .json, .yml or .yaml config file.
+    :return: Dictionary with 'rules' (list) and 'baselines' (dict, possibly empty).
+    """
+    with open(path, 'r') as f:
+        text = f.read()
+
+    if os.path.splitext(path)[1].lower() in ('.yml', '.yaml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("PyYAML is required to load YAML rule files (pip install pyyaml)")
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+
+    baselines = {}
+    if isinstance(data, dict):
+        baselines = data.get('baselines') or {}
+        data = data.get('rules', [])
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: expected a list of rules or a mapping with a 'rules' list")
+    validate_baselines(baselines)
+    return {'rules': data, 'baselines': baselines}
+
+
+def validate_baselines(baselines):
+    """
+    Checks that anomaly baselines only contain known, positive numeric values.
+
+    :param baselines: Dictionary of baseline values.
+    """
+    if not isinstance(baselines, dict):
+        raise ValueError("'baselines' must be a mapping")
+    unknown = set(baselines) - BASELINE_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown baseline(s) {sorted(unknown)}")
+    for name, value in baselines.items():
+        if not isinstance(value, (int, float)) or value <= 0:
+            raise ValueError(f"Baseline '{name}' must be a positive number")
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    return value if isinstance(value, list) else [value]
+
+
+def _compile_cidrs(field, cidrs):
+    """
+    Builds a predicate testing whether the address in features[field] is in any of the networks.
+    """
+    networks = []
+    for cidr in cidrs:
+        network = ipaddress.ip_network(cidr, strict=False)
+        networks.append((network.version, int(network.network_address), int(network.netmask)))
+
+    def check(features):
+        address = features.get(field)
+        if address is None:
+            return False
+        try:
+            version, value = _ip_to_int(address)
+        except ValueError:
+            return False
+        for net_version, net_address, net_mask in networks:
+            if version == net_version and value & net_mask == net_address:
+                return True
+        return False
+
+    return check
+
+
+def _compile_condition(condition):
+    """
+    Builds a predicate for one feature threshold condition.
+    """
+    if not isinstance(condition, dict) or not {'feature', 'op', 'value'} <= set(condition):
+        raise ValueError(f"Condition must have 'feature', 'op' and 'value': {condition}")
+    op = OPERATORS.get(condition['op'])
+    if op is None:
+        raise ValueError(f"Unknown operator '{condition['op']}'")
+    feature = condition['feature']
+    value = condition['value']
+    if not isinstance(value, (int, float)):
+        raise ValueError(f"Condition value for '{feature}' must be numeric")
+
+    def check(features):
+        actual = features.get(feature)
+        return actual is not None and op(actual, value)
+
+    return check
+
+
+class CompiledRule:
+    """
+    A rule reduced to its index keys and a predicate over the remaining fields.
+
+    payload holds the PayloadPattern of a payload rule; its content check is
+    added by the RuleSet, after the cheaper header checks.
+    """
+    __slots__ = ('rule_id', 'order', 'confidence', 'checks', 'keys', 'payload')
+
+    def __init__(self, rule_id, order, confidence, checks, keys, payload=None):
+        self.rule_id = rule_id
+        self.order = order
+        self.confidence = confidence
+        self.checks = checks
+        self.keys = keys
+        self.payload = payload
+
+    def matches(self, features):
+        for check in self.checks:
+            if not check(features):
+                return False
+        return True
+
+
+def compile_rule(definition, order=0):
+    """
+    Validates a declarative rule definition and compiles it.
+
+    :param definition: Rule dictionary as loaded from a rule file.
+    :param order: Position of the rule, used to keep the output order stable.
+    :return: A CompiledRule, or None if the rule is disabled.
+    """
+    if not isinstance(definition, dict) or 'id' not in definition:
+        raise ValueError(f"Rule must be a mapping with an 'id': {definition}")
+    rule_id = definition['id']
+    unknown = set(definition) - RULE_FIELDS
+    if unknown:
+        raise ValueError(f"Rule '{rule_id}': unknown field(s) {sorted(unknown)}")
+    if not definition.get('enabled', True):
+        return None
+
+    # Indexed fields
+    protocol = definition.get('protocol')
+    if protocol is not None:
+        if str(protocol).lower() not in PROTOCOLS:
+            raise ValueError(f"Rule '{rule_id}': unknown protocol '{protocol}'")
+        protocol = PROTOCOLS[str(protocol).lower()]
+    flags = definition.get('tcp_flags')
+    if flags is not None:
+        flags = parse_tcp_flags(flags)
+        if protocol is None:
+            protocol = PROTOCOLS['tcp']  # Other protocols have no flags to match
+    dst_ports = _as_list(definition.get('dst_port')) or [None]
+    for port in dst_ports:
+        if port is not None and not (isinstance(port, int) and 0 <= port <= 65535):
+            raise ValueError(f"Rule '{rule_id}': invalid destination port {port}")
+    keys = [(protocol, flags, port) for port in dst_ports]
+
+    # Remaining fields are checked on the candidate rules only
+    checks = []
+    src_ports = _as_list(definition.get('src_port'))
+    if src_ports:
+        src_port_set = frozenset(src_ports)
+        checks.append(lambda features: features.get('src_port') in src_port_set)
+    for field, feature in (('src_cidr', 'src_ip'), ('dst_cidr', 'dst_ip')):
+        cidrs = _as_list(definition.get(field))
+        if cidrs:
+            try:
+                checks.append(_compile_cidrs(feature, cidrs))
+            except ValueError as e:
+                raise ValueError(f"Rule '{rule_id}': {e}")
+    for condition in definition.get('conditions', []):
+        try:
+            checks.append(_compile_condition(condition))
+        except ValueError as e:
+            raise ValueError(f"Rule '{rule_id}': {e}")
+
+    # Payload content, matched by the rule set's Aho-Corasick automata
+    payload = None
+    try:
+        pattern = parse_content(definition)
+        if pattern is not None:
+            payload = PayloadPattern(rule_id, pattern, bool(definition.get('nocase', False)),
+                                     definition.get('offset', 0), definition.get('depth'))
+        elif {'nocase', 'offset', 'depth'} & set(definition):
+            raise ValueError("'nocase', 'offset' and 'depth' require 'content' or 'content_hex'")
+    except ValueError as e:
+        raise ValueError(f"Rule '{rule_id}': {e}")
+
+    confidence = definition.get('confidence', 1.0)
+    if not isinstance(confidence, (int, float)) or not 0.0 <= confidence <= 1.0:
+        raise ValueError(f"Rule '{rule_id}': confidence must be between 0 and 1")
+
+    return CompiledRule(rule_id, order, float(confidence), checks, keys, payload)
+
+
+class RuleSet:
+    def __init__(self, definitions=(), python_rules=None):
+        """
+        Compiles rules into an index keyed by (protocol, tcp_flags, dst_port).
+
+        Each packet only probes the index buckets for its own protocol, flag
+        combination and destination port (plus wildcard buckets), so the cost
+        per packet depends on the number of candidate rules rather than the
+        size of the rule set.
+
+        Payload rules ('content'/'content_hex') are indexed the same way; their
+        contents are compiled into one PayloadMatcher, and a packet's payload
+        is scanned once, only if one of its candidate rules passes its header
+        checks and needs the payload. Restricting payload rules by protocol
+        and port therefore also limits which packets are scanned.
+
+        :param definitions: Declarative rule definitions.
+        :param python_rules: Optional dict of {name: {'condition': callable}} rules,
+                             evaluated as wildcard rules unless they name a
+                             'protocol' (or a list of protocols).
+        """
+        self.index = {}
+        self.masks = []
+        self.rule_ids = []
+        self.payload_matcher = None
+
+        order = 0
+        seen = set()
+        for definition in definitions:
+            rule = compile_rule(definition, order)
+            order += 1
+            if rule is None:
+                continue
+            if rule.rule_id in seen:
+                raise ValueError(f"Duplicate rule id '{rule.rule_id}'")
+            seen.add(rule.rule_id)
+            self._add(rule)
+
+        for name, rule in (python_rules or {}).items():
+            if name in seen:
+                continue  # Declarative rules override code rules with the same name
+            seen.add(name)
+            protocols = [PROTOCOLS[protocol] for protocol in _as_list(rule.get('protocol')) or []] or [None]
+            self._add(CompiledRule(name, order, rule.get('confidence', 1.0),
+                                   [rule['condition']], [(protocol, None, None) for protocol in protocols]))
+            order += 1
+
+        payload_rules = [rule for rules in self.index.values() for rule in rules if rule.payload]
+        if payload_rules:
+            payload_rules = list({rule.rule_id: rule for rule in payload_rules}.values())
+            self.payload_matcher = PayloadMatcher([rule.payload for rule in payload_rules])
+            for rule in payload_rules:
+                rule.checks.append(self.payload_matcher.check(rule.rule_id))
+
+        # Only probe the wildcard combinations that some rule actually uses
+        used = set()
+        for key in self.index:
+            used.add((key[0] is not None, key[1] is not None, key[2] is not None))
+        self.masks = [mask for mask in INDEX_MASKS if mask in used]
+
+    def _add(self, rule):
+        for key in rule.keys:
+            self.index.setdefault(key, []).append(rule)
+        self.rule_ids.append(rule.rule_id)
+
+    def candidates(self, features):
+        """
+        Returns the rules whose indexed fields match the packet.
+        """
+        protocol = features.get('protocol', 6)
+        flags = int(features.get('tcp_flags', 0))
+        dst_port = features.get('dst_port')
+        index = self.index
+        candidates = []
+        for use_proto, use_flags, use_port in self.masks:
+            bucket = index.get((protocol if use_proto else None,
+                                flags if use_flags else None,
+                                dst_port if use_port else None))
+            if bucket:
+                candidates.extend(bucket)
+        return candidates
+
+    def match(self, features):
+        """
+        Evaluates the rule set against one packet's features.
+
+        :return: List of matching CompiledRules in rule order.
+        """
+        matched = [rule for rule in self.candidates(features) if rule.matches(features)]
+        if len(matched) > 1:
+            matched.sort(key=lambda rule: rule.order)
+        return matched
+
+    def __len__(self):
+        return len(self.rule_ids)
@@ -0,0 +1,60 @@
+import threading
+import logging
+import os
+
+
+class RuleWatcher:
+    def __init__(self, path, on_change, interval=1.0):
+        """
+        Initializes a watcher that polls a config file for changes.
+
+        :param path: Path of the file to watch.
+        :param on_change: Callback(path) run on the watcher thread when the file changes.
+        :param interval: Polling interval in seconds.
+        """
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_signature = self._signature()
+
+        self.logger = logging.getLogger(__name__)
+
+    def _signature(self):
+        """Returns what identifies the current file contents (mtime, size, inode)."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def start(self):
+        """
+        Starts polling in a background thread.
+        """
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.logger.info(f"Watching {self.path} for rule changes")
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            signature = self._signature()
+            if signature is None or signature == self.last_signature:
+                continue
+            self.last_signature = signature
+            try:
+                self.on_change(self.path)
+            except Exception as e:
+                self.logger.error(f"Error handling change of {self.path}: {e}")
+
+    def stop(self):
+        """
+        Stops polling.
+        """
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
@@ -0,0 +1,181 @@
+from sketches import HyperLogLog, CountMinSketch, TopK, hash64
+from collections import OrderedDict
+import logging
+
+SYN = 0x02
+ACK = 0x10
+RST = 0x04
+
+
+class ScanDetector:
+    def __init__(self, window=60.0, port_threshold=100, host_threshold=50,
+                 half_open_threshold=500, max_sources=4096, hll_precision=7,
+                 cms_width=2048, cms_depth=4, top_k=10, report_bits=65536,
+                 detect_scans=True, detect_floods=True):
+        """
+        Initializes the sketch-based port-scan and SYN-flood detector.
+
+        All state lives in fixed-size sketches and bitmaps that are reset every window, so
+        memory does not grow with the number of scanners or spoofed sources.
+
+        :param window: Length in seconds of the counting window.
+        :param port_threshold: Distinct destination ports per source that indicate a port scan.
+        :param host_threshold: Distinct destination hosts per source that indicate a host sweep.
+        :param half_open_threshold: Half-open SYNs per destination that indicate a SYN flood.
+        :param max_sources: Maximum number of sources with fan-out sketches.
+        :param hll_precision: HyperLogLog precision (2**precision registers per sketch).
+        :param cms_width: Width of the count-min sketches.
+        :param cms_depth: Depth of the count-min sketches.
+        :param top_k: Number of top offenders reported with each threat.
+        :param report_bits: Size of the bitmap remembering which sources and targets were
+                            already reported this window (a hash collision can hide a
+                            report until the next window).
+        :param detect_scans: Track per-source fan-out (port scans and host sweeps).
+        :param detect_floods: Track half-open SYNs per destination (SYN floods).
+        """
+        self.window = window
+        self.port_threshold = port_threshold
+        self.host_threshold = host_threshold
+        self.half_open_threshold = half_open_threshold
+        self.max_sources = max_sources
+        self.hll_precision = hll_precision
+        self.detect_scans = detect_scans
+        self.detect_floods = detect_floods
+
+        # Per-source fan-out: source -> [distinct ports sketch, distinct hosts sketch]
+        self.fanout = OrderedDict()
+        self.top_scanners = TopK(top_k)
+
+        # Half-open SYNs per destination and SYN senders
+        self.half_open = CountMinSketch(cms_width, cms_depth)
+        self.syn_sources = CountMinSketch(cms_width, cms_depth)
+        self.top_syn_sources = TopK(top_k)
+
+        self.window_start = None
+        self.report_bits = report_bits
+        self.reported = bytearray(report_bits // 8)
+
+        self.logger = logging.getLogger(__name__)
+
+    def inspect(self, features):
+        """
+        Updates the sketches with one packet and returns any scan or flood threats.
+
+        :param features: Packet features including addresses, ports and TCP flags.
+        :return: List of detected threats.
+        """
+        src = features.get('src_ip')
+        if src is None:
+            return []
+
+        timestamp = features['timestamp']
+        if self.window_start is None:
+            self.window_start = timestamp
+        elif timestamp - self.window_start >= self.window:
+            self.reset(timestamp)
+
+        threats = []
+        dst = features['dst_ip']
+        flags = int(features['tcp_flags'])
+
+        if self.detect_scans:
+            threat = self._update_fanout(src, dst, features['dst_port'])
+            if threat:
+                threats.append(threat)
+
+        if self.detect_floods:
+            threat = self._update_half_open(src, dst, flags, features.get('flow_packet_count'))
+            if threat:
+                threats.append(threat)
+
+        return threats
+
+    def _update_fanout(self, src, dst, dst_port):
+        """
+        Updates the fan-out sketches of a source and checks the scan thresholds.
+        """
+        sketches = self.fanout.get(src)
+        if sketches is None:
+            if len(self.fanout) >= self.max_sources:
+                self.fanout.popitem(last=False)
+            sketches = [HyperLogLog(self.hll_precision), HyperLogLog(self.hll_precision)]
+            self.fanout[src] = sketches
+        else:
+            self.fanout.move_to_end(src)
+
+        ports_sketch, hosts_sketch = sketches
+        changed = ports_sketch.add(dst_port)
+        changed = hosts_sketch.add(dst) or changed
+        if not changed:
+            return None
+
+        ports = ports_sketch.count()
+        hosts = hosts_sketch.count()
+        self.top_scanners.offer(src, round(max(ports, hosts)))
+
+        if ports >= self.port_threshold:
+            rule = 'port_scan'
+            ratio = ports / self.port_threshold
+        elif hosts >= self.host_threshold:
+            rule = 'host_sweep'
+            ratio = hosts / self.host_threshold
+        else:
+            return None
+
+        if not self._first_report(rule, src):
+            return None
+        self.logger.info(f"Scan detected from {src}: ~{ports:.0f} ports, ~{hosts:.0f} hosts")
+        return {
+            'type': 'scan',
+            'rule': rule,
+            'scanner': src,
+            'fanout_ports': round(ports),
+            'fanout_hosts': round(hosts),
+            'top_offenders': self.top_scanners.top(),
+            'confidence': min(1.0, 0.5 + ratio / 4.0)
+        }
+
+    def _update_half_open(self, src, dst, flags, flow_packet_count):
+        """
+        Updates the half-open SYN counts and checks the SYN flood threshold.
+        """
+        if flags & (SYN | ACK) == SYN:
+            half_open = self.half_open.add(dst, 1)
+            self.top_syn_sources.offer(src, self.syn_sources.add(src, 1))
+            if half_open >= self.half_open_threshold and self._first_report('syn_flood', dst):
+                self.logger.info(f"SYN flood detected against {dst}: ~{half_open} half-open")
+                return {
+                    'type': 'flood',
+                    'rule': 'syn_flood',
+                    'target': dst,
+                    'half_open': half_open,
+                    'top_offenders': self.top_syn_sources.top(),
+                    'confidence': min(1.0, 0.5 + half_open / (4.0 * self.half_open_threshold))
+                }
+        elif flags & RST or (flags == ACK and flow_packet_count == 2):
+            # Handshake completed or aborted, the connection is no longer half-open
+            self.half_open.add(dst, -1)
+        return None
+
+    def _first_report(self, rule, key):
+        """Marks (rule, key) as reported this window; returns False if it already was."""
+        bit = hash64((rule, key)) % self.report_bits
+        mask = 1 << (bit & 7)
+        if self.reported[bit >> 3] & mask:
+            return False
+        self.reported[bit >> 3] |= mask
+        return True
+
+    def reset(self, window_start):
+        """
+        Starts a new counting window.
+
+        :param window_start: Timestamp at which the new window begins.
+        """
+        self.window_start = window_start
+        self.fanout.clear()
+        self.top_scanners.clear()
+        self.half_open.clear()
+        self.syn_sources.clear()
+        self.top_syn_sources.clear()
+        self.reported = bytearray(self.report_bits // 8)
@@ -0,0 +1,419 @@
+from multiprocessing import shared_memory
+import multiprocessing
+import threading
+import logging
+import struct
+import queue
+import time
+from packet_decoder import decode, dissect, IDS_PROTOCOLS
+from packet_capture import PacketCapture
+from pcap_replay import PcapReplayCapture
+from rate_counter import HostRateTable, RATE_WINDOWS
+from scan_detector import ScanDetector
+from alert import AlertSystem
+from ids_store import IDSStore
+
+# Ring layout: producer position and consumer position on separate cache lines,
+# followed by the data area. Positions are monotonically increasing byte counts.
+_POSITION = struct.Struct('<Q')
+_WRITE_POS = 0
+_READ_POS = 64
+_DATA_START = 128
+
+# Each record: frame length, linktype, timestamp, the source host's decayed packet
+# and byte counts per rate window (all zero if not tracked), then the frame padded
+# to 8 bytes
+_RECORD = struct.Struct(f'<IId{2 * len(RATE_WINDOWS)}d')
+_NO_SOURCE_COUNTS = (0.0,) * (2 * len(RATE_WINDOWS))
+_WRAP_MARKER = 0xFFFFFFFF
+
+# Per-shard statistics slots in the shared stats array
+_STAT_PACKETS = 0
+_STAT_BYTES = 1
+_STAT_THREATS = 2
+_STAT_BUSY = 3
+_STATS_PER_SHARD = 4
+
+
+class FrameRing:
+    """
+    Single-producer, single-consumer ring buffer of raw frames in shared memory.
+
+    Frames are copied once into the ring by the capture process and once out of
+    it by the worker, instead of being pickled as Scapy objects.
+    """
+
+    def __init__(self, capacity=None, name=None):
+        """
+        Creates a new ring (capacity given) or attaches to an existing one (name given).
+
+        :param capacity: Size in bytes of the data area for a new ring.
+        :param name: Shared memory name of an existing ring.
+        """
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_DATA_START + capacity)
+            self.buf = self.shm.buf
+            _POSITION.pack_into(self.buf, _WRITE_POS, 0)
+            _POSITION.pack_into(self.buf, _READ_POS, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.buf = self.shm.buf
+        self.name = self.shm.name
+        self.capacity = capacity or (self.shm.size - _DATA_START)
+        self.write_pos = _POSITION.unpack_from(self.buf, _WRITE_POS)[0]
+        self.read_pos = _POSITION.unpack_from(self.buf, _READ_POS)[0]
+
+    def put(self, frame, timestamp, linktype, source_counts=_NO_SOURCE_COUNTS):
+        """
+        Appends a frame if there is room (producer side).
+
+        :return: False if the ring is full.
+        """
+        length = len(frame)
+        size = (_RECORD.size + length + 7) & ~7
+        capacity = self.capacity
+        offset = self.write_pos % capacity
+        wrap = capacity - offset < size
+        needed = size + (capacity - offset if wrap else 0)
+
+        read_pos = _POSITION.unpack_from(self.buf, _READ_POS)[0]
+        if self.write_pos + needed - read_pos > capacity:
+            return False
+
+        if wrap:
+            if capacity - offset >= 4:
+                struct.pack_into('<I', self.buf, _DATA_START + offset, _WRAP_MARKER)
+            self.write_pos += capacity - offset
+            offset = 0
+
+        start = _DATA_START + offset
+        _RECORD.pack_into(self.buf, start, length, linktype, timestamp, *source_counts)
+        self.buf[start + _RECORD.size:start + _RECORD.size + length] = frame
+        self.write_pos += size
+        # Publish only after the record is fully written
+        _POSITION.pack_into(self.buf, _WRITE_POS, self.write_pos)
+        return True
+
+    def get_batch(self, max_frames=256):
+        """
+        Removes up to max_frames frames (consumer side).
+
+        :return: List of (frame_bytes, timestamp, linktype, source_counts) tuples.
+        """
+        write_pos = _POSITION.unpack_from(self.buf, _WRITE_POS)[0]
+        capacity = self.capacity
+        frames = []
+
+        while self.read_pos < write_pos and len(frames) < max_frames:
+            offset = self.read_pos % capacity
+            if capacity - offset < 4 or struct.unpack_from('<I', self.buf, _DATA_START + offset)[0] == _WRAP_MARKER:
+                self.read_pos += capacity - offset
+                continue
+            start = _DATA_START + offset
+            length, linktype, timestamp, *source_counts = _RECORD.unpack_from(self.buf, start)
+            data_start = start + _RECORD.size
+            frames.append((bytes(self.buf[data_start:data_start + length]), timestamp, linktype,
+                           source_counts))
+            self.read_pos += (_RECORD.size + length + 7) & ~7
+
+        if frames:
+            _POSITION.pack_into(self.buf, _READ_POS, self.read_pos)
+        return frames
+
+    def depth(self):
+        """
+        Returns the number of bytes waiting in the ring.
+        """
+        write_pos = _POSITION.unpack_from(self.buf, _WRITE_POS)[0]
+        read_pos = _POSITION.unpack_from(self.buf, _READ_POS)[0]
+        return write_pos - read_pos
+
+    def close(self, unlink=False):
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _shard_worker(shard_id, ring_name, alert_queue, stats, stop_event, rule_file):
+    """
+    Worker process: owns one TrafficAnalyzer/DetectionEngine shard and processes
+    the frames hashed to it. Source rates and scan fan-out come from the
+    dispatcher, which sees all of a source's traffic.
+    """
+    from traffic_analyzer import TrafficAnalyzer
+    from detection_engine import DetectionEngine
+    from packet_decoder import record_from_packet
+
+    logging.getLogger('detection_engine').setLevel(logging.WARNING)
+    logging.getLogger('scan_detector').setLevel(logging.WARNING)
+
+    ring = FrameRing(name=ring_name)
+    analyzer = TrafficAnalyzer()
+    engine = DetectionEngine(rule_file=rule_file)
+    engine.scan_detector = ScanDetector(detect_scans=False)
+    source_rate_names = [(f'src_pkt_rate_{int(window)}s', f'src_byte_rate_{int(window)}s')
+                         for window in RATE_WINDOWS]
+    windows = len(RATE_WINDOWS)
+    base = shard_id * _STATS_PER_SHARD
+    packets = byte_count = threats_found = 0
+    busy = 0.0
+
+    try:
+        while True:
+            frames = ring.get_batch()
+            if not frames:
+                if stop_event.is_set() and ring.depth() == 0:
+                    break
+                time.sleep(0.0005)
+                continue
+
+            started = time.perf_counter()
+            for frame, timestamp, linktype, source_counts in frames:
+                record = decode(frame, timestamp, linktype)
+                if record is None:
+                    # Odd encapsulation: fall back to Scapy in the worker
+                    record = record_from_packet(dissect(frame, timestamp, linktype))
+                    if record is None:
+                        continue
+
+                packets += 1
+                byte_count += record.length
+                features = analyzer.analyze_packet(record)
+                if not features:
+                    continue
+                if source_counts[0]:
+                    # Replace this shard's partial view of the source with the dispatcher's
+                    for (pkt_name, byte_name), window, source_packets, source_bytes in zip(
+                            source_rate_names, RATE_WINDOWS, source_counts, source_counts[windows:]):
+                        features[pkt_name] = source_packets / window
+                        features[byte_name] = source_bytes / window
+                for threat in engine.detect_threats(features):
+                    threats_found += 1
+                    alert_queue.put((threat, {
+                        'source_ip': record.src,
+                        'destination_ip': record.dst,
+                        'source_port': record.sport,
+                        'destination_port': record.dport,
+                        'packet_time': float(record.time),
+                        'shard': shard_id
+                    }))
+
+            busy += time.perf_counter() - started
+            stats[base + _STAT_PACKETS] = packets
+            stats[base + _STAT_BYTES] = byte_count
+            stats[base + _STAT_THREATS] = threats_found
+            stats[base + _STAT_BUSY] = busy
+    finally:
+        ring.close()
+
+
+class ShardedIDS:
+    def __init__(self, workers=None, interface="eth0", pcap_file=None, replay_speed=None,
+                 rule_file=None, ring_bytes=16 * 1024 * 1024, stats_interval=10.0, alert_window=60.0,
+                 alert_dir=None, store_path=None, backend="scapy", bpf_filter=None):
+        """
+        Initializes a multi-process IDS that shards traffic by destination host across
+        worker processes.
+
+        The capture side hashes each frame's destination address to a worker, so
+        a flow, the destination's rate tables and its half-open SYN count all live
+        in one TrafficAnalyzer/DetectionEngine shard. Source-keyed state (source
+        rates and the port scan and host sweep sketches) spans destinations, so it
+        is tracked here, and the source rates travel to the workers with each
+        frame. A flood against one destination therefore loads a single worker.
+        Alerts from all workers are funneled back to a single AlertSystem writer
+        in this process.
+
+        :param workers: Number of worker processes (default: CPU count - 1).
+        :param interface: Network interface for live capture.
+        :param pcap_file: Optional capture file to replay instead of live capture.
+        :param replay_speed: Replay speed multiplier (None for as fast as possible).
+        :param rule_file: Optional rule file loaded by every worker's DetectionEngine.
+        :param ring_bytes: Size of each worker's shared-memory frame ring.
+        :param stats_interval: Seconds between per-shard statistics log lines.
+        :param alert_window: Suppression window for repeated alerts (0 to log every alert).
+        :param alert_dir: Optional directory for JSONL alert files instead of the alert log.
+        :param store_path: Optional SQLite store for alerts (flows stay in the worker processes
+                           and are not persisted).
+        :param backend: Live capture backend, 'scapy' or 'afpacket'.
+        :param bpf_filter: Kernel BPF filter for the afpacket backend.
+        """
+        self.workers = workers or max(1, multiprocessing.cpu_count() - 1)
+        self.rule_file = rule_file
+        self.ring_bytes = ring_bytes
+        self.stats_interval = stats_interval
+        self.replay = pcap_file is not None
+
+        if pcap_file:
+            self.packet_capture = PcapReplayCapture(pcap_file, speed=replay_speed, raw=True)
+        elif backend == "afpacket":
+            from afpacket_capture import AfPacketCapture
+            self.packet_capture = AfPacketCapture(interface, bpf_filter=bpf_filter)
+        else:
+            self.packet_capture = PacketCapture(interface, raw=True)
+        # Route raw frames to the shards instead of the capture queue
+        self.packet_capture.frame_callback = self.dispatch_frame
+
+        # The alert writer and store start threads, so they are created in start()
+        # once the workers are forked
+        self.alert_window = alert_window
+        self.alert_dir = alert_dir
+        self.store_path = store_path
+        self.store = None
+        self.alert_system = None
+
+        # Source-keyed state, which every shard would otherwise see a slice of
+        self.source_rates = HostRateTable()
+        self.scan_detector = ScanDetector(detect_floods=False)
+
+        self.rings = []
+        self.processes = []
+        self.alert_queue = None
+        self.stats = None
+        self.stop_event = None
+
+        # Capture-side counters per shard
+        self.dispatched = [0] * self.workers
+        self.ring_full_drops = [0] * self.workers
+
+        logging.basicConfig(level=logging.INFO)
+        self.logger = logging.getLogger(__name__)
+
+    def dispatch_frame(self, frame, timestamp, linktype, layer=None):
+        """
+        Hashes a raw frame's destination address and writes it to its shard's ring,
+        along with the source's rates.
+        """
+        record = decode(frame, timestamp, linktype)
+        if record is None:
+            shard = 0  # Undecodable frames go to shard 0 for Scapy fallback
+            source_counts = _NO_SOURCE_COUNTS
+        else:
+            shard = hash(record.dst) % self.workers
+            source_counts = self._track_source(record)
+
+        ring = self.rings[shard]
+        while not ring.put(frame, timestamp, linktype, source_counts):
+            if not self.replay or self.packet_capture.stop_capture.is_set():
+                # Live traffic cannot wait for a slow worker
+                self.ring_full_drops[shard] += 1
+                return
+            time.sleep(0.0002)
+        self.dispatched[shard] += 1
+
+    def _track_source(self, record):
+        """
+        Updates the source's rates and scan sketches, queueing any scan alert.
+
+        :return: The source's decayed packet and byte counts for the worker.
+        """
+        if record.proto not in IDS_PROTOCOLS:
+            return _NO_SOURCE_COUNTS
+        counter = self.source_rates.update(record.src, record.time, record.length)
+        features = {'src_ip': record.src, 'dst_ip': record.dst, 'dst_port': record.dport,
+                    'tcp_flags': record.tcp_flags, 'timestamp': record.time}
+        for threat in self.scan_detector.inspect(features):
+            self.alert_queue.put((threat, {
+                'source_ip': record.src,
+                'destination_ip': record.dst,
+                'source_port': record.sport,
+                'destination_port': record.dport,
+                'packet_time': float(record.time)
+            }))
+        return counter.packets + counter.bytes
+
+    def start(self):
+        """
+        Starts the workers and capture, and runs the alert writer until capture
+        finishes or the process is interrupted.
+        """
+        ctx = multiprocessing.get_context()
+        self.alert_queue = ctx.Queue(maxsize=100000)
+        self.stats = ctx.RawArray('d', self.workers * _STATS_PER_SHARD)
+        self.stop_event = ctx.Event()
+
+        for shard_id in range(self.workers):
+            ring = FrameRing(capacity=self.ring_bytes)
+            self.rings.append(ring)
+            process = ctx.Process(target=_shard_worker, daemon=True,
+                                  args=(shard_id, ring.name, self.alert_queue, self.stats,
+                                        self.stop_event, self.rule_file))
+            process.start()
+            self.processes.append(process)
+
+        self.logger.info(f"Started {self.workers} IDS worker processes")
+        self.store = IDSStore(self.store_path) if self.store_path else None
+        self.alert_system = AlertSystem(suppression_window=self.alert_window, alert_dir=self.alert_dir,
+                                        store=self.store)
+        started = time.perf_counter()
+        next_stats = started + self.stats_interval
+        self.packet_capture.start_capture()
+
+        try:
+            while True:
+                self._drain_alerts(timeout=0.2)
+                if time.perf_counter() >= next_stats:
+                    self._log_shard_stats()
+                    next_stats += self.stats_interval
+                if self.packet_capture.finished.is_set():
+                    break
+        except KeyboardInterrupt:
+            self.logger.info("KeyboardInterrupt detected. Shutting down IDS...")
+        finally:
+            self.packet_capture.stop()
+            self.stop_event.set()
+            while any(process.is_alive() for process in self.processes):
+                self._drain_alerts(timeout=0.1)
+            self._drain_alerts(timeout=0)
+            for process in self.processes:
+                process.join()
+            for ring in self.rings:
+                ring.close(unlink=True)
+
+            elapsed = time.perf_counter() - started
+            total = sum(shard['packets'] for shard in self.get_shard_stats())
+            self.logger.info(f"Processed {total} packets in {elapsed:.2f}s "
+                             f"({total / elapsed if elapsed > 0 else 0:.0f} packets/sec) "
+                             f"across {self.workers} workers")
+            self._log_shard_stats()
+            self.alert_system.close()
+            if self.store:
+                self.store.close()
+
+    def _drain_alerts(self, timeout):
+        """
+        Writes pending worker alerts through the single AlertSystem.
+        """
+        try:
+            while True:
+                threat, packet_info = self.alert_queue.get(timeout=timeout)
+                self.alert_system.generate_alert(threat, packet_info)
+                timeout = 0
+        except queue.Empty:
+            pass
+
+    def get_shard_stats(self):
+        """
+        Returns per-shard packet, byte, threat, busy-time, ring depth and drop counters.
+        """
+        shards = []
+        for shard_id in range(self.workers):
+            base = shard_id * _STATS_PER_SHARD
+            shards.append({
+                'shard': shard_id,
+                'dispatched': self.dispatched[shard_id],
+                'ring_full_drops': self.ring_full_drops[shard_id],
+                'ring_depth_bytes': self.rings[shard_id].depth() if self.rings[shard_id].buf is not None else 0,
+                'packets': int(self.stats[base + _STAT_PACKETS]),
+                'bytes': int(self.stats[base + _STAT_BYTES]),
+                'threats': int(self.stats[base + _STAT_THREATS]),
+                'busy_seconds': self.stats[base + _STAT_BUSY]
+            })
+        return shards
+
+    def _log_shard_stats(self):
+        for shard in self.get_shard_stats():
+            self.logger.info(f"Shard {shard['shard']}: {shard['packets']} packets, "
+                             f"{shard['threats']} threats, {shard['busy_seconds']:.2f}s busy, "
+                             f"{shard['ring_full_drops']} dropped")
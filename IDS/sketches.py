@@ -0,0 +1,140 @@
+import math
+
+MASK64 = (1 << 64) - 1
+
+
+def hash64(value, seed=0):
+    """
+    Returns a well-mixed 64-bit hash of a hashable value (splitmix64 finalizer
+    applied to Python's built-in hash).
+
+    :param value: Any hashable value.
+    :param seed: Seed to derive independent hash functions.
+    """
+    h = (hash(value) + seed * 0x9E3779B97F4A7C15) & MASK64
+    h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & MASK64
+    return h ^ (h >> 31)
+
+
+class HyperLogLog:
+    """
+    Fixed-size cardinality estimator (HyperLogLog with linear counting for
+    small cardinalities). Uses 2**precision one-byte registers.
+
+    The harmonic sum and the number of empty registers are maintained as
+    registers change, so count() is O(1).
+    """
+    __slots__ = ('precision', 'registers', 'inverse_sum', 'zeros')
+
+    def __init__(self, precision=8):
+        self.precision = precision
+        self.clear()
+
+    def add(self, value):
+        """
+        Adds a value to the set being counted.
+
+        :return: True if the estimate may have changed.
+        """
+        h = hash64(value)
+        bits = 64 - self.precision
+        index = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        old = self.registers[index]
+        if rank > old:
+            self.registers[index] = rank
+            self.inverse_sum += 2.0 ** -rank - 2.0 ** -old
+            if old == 0:
+                self.zeros -= 1
+            return True
+        return False
+
+    def count(self):
+        """
+        Returns the estimated number of distinct values added.
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / self.inverse_sum
+        if estimate <= 2.5 * m and self.zeros:
+            return m * math.log(m / self.zeros)
+        return estimate
+
+    def clear(self):
+        m = 1 << self.precision
+        self.registers = bytearray(m)
+        self.inverse_sum = float(m)
+        self.zeros = m
+
+
+class CountMinSketch:
+    """
+    Fixed-size frequency estimator. Supports negative updates, so it can track
+    counts that go up and down (e.g. half-open connections).
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, key):
+        h = hash64(key)
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        width = self.width
+        return [(h1 + i * h2) % width for i in range(self.depth)]
+
+    def add(self, key, count=1):
+        """
+        Adds count (possibly negative) to key and returns its new estimate.
+        """
+        estimate = None
+        for row, index in zip(self.rows, self._indexes(key)):
+            row[index] += count
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        return estimate
+
+    def estimate(self, key):
+        """
+        Returns the estimated count of key.
+        """
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+    def clear(self):
+        self.rows = [[0] * self.width for _ in range(self.depth)]
+
+
+class TopK:
+    """
+    Fixed-size list of the K keys with the largest reported estimates.
+    """
+
+    def __init__(self, k=10):
+        self.k = k
+        self.items = {}
+
+    def offer(self, key, estimate):
+        """
+        Records the latest estimate for key, keeping only the K largest.
+        """
+        items = self.items
+        if key in items or len(items) < self.k:
+            items[key] = estimate
+            return
+
+        smallest = min(items, key=items.get)
+        if estimate > items[smallest]:
+            del items[smallest]
+            items[key] = estimate
+
+    def top(self):
+        """
+        Returns (key, estimate) pairs sorted by estimate, largest first.
+        """
+        return sorted(self.items.items(), key=lambda item: item[1], reverse=True)
+
+    def clear(self):
+        self.items = {}
@@ -0,0 +1,232 @@
+from collections import OrderedDict
+import logging
+
+FIN = 0x01
+SYN = 0x02
+RST = 0x04
+
+_SEQ_MASK = 0xFFFFFFFF
+_SEQ_HALF = 0x80000000
+
+
+class TcpStream:
+    """
+    Reassembly state of one direction of a TCP connection.
+
+    window holds the last in-order bytes of the stream, ending at stream
+    position 'position'; pending holds out-of-order segments by sequence number.
+    """
+    __slots__ = ('next_seq', 'window', 'position', 'pending', 'pending_bytes')
+
+    def __init__(self, next_seq):
+        self.next_seq = next_seq
+        self.window = bytearray()
+        self.position = 0
+        self.pending = {}
+        self.pending_bytes = 0
+
+
+class StreamReassembler:
+    def __init__(self, window=4096, max_streams=65536, stream_limit=65536,
+                 memory_limit=64 * 1024 * 1024):
+        """
+        Initializes bounded TCP stream reassembly, keyed on the flow key (one
+        stream per direction).
+
+        Segments are put in sequence order; retransmitted bytes are dropped
+        and overlapping segments trimmed (the bytes seen first win). Each
+        stream keeps a sliding window of its last in-order bytes for the
+        payload matchers.
+
+        :param window: Bytes of in-order data kept per stream.
+        :param max_streams: Maximum number of streams (least recently active evicted).
+        :param stream_limit: Maximum out-of-order bytes buffered per stream. Beyond
+                             it the missing data is given up on and the stream
+                             continues after the gap.
+        :param memory_limit: Maximum bytes buffered across all streams (windows and
+                             out-of-order segments); least recently active streams
+                             are evicted beyond it.
+        """
+        self.window = window
+        self.max_streams = max_streams
+        self.stream_limit = stream_limit
+        self.memory_limit = memory_limit
+
+        self.streams = OrderedDict()
+        self.memory = 0
+
+        # Counters
+        self.retransmits = 0
+        self.overlaps = 0
+        self.out_of_order = 0
+        self.gaps = 0
+        self.stream_evictions = 0
+        self.memory_evictions = 0
+
+        self.logger = logging.getLogger(__name__)
+
+    def add(self, key, packet):
+        """
+        Adds a TCP segment to its stream.
+
+        :param key: Flow key of the segment's direction.
+        :param packet: PacketRecord of the segment.
+        :return: (window bytes, stream position at the end of the window, number of
+                 new in-order bytes) if the segment extended the stream, else None.
+        """
+        flags = packet.tcp_flags
+        data = packet.data
+        start = packet.payload_offset
+        end = packet.payload_end if packet.payload_end is not None else len(data)
+        length = end - start if end > start else 0
+
+        streams = self.streams
+        stream = streams.get(key)
+        if stream is None:
+            if flags & RST or not (length or flags & SYN):
+                return None  # Nothing to reassemble (e.g. a bare ACK of an unknown stream)
+            if len(streams) >= self.max_streams:
+                self._evict()
+                self.stream_evictions += 1
+            stream = streams[key] = TcpStream(packet.seq)
+        else:
+            streams.move_to_end(key)
+
+        if flags & SYN:
+            if not stream.position:
+                stream.next_seq = (packet.seq + 1) & _SEQ_MASK
+            # Data on a SYN is rare and not inspected
+            length = 0
+
+        new = 0
+        if length:
+            seq = packet.seq
+            distance = (seq - stream.next_seq) & _SEQ_MASK
+            if distance >= _SEQ_HALF:
+                # Starts before the next expected byte: retransmission or overlap
+                overlap = (stream.next_seq - seq) & _SEQ_MASK
+                if overlap >= length:
+                    self.retransmits += 1
+                    length = 0
+                else:
+                    self.overlaps += 1
+                    start += overlap
+                    length -= overlap
+                    distance = 0
+            if length:
+                chunk = memoryview(data)[start:start + length]
+                if distance == 0:
+                    new = self._deliver(stream, chunk)
+                    if stream.pending:
+                        new += self._drain(stream)
+                else:
+                    new = self._buffer(stream, seq, bytes(chunk))
+
+        result = (bytes(stream.window), stream.position, new) if new else None
+
+        if flags & (FIN | RST):
+            self._remove(key)
+        elif self.memory > self.memory_limit:
+            while self.memory > self.memory_limit and len(streams) > 1:
+                self._evict()
+                self.memory_evictions += 1
+        return result
+
+    def _deliver(self, stream, chunk):
+        """Appends in-order bytes to a stream's window."""
+        window = stream.window
+        before = len(window)
+        window += chunk
+        excess = len(window) - self.window
+        if excess > 0:
+            del window[:excess]
+        self.memory += len(window) - before
+        stream.position += len(chunk)
+        stream.next_seq = (stream.next_seq + len(chunk)) & _SEQ_MASK
+        return len(chunk)
+
+    def _buffer(self, stream, seq, chunk):
+        """
+        Holds an out-of-order segment until the gap before it is filled.
+
+        :return: Number of bytes delivered if the stream had to skip a gap.
+        """
+        existing = stream.pending.get(seq)
+        if existing is not None and len(existing) >= len(chunk):
+            self.retransmits += 1
+            return 0
+        self.out_of_order += 1
+        if existing is not None:
+            stream.pending_bytes -= len(existing)
+            self.memory -= len(existing)
+        stream.pending[seq] = chunk
+        stream.pending_bytes += len(chunk)
+        self.memory += len(chunk)
+
+        delivered = 0
+        while stream.pending_bytes > self.stream_limit:
+            # The gap is not going to be filled in time: continue after it
+            self.gaps += 1
+            next_seq = min(stream.pending, key=lambda s: (s - stream.next_seq) & _SEQ_MASK)
+            gap = (next_seq - stream.next_seq) & _SEQ_MASK
+            stream.next_seq = next_seq
+            stream.position += gap
+            # Bytes on either side of the gap are not contiguous
+            self.memory -= len(stream.window)
+            stream.window.clear()
+            delivered += self._drain(stream)
+        return delivered
+
+    def _drain(self, stream):
+        """
+        Delivers buffered segments that have become in order.
+
+        :return: Number of bytes delivered.
+        """
+        delivered = 0
+        pending = stream.pending
+        progress = True
+        while pending and progress:
+            progress = False
+            for seq in list(pending):
+                distance = (seq - stream.next_seq) & _SEQ_MASK
+                if distance and distance < _SEQ_HALF:
+                    continue  # Still after a gap
+                chunk = pending.pop(seq)
+                stream.pending_bytes -= len(chunk)
+                self.memory -= len(chunk)
+                overlap = (stream.next_seq - seq) & _SEQ_MASK if distance else 0
+                if overlap >= len(chunk):
+                    self.retransmits += 1
+                    continue
+                if overlap:
+                    self.overlaps += 1
+                    chunk = chunk[overlap:]
+                delivered += self._deliver(stream, chunk)
+                progress = True
+        return delivered
+
+    def _remove(self, key):
+        stream = self.streams.pop(key, None)
+        if stream is not None:
+            self.memory -= len(stream.window) + stream.pending_bytes
+
+    def _evict(self):
+        """Evicts the least recently active stream."""
+        key = next(iter(self.streams))
+        self._remove(key)
+
+    def stats(self):
+        """
+        Returns the number of streams, buffered bytes and reassembly counters.
+        """
+        return {
+            'streams': len(self.streams),
+            'memory': self.memory,
+            'retransmits': self.retransmits,
+            'overlaps': self.overlaps,
+            'out_of_order': self.out_of_order,
+            'gaps': self.gaps,
+            'stream_evictions': self.stream_evictions,
+            'memory_evictions': self.memory_evictions
+        }
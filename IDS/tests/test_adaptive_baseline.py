@@ -0,0 +1,65 @@
+import random
+
+from adaptive_baseline import AdaptiveBaselines, P2Quantiles, LEARN
+from packet_decoder import PROTO_TCP, PROTO_UDP
+
+SERVER = '10.0.0.1'
+CLIENT = '10.0.0.2'
+
+
+def features(dst_ip, dst_port, protocol=PROTO_TCP, tcp_flags=0x10, size=100):
+    return {'dst_ip': dst_ip, 'dst_port': dst_port, 'protocol': protocol, 'tcp_flags': tcp_flags,
+            'packet_size': size, 'flow_pkt_rate_1s': 1.0, 'flow_byte_rate_1s': float(size)}
+
+
+def test_p2_estimates_track_the_exact_quantiles():
+    rng = random.Random(7)
+    samples = [rng.lognormvariate(6, 0.5) for _ in range(20000)]
+    estimator = P2Quantiles(0.05, 0.95)
+    for x in samples:
+        estimator.add(x)
+
+    samples.sort()
+    for marker, q in ((1, 0.05), (2, 0.5), (3, 0.95)):
+        exact = samples[int(q * len(samples))]
+        assert abs(estimator.quantile(marker) - exact) < 0.03 * exact
+
+
+def test_p2_is_exact_before_the_markers_fill():
+    estimator = P2Quantiles(0.01, 0.99)
+    assert estimator.quantile(2) == 0.0
+    for x in (30, 10, 20):
+        estimator.add(x)
+    assert (estimator.quantile(1), estimator.quantile(2), estimator.quantile(3)) == (10, 20, 30)
+
+
+def test_tcp_services_are_created_by_a_syn_only():
+    baselines = AdaptiveBaselines(LEARN)
+    baselines.inspect(features(SERVER, 80, tcp_flags=0x02))
+    for port in range(40000, 41000):
+        # Server replies to the client's ephemeral ports, starting with the SYN-ACK
+        baselines.inspect(features(CLIENT, port, tcp_flags=0x12 if port == 40000 else 0x18))
+        baselines.inspect(features(SERVER, 80, tcp_flags=0x10))
+
+    assert list(baselines.services) == [(SERVER, 80)]
+    assert baselines.services[(SERVER, 80)][0].count == 1001
+    assert baselines.stats()['global_samples'] == 2001
+
+
+def test_udp_services_need_repeated_packets():
+    baselines = AdaptiveBaselines(LEARN, admit_after=8)
+    for port in range(50000, 50500):
+        baselines.inspect(features(SERVER, 53, PROTO_UDP, tcp_flags=0))
+        baselines.inspect(features(CLIENT, port, PROTO_UDP, tcp_flags=0))
+    assert list(baselines.services) == [(SERVER, 53)]
+    assert baselines.services[(SERVER, 53)][0].count == 500 - 7
+
+
+def test_replies_do_not_evict_services():
+    baselines = AdaptiveBaselines(LEARN, max_services=2)
+    baselines.inspect(features(SERVER, 22, tcp_flags=0x02))
+    baselines.inspect(features(SERVER, 443, tcp_flags=0x02))
+    for port in range(32768, 60000):
+        baselines.inspect(features(CLIENT, port))
+    assert set(baselines.services) == {(SERVER, 22), (SERVER, 443)}
+    assert baselines.stats()['evicted'] == 0
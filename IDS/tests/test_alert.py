@@ -0,0 +1,38 @@
+import time
+
+from alert import AlertSystem, alert_key
+from alert_aggregator import AlertAggregator
+
+
+def test_floods_are_keyed_by_target_and_scans_by_source():
+    flood = {'type': 'signature', 'rule': 'syn_flood', 'confidence': 0.9}
+    assert alert_key(flood, '1.2.3.4', '10.0.0.1') == alert_key(flood, '5.6.7.8', '10.0.0.1')
+    scan = {'type': 'scan', 'rule': 'host_sweep', 'confidence': 0.9}
+    assert alert_key(scan, '1.2.3.4', '10.0.0.1') == alert_key(scan, '1.2.3.4', '10.0.0.2')
+    other = {'type': 'signature', 'rule': 'ssh', 'confidence': 0.5}
+    assert alert_key(other, '1.2.3.4', '10.0.0.1') != alert_key(other, '5.6.7.8', '10.0.0.1')
+
+
+def test_aggregator_summarizes_repeats():
+    summaries = []
+    aggregator = AlertAggregator(window=10.0, on_summary=summaries.append)
+    assert not aggregator.suppress('key', 0.0)
+    aggregator.track('key', {'threat_type': 'x'}, 0.0)
+    assert aggregator.suppress('key', 1.0)
+    assert aggregator.suppress('key', 2.0)
+    aggregator.sweep(11.0)
+    assert [summary['count'] for summary in summaries] == [3]
+
+
+def test_spoofed_flood_is_summarized_by_the_timer(tmp_path):
+    alert_system = AlertSystem(log_file=str(tmp_path / 'alerts.log'), suppression_window=0.2)
+    summaries = []
+    alert_system.aggregator.on_summary = summaries.append
+    threat = {'type': 'signature', 'rule': 'syn_flood', 'confidence': 0.5}
+    for i in range(100):
+        alert_system.generate_alert(threat, {'source_ip': f'192.0.2.{i}', 'destination_ip': '10.0.0.80'})
+    deadline = time.monotonic() + 2.0
+    while not summaries and time.monotonic() < deadline:
+        time.sleep(0.05)
+    alert_system.close()
+    assert [summary['count'] for summary in summaries] == [100]
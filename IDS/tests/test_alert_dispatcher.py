@@ -0,0 +1,86 @@
+import socketserver
+import threading
+import time
+
+import pytest
+
+from alert_dispatcher import EmailDispatcher
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib: EHLO, MAIL, RCPT, DATA, QUIT."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self.reply('250 localhost')
+            elif command == b'DATA':
+                self.reply('354 end with .')
+                lines = []
+                while (line := self.rfile.readline()) not in (b'.\r\n', b''):
+                    lines.append(line)
+                self.server.messages.append(b''.join(lines).decode())
+                self.reply('250 queued')
+            elif command == b'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _SMTPHandler)
+    server.daemon_threads = True
+    server.messages = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_dispatcher(server, **kwargs):
+    config = {'smtp_server': '127.0.0.1', 'smtp_port': server.server_address[1],
+              'from_email': 'ids@example.com', 'to_email': 'soc@example.com', 'use_tls': False}
+    return EmailDispatcher(config, **kwargs)
+
+
+def alert(i):
+    return {'timestamp': time.time(), 'threat_type': 'port_scan', 'source_ip': f'192.0.2.{i}'}
+
+
+def test_burst_is_sent_as_one_digest(smtp_server):
+    dispatcher = make_dispatcher(smtp_server, batch_window=0.2)
+    for i in range(3):
+        assert dispatcher.submit(alert(i))
+    deadline = time.monotonic() + 5.0
+    while not smtp_server.messages and time.monotonic() < deadline:
+        time.sleep(0.05)
+    dispatcher.close()
+
+    assert len(smtp_server.messages) == 1
+    assert 'IDS Alert Digest - 3 alerts (port_scan)' in smtp_server.messages[0]
+    assert dispatcher.stats()['alerts_sent'] == 3
+    assert dispatcher.stats()['connections_opened'] == 1
+
+
+def test_close_sends_pending_digest_without_waiting_for_the_window(smtp_server):
+    dispatcher = make_dispatcher(smtp_server, batch_window=30.0)
+    dispatcher.submit(alert(1))
+    dispatcher.submit(alert(2))
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    dispatcher.close()
+    assert time.monotonic() - started < 5.0
+    assert len(smtp_server.messages) == 1
+    assert dispatcher.stats()['alerts_sent'] == 2
@@ -0,0 +1,106 @@
+import pytest
+
+from checkpoint import write_checkpoint, FlowCheckpoint
+from flow_table import FlowTable, EXPIRED_IDLE
+from packet_decoder import PacketRecord, PROTO_TCP
+from traffic_analyzer import TrafficAnalyzer
+
+KEY_OLD = ('10.0.0.9', '10.0.0.2', 1009, 80, PROTO_TCP)
+KEY_A = ('10.0.0.1', '10.0.0.2', 1000, 80, PROTO_TCP)
+KEY_B = ('2001:db8::1', '2001:db8::2', 1001, 443, PROTO_TCP)
+
+
+def packet(key, length, timestamp):
+    src, dst, sport, dport, proto = key
+    return PacketRecord(timestamp, length, 6 if ':' in src else 4, src, dst, proto,
+                        sport, dport, tcp_flags=0x10)
+
+
+@pytest.fixture
+def checkpoint_path(tmp_path):
+    analyzer = TrafficAnalyzer(idle_timeout=15.0)
+    analyzer.analyze_packet(packet(KEY_OLD, 60, 100.0))
+    for t in (110.0, 111.0, 112.0):
+        analyzer.analyze_packet(packet(KEY_A, 100, t))
+    analyzer.analyze_packet(packet(KEY_B, 1500, 114.0))
+    path = str(tmp_path / 'flows.ckpt')
+    assert write_checkpoint(path, analyzer) == 3
+    return path
+
+
+def restoring_table(path, now=116.0):
+    expired = []
+    table = FlowTable(idle_timeout=15.0,
+                      on_expire=lambda flow, reason: expired.append((flow.key, reason, flow.packet_count)))
+    checkpoint = FlowCheckpoint(path, idle_timeout=15.0, now=now)
+    checkpoint.attach(table)
+    return table, checkpoint, expired
+
+
+def test_restored_flow_continues_its_counts(checkpoint_path):
+    table, checkpoint, expired = restoring_table(checkpoint_path)
+    flow = table.update(KEY_A, 100, 116.0)
+    assert (flow.packet_count, flow.byte_count) == (4, 400)
+    assert (flow.start_time, flow.last_time) == (110.0, 116.0)
+    assert flow.rates is not None
+
+    # Each record is handed out once, and unknown flows are not found
+    assert checkpoint.lookup(KEY_A, 117.0) is None
+    assert checkpoint.lookup(('10.0.0.7', '10.0.0.2', 1000, 80, PROTO_TCP), 117.0) is None
+    assert expired == []
+    assert checkpoint.stats()['restored'] == 1
+    checkpoint.close()
+
+
+def test_stale_flow_is_exported_once_as_idle(checkpoint_path):
+    table, checkpoint, expired = restoring_table(checkpoint_path)
+    flow = table.update(KEY_OLD, 60, 117.0)
+    assert flow.packet_count == 1  # Went idle during the restart, so a new flow starts
+    assert expired == [(KEY_OLD, EXPIRED_IDLE, 1)]
+
+    assert checkpoint.lookup(KEY_OLD, 118.0) is None
+    assert expired == [(KEY_OLD, EXPIRED_IDLE, 1)]
+    assert checkpoint.stats()['stale'] == 1
+    checkpoint.close()
+
+
+def test_close_exports_flows_never_restored(checkpoint_path):
+    table, checkpoint, expired = restoring_table(checkpoint_path)
+    table.update(KEY_A, 100, 116.0)
+    checkpoint.close()
+    assert sorted(expired) == sorted([(KEY_OLD, EXPIRED_IDLE, 1), (KEY_B, EXPIRED_IDLE, 1)])
+    assert table.restore is None
+    stats = checkpoint.stats()
+    assert (stats['restored'], stats['expired'], stats['open']) == (1, 2, False)
+
+    checkpoint.close()
+    assert len(expired) == 2
+
+
+def test_flows_are_not_restored_after_the_checkpoint_aged_out(checkpoint_path):
+    table, checkpoint, _ = restoring_table(checkpoint_path)
+    # The last packet in the checkpoint was at 114.0, so every flow is idle after 129.0
+    flow = table.update(KEY_B, 1500, 130.0)
+    assert flow.packet_count == 1
+    assert checkpoint.aged_out
+    checkpoint.close()
+    assert checkpoint.stats()['expired'] == 3
+
+
+@pytest.mark.parametrize('damage', ['truncate', 'extend', 'magic', 'empty'])
+def test_damaged_checkpoint_is_rejected(checkpoint_path, damage):
+    with open(checkpoint_path, 'rb') as f:
+        data = bytearray(f.read())
+    if damage == 'truncate':
+        data = data[:-1]
+    elif damage == 'extend':
+        data += b'\x00'
+    elif damage == 'magic':
+        data[0] ^= 0xff
+    else:
+        data = data[:10]
+    with open(checkpoint_path, 'wb') as f:
+        f.write(data)
+
+    with pytest.raises(ValueError):
+        FlowCheckpoint(checkpoint_path)
@@ -0,0 +1,66 @@
+from flow_table import FlowTable, EXPIRED_IDLE, EXPIRED_ACTIVE, EXPIRED_CAPACITY, EXPIRED_FLUSH
+
+KEY_A = ('10.0.0.1', '10.0.0.2', 1000, 80, 6)
+KEY_B = ('10.0.0.3', '10.0.0.2', 1001, 80, 6)
+KEY_C = ('10.0.0.4', '10.0.0.2', 1002, 80, 6)
+
+
+def collecting_table(**kwargs):
+    expired = []
+    table = FlowTable(on_expire=lambda flow, reason: expired.append((flow.key, reason, flow.packet_count)),
+                      **kwargs)
+    return table, expired
+
+
+def test_counts_packets_and_bytes():
+    table, _ = collecting_table()
+    table.update(KEY_A, 60, 1.0)
+    flow = table.update(KEY_A, 1500, 2.0)
+    assert (flow.packet_count, flow.byte_count) == (2, 1560)
+    assert (flow.start_time, flow.last_time) == (1.0, 2.0)
+
+
+def test_idle_flows_expire_on_sweep():
+    table, expired = collecting_table(idle_timeout=10.0, sweep_interval=1.0)
+    table.update(KEY_A, 60, 0.0)
+    table.update(KEY_B, 60, 5.0)
+    table.update(KEY_B, 60, 12.0)
+    assert expired == [(KEY_A, EXPIRED_IDLE, 1)]
+    assert list(table.flows) == [KEY_B]
+
+
+def test_long_flows_are_exported_and_restarted():
+    table, expired = collecting_table(active_timeout=30.0, idle_timeout=100.0)
+    table.update(KEY_A, 60, 0.0)
+    table.update(KEY_A, 60, 10.0)
+    flow = table.update(KEY_A, 60, 31.0)
+    assert expired == [(KEY_A, EXPIRED_ACTIVE, 2)]
+    assert (flow.packet_count, flow.start_time) == (1, 31.0)
+
+
+def test_capacity_evicts_least_recently_updated():
+    table, expired = collecting_table(max_flows=2)
+    table.update(KEY_A, 60, 0.0)
+    table.update(KEY_B, 60, 0.1)
+    table.update(KEY_A, 60, 0.2)
+    table.update(KEY_C, 60, 0.3)
+    assert expired == [(KEY_B, EXPIRED_CAPACITY, 1)]
+    assert set(table.flows) == {KEY_A, KEY_C}
+
+
+def test_flush_emits_every_flow():
+    table, expired = collecting_table()
+    table.update(KEY_A, 60, 0.0)
+    table.update(KEY_B, 60, 0.0)
+    table.flush()
+    assert sorted(expired) == [(KEY_A, EXPIRED_FLUSH, 1), (KEY_B, EXPIRED_FLUSH, 1)]
+    assert not table.flows
+
+
+def test_restore_hook_continues_a_missing_flow():
+    table, _ = collecting_table()
+    donor, _ = collecting_table()
+    restored = donor.update(KEY_A, 100, 0.0)
+    table.restore = lambda key, timestamp: restored if key == KEY_A else None
+    assert table.update(KEY_A, 100, 1.0).packet_count == 2
+    assert table.update(KEY_B, 100, 1.0).packet_count == 1
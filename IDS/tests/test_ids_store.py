@@ -0,0 +1,94 @@
+import sqlite3
+
+import pytest
+
+from flow_table import FlowRecord
+from ids_store import IDSStore
+
+DAY = 86400.0
+# 2023-11-14 00:00:00 UTC
+T0 = 1699920000.0
+
+
+def flow(src, dst, sport, dport, protocol, end, packets=1, byte_count=100):
+    record = FlowRecord((src, dst, sport, dport, protocol), end - 1.0)
+    record.last_time = end
+    record.packet_count = packets
+    record.byte_count = byte_count
+    return record
+
+
+def test_flows_keep_their_protocol(tmp_path):
+    store = IDSStore(str(tmp_path / 'ids.db'))
+    store.add_flow(flow('10.0.0.1', '10.0.0.9', 40000, 22, 6, T0 + 10, byte_count=500), 'idle')
+    store.add_flow(flow('10.0.0.2', '10.0.0.9', 40000, 22, 17, T0 + 10, byte_count=900), 'idle')
+    store.add_flow(flow('10.0.0.3', '10.0.0.9', 0, 8 << 8, 1, T0 + 10, byte_count=50), 'idle')
+    store.close()
+
+    reader = IDSStore(store.path, readonly=True)
+    assert [row['src_ip'] for row in reader.top_talkers(dst_port=22, protocol=6)] == ['10.0.0.1']
+    assert [row['src_ip'] for row in reader.top_talkers(dst_port=22, protocol=17)] == ['10.0.0.2']
+    assert [row['src_ip'] for row in reader.top_talkers(protocol=1)] == ['10.0.0.3']
+    assert len(reader.top_talkers(dst_port=22)) == 2
+
+
+def alert(src, dst, packet_time, threat_type='scan'):
+    return {'timestamp': packet_time, 'packet_time': packet_time, 'threat_type': threat_type,
+            'source_ip': src, 'destination_ip': dst, 'confidence': 0.9, 'details': {'rule': 'test'}}
+
+
+def partitions(path):
+    with sqlite3.connect(path) as connection:
+        return IDSStore._list_partitions(connection)
+
+
+def test_rows_land_in_the_partition_of_their_packet_day(tmp_path):
+    store = IDSStore(str(tmp_path / 'ids.db'))
+    store.add_alert(alert('10.0.0.1', '10.0.0.9', T0 - 1))
+    store.add_alert(alert('10.0.0.2', '10.0.0.9', T0 + 1))
+    store.add_flow(flow('10.0.0.1', '10.0.0.9', 40000, 80, 6, T0 - 1), 'idle')
+    store.add_flow(flow('10.0.0.2', '10.0.0.9', 40000, 80, 6, T0 + 1), 'idle')
+    store.close()
+
+    assert partitions(store.path) == ['alerts_20231113', 'alerts_20231114', 'flows_20231113', 'flows_20231114']
+    reader = IDSStore(store.path, readonly=True)
+    assert [row['source_ip'] for row in reader.query_alerts()] == ['10.0.0.2', '10.0.0.1']
+    assert [row['source_ip'] for row in reader.query_alerts(since=T0)] == ['10.0.0.2']
+    assert [row['source_ip'] for row in reader.query_alerts(until=T0)] == ['10.0.0.1']
+    assert [row['src_ip'] for row in reader.top_talkers(since=T0 - 10, until=T0)] == ['10.0.0.1']
+
+
+def test_retention_drops_partitions_older_than_the_newest_day(tmp_path):
+    path = str(tmp_path / 'ids.db')
+    store = IDSStore(path, retention_days=None)
+    store.add_alert(alert('10.0.0.1', '10.0.0.9', T0 - 40 * DAY))
+    store.add_flow(flow('10.0.0.1', '10.0.0.9', 40000, 80, 6, T0 - 40 * DAY), 'idle')
+    store.add_alert(alert('10.0.0.2', '10.0.0.9', T0 - 10 * DAY))
+    store.close()
+
+    # Retention counts back from the newest partition, not from the wall clock
+    store = IDSStore(path, retention_days=30)
+    store.add_alert(alert('10.0.0.3', '10.0.0.9', T0))
+    store.close()
+
+    assert partitions(path) == ['alerts_20231104', 'alerts_20231114']
+    assert store.stats()['partitions_dropped'] == 2
+
+
+def test_address_filters_match_cidr_blocks(tmp_path):
+    store = IDSStore(str(tmp_path / 'ids.db'))
+    for i, src in enumerate(('10.0.0.5', '10.0.0.250', '10.0.1.5', '2001:db8::5', '2001:db9::5')):
+        store.add_alert(alert(src, '192.0.2.1', T0 + i))
+    store.add_flow(flow('10.0.0.5', '192.0.2.1', 40000, 80, 6, T0, byte_count=100), 'idle')
+    store.add_flow(flow('10.0.0.6', '192.0.2.200', 40000, 80, 6, T0, byte_count=200), 'idle')
+    store.add_flow(flow('10.0.0.7', '192.0.3.1', 40000, 80, 6, T0, byte_count=300), 'idle')
+    store.close()
+
+    reader = IDSStore(store.path, readonly=True)
+    assert [row['source_ip'] for row in reader.query_alerts(src='10.0.0.0/24')] == ['10.0.0.250', '10.0.0.5']
+    assert [row['source_ip'] for row in reader.query_alerts(src='10.0.1.5')] == ['10.0.1.5']
+    assert [row['source_ip'] for row in reader.query_alerts(src='2001:db8::/32')] == ['2001:db8::5']
+    assert len(reader.query_alerts(dst='192.0.2.0/24')) == 5
+    assert [row['src_ip'] for row in reader.top_talkers(dst='192.0.2.0/24')] == ['10.0.0.6', '10.0.0.5']
+    with pytest.raises(ValueError):
+        reader.query_alerts(src='10.0.0.0/33')
@@ -0,0 +1,65 @@
+import struct
+
+from packet_decoder import decode, LINKTYPE_RAW, PROTO_TCP, PROTO_UDP, PROTO_ICMPV6
+from traffic_generator import tcp_frame, udp_frame, icmpv6_frame, SYN, ACK, _ip
+
+
+def test_decodes_tcp_header_and_payload_bounds():
+    frame = tcp_frame(_ip('10.0.0.1'), _ip('10.0.0.2'), 40000, 80, SYN | ACK, seq=1234,
+                      window=512, payload_size=10)
+    record = decode(frame, 1.5)
+    assert (record.src, record.dst, record.sport, record.dport) == ('10.0.0.1', '10.0.0.2', 40000, 80)
+    assert record.proto == PROTO_TCP
+    assert record.tcp_flags == SYN | ACK
+    assert record.seq == 1234
+    assert record.window == 512
+    assert record.time == 1.5
+    assert record.payload_end - record.payload_offset == 10
+
+
+def test_payload_end_excludes_ethernet_padding():
+    frame = tcp_frame(_ip('10.0.0.1'), _ip('10.0.0.2'), 1, 2, ACK) + bytes(6)
+    record = decode(frame)
+    assert record.payload_end == record.payload_offset
+    assert record.length == len(frame)
+
+
+def test_decodes_udp():
+    record = decode(udp_frame(_ip('10.0.0.1'), _ip('10.0.0.9'), 53, 5353, payload_size=100))
+    assert record.proto == PROTO_UDP
+    assert (record.sport, record.dport) == (53, 5353)
+    assert record.payload_end - record.payload_offset == 100
+
+
+def test_decodes_icmpv6_type_and_code_as_dport():
+    record = decode(icmpv6_frame(0x20010db8 << 96 | 1, 0x20010db8 << 96 | 2, 128, 0, ident=7))
+    assert record.ip_version == 6
+    assert record.proto == PROTO_ICMPV6
+    assert (record.src, record.dst) == ('2001:db8::1', '2001:db8::2')
+    assert (record.sport, record.dport) == (0, 128 << 8)
+
+
+def test_decodes_vlan_tagged_frames():
+    frame = tcp_frame(_ip('10.0.0.1'), _ip('10.0.0.2'), 1, 22, SYN)
+    tagged = frame[:12] + struct.pack('!HH', 0x8100, 42) + frame[12:]
+    record = decode(tagged)
+    assert (record.src, record.dport) == ('10.0.0.1', 22)
+
+
+def test_decodes_raw_ip_linktype():
+    frame = tcp_frame(_ip('10.0.0.1'), _ip('10.0.0.2'), 1, 443, SYN)
+    record = decode(frame[14:], linktype=LINKTYPE_RAW)
+    assert record.dport == 443
+
+
+def test_rejects_truncated_and_non_ip_frames():
+    frame = tcp_frame(_ip('10.0.0.1'), _ip('10.0.0.2'), 1, 2, SYN)
+    assert decode(frame[:30]) is None
+    assert decode(frame[:12] + b'\x08\x06' + frame[14:]) is None  # ARP
+    assert decode(b'') is None
+
+
+def test_rejects_non_first_fragments():
+    frame = bytearray(tcp_frame(_ip('10.0.0.1'), _ip('10.0.0.2'), 1, 2, SYN))
+    frame[20:22] = struct.pack('!H', 0x0010)  # Fragment offset 16 * 8 bytes
+    assert decode(bytes(frame)) is None
@@ -0,0 +1,66 @@
+import pytest
+
+from payload_matcher import AhoCorasick, PayloadMatcher, PayloadPattern, parse_content
+
+
+def matcher(patterns, automaton_threshold=256):
+    return PayloadMatcher([PayloadPattern(*pattern) for pattern in patterns], automaton_threshold)
+
+
+def test_parse_content():
+    assert parse_content({'content': 'abc'}) == b'abc'
+    assert parse_content({'content_hex': '90 90 cc'}) == b'\x90\x90\xcc'
+    assert parse_content({}) is None
+    for definition in ({'content': ''}, {'content_hex': 'zz'}, {'content': 'a', 'content_hex': '61'}):
+        with pytest.raises(ValueError):
+            parse_content(definition)
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    automaton = AhoCorasick([(b'he', 'he'), (b'she', 'she'), (b'his', 'his'), (b'hers', 'hers')])
+    assert sorted(automaton.scan(b'ushers')) == [(4, 'he'), (4, 'she'), (6, 'hers')]
+
+
+def test_aho_corasick_nocase():
+    automaton = AhoCorasick([(b'Select', 'sql')], nocase=True)
+    assert list(automaton.scan(b'xSeLeCt')) == [(7, 'sql')]
+
+
+# Both the bytes.find path and the automaton path must give the same answers
+@pytest.mark.parametrize('automaton_threshold', [1, 256])
+def test_offset_depth_and_nocase(automaton_threshold):
+    payload_matcher = matcher([
+        ('get', b'GET ', False, 0, 4),
+        ('passwd', b'/etc/passwd', False, 0, None),
+        ('union', b'union select', True, 4, None),
+    ], automaton_threshold)
+    assert payload_matcher.scan(b'GET /etc/passwd') == {'get', 'passwd'}
+    assert payload_matcher.scan(b' GET /x') == set()
+    assert payload_matcher.scan(b'id=1 UNION SELECT') == {'union'}
+    assert payload_matcher.scan(b'UNION SELECT') == set()  # Starts before offset 4
+
+
+@pytest.mark.parametrize('automaton_threshold', [1, 256])
+def test_scan_region_and_fresh_bytes(automaton_threshold):
+    payload_matcher = matcher([('evil', b'evil', False, 0, None)], automaton_threshold)
+    data = b'HEADERxxevilxx'
+    assert payload_matcher.scan(data, start=6) == {'evil'}
+    assert payload_matcher.scan(data, start=6, end=10) == set()
+    # Already inspected up to stream position 6: a match ending at 6 is not reported again
+    assert payload_matcher.scan(data, start=6, position=0, fresh=6) == set()
+    assert payload_matcher.scan(data, start=6, position=0, fresh=5) == {'evil'}
+
+
+def test_invalid_patterns():
+    with pytest.raises(ValueError):
+        PayloadPattern('x', b'abcd', depth=2)
+    with pytest.raises(ValueError):
+        PayloadPattern('x', b'abcd', offset=-1)
+
+
+def test_matches_caches_per_packet():
+    payload_matcher = matcher([('evil', b'evil', False, 0, None)])
+    features = {'packet_data': b'..evil..', 'payload_offset': 2}
+    assert payload_matcher.matches(features) == {'evil'}
+    features['packet_data'] = b'........'
+    assert payload_matcher.matches(features) == {'evil'}
@@ -0,0 +1,52 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from ring_buffer import PacketRing
+
+
+def test_fifo_and_drop_newest():
+    ring = PacketRing(3)
+    assert [ring.offer(i) for i in range(5)] == [True, True, True, False, False]
+    assert [ring.get_nowait() for _ in range(3)] == [0, 1, 2]
+    assert ring.stats()['dropped'] == 2
+    with pytest.raises(queue.Empty):
+        ring.get_nowait()
+
+
+def test_drop_oldest_keeps_the_newest():
+    ring = PacketRing(3, policy='drop_oldest')
+    for i in range(5):
+        ring.offer(i)
+    assert [ring.get_nowait() for _ in range(3)] == [2, 3, 4]
+
+
+@pytest.mark.parametrize('rate', [1, 4])
+def test_sample_policy_keeps_the_first_of_every_n(rate):
+    ring = PacketRing(100, policy='sample', sample_rate=rate, sample_threshold=0.0,
+                      key_func=lambda item: 'flow')
+    accepted = [ring.offer(i) for i in range(8)]
+    assert accepted == [i % rate == 0 for i in range(8)]
+
+
+def test_overload_is_reported_once_per_episode():
+    reports = []
+    ring = PacketRing(1, on_overload=reports.append)
+    for i in range(10):
+        ring.offer(i)
+    assert len(reports) == 1
+    assert reports[0]['dropped'] == 1
+
+
+def test_close_wakes_a_waiting_consumer():
+    ring = PacketRing(4)
+    threading.Timer(0.05, ring.close).start()
+    started = time.monotonic()
+    with pytest.raises(queue.Empty):
+        ring.get(timeout=5)
+    assert time.monotonic() - started < 1.0
+    ring.reopen()
+    ring.put('x')
+    assert ring.get(timeout=1) == 'x'
@@ -0,0 +1,97 @@
+import pytest
+
+from rule_compiler import RuleSet, compile_rule, parse_tcp_flags, load_config
+
+
+def features(**overrides):
+    base = {'protocol': 6, 'tcp_flags': 0x02, 'src_ip': '192.168.1.5', 'dst_ip': '10.0.0.1',
+            'src_port': 40000, 'dst_port': 22, 'packet_size': 60}
+    base.update(overrides)
+    return base
+
+
+def matched_ids(rules, **overrides):
+    return [rule.rule_id for rule in rules.match(features(**overrides))]
+
+
+def test_parse_tcp_flags():
+    assert parse_tcp_flags('SA') == 0x12
+    assert parse_tcp_flags(18) == 18
+    with pytest.raises(ValueError):
+        parse_tcp_flags('SX')
+
+
+def test_indexed_fields_select_rules():
+    rules = RuleSet([
+        {'id': 'ssh_syn', 'tcp_flags': 'S', 'dst_port': 22},
+        {'id': 'web', 'dst_port': [80, 443]},
+        {'id': 'udp_dns', 'protocol': 'udp', 'dst_port': 53},
+    ])
+    assert matched_ids(rules) == ['ssh_syn']
+    assert matched_ids(rules, dst_port=443, tcp_flags=0x10) == ['web']
+    assert matched_ids(rules, protocol=17, dst_port=53, tcp_flags=0) == ['udp_dns']
+    assert matched_ids(rules, protocol=6, dst_port=53) == []
+
+
+def test_conditions_and_cidrs():
+    rules = RuleSet([
+        {'id': 'big_from_lan', 'src_cidr': '192.168.0.0/16',
+         'conditions': [{'feature': 'packet_size', 'op': '>', 'value': 1000}]},
+    ])
+    assert matched_ids(rules, packet_size=1200) == ['big_from_lan']
+    assert matched_ids(rules, packet_size=1200, src_ip='172.16.0.1') == []
+    assert matched_ids(rules, packet_size=100) == []
+
+
+def test_matches_are_in_rule_order():
+    rules = RuleSet([{'id': 'second_in_index', 'dst_port': 22}, {'id': 'wildcard'}])
+    assert matched_ids(rules) == ['second_in_index', 'wildcard']
+
+
+def test_disabled_rules_are_skipped():
+    assert compile_rule({'id': 'off', 'enabled': False}) is None
+    assert len(RuleSet([{'id': 'off', 'enabled': False}])) == 0
+
+
+@pytest.mark.parametrize('definition', [
+    {'id': 'x', 'bogus': 1},
+    {'id': 'x', 'protocol': 'sctp'},
+    {'id': 'x', 'dst_port': 70000},
+    {'id': 'x', 'conditions': [{'feature': 'packet_size', 'op': '~', 'value': 1}]},
+    {'id': 'x', 'confidence': 2},
+    {'id': 'x', 'nocase': True},
+    {'description': 'no id'},
+])
+def test_invalid_rules_are_rejected(definition):
+    with pytest.raises(ValueError):
+        compile_rule(definition)
+
+
+def test_duplicate_ids_are_rejected():
+    with pytest.raises(ValueError):
+        RuleSet([{'id': 'a'}, {'id': 'a'}])
+
+
+def test_python_rules_with_protocol():
+    rules = RuleSet(python_rules={'udp_only': {'condition': lambda f: True, 'protocol': 'udp'}})
+    assert matched_ids(rules) == []
+    assert matched_ids(rules, protocol=17) == ['udp_only']
+
+
+def test_payload_rules_need_header_match_and_content():
+    rules = RuleSet([{'id': 'admin', 'dst_port': 80, 'content': 'GET /admin', 'depth': 32}])
+    payload = b'GET /admin HTTP/1.1\r\n'
+    assert matched_ids(rules, dst_port=80, packet_data=payload, payload_offset=0) == ['admin']
+    assert matched_ids(rules, dst_port=80, packet_data=b'GET /index', payload_offset=0) == []
+    assert matched_ids(rules, dst_port=8080, packet_data=payload, payload_offset=0) == []
+
+
+def test_load_config_with_baselines(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text('{"rules": [{"id": "a"}], "baselines": {"max_packet_size": 1500}}')
+    config = load_config(str(path))
+    assert config['rules'] == [{'id': 'a'}]
+    assert config['baselines'] == {'max_packet_size': 1500}
+    path.write_text('{"rules": [], "baselines": {"max_packet_size": -1}}')
+    with pytest.raises(ValueError):
+        load_config(str(path))
@@ -0,0 +1,38 @@
+from scan_detector import ScanDetector, SYN
+
+
+def features(src, dst, dst_port, timestamp=0.0, flags=SYN):
+    return {'src_ip': src, 'dst_ip': dst, 'dst_port': dst_port,
+            'tcp_flags': flags, 'timestamp': timestamp}
+
+
+def test_port_scan_is_reported_once_per_window():
+    detector = ScanDetector(port_threshold=50, half_open_threshold=10**6)
+    threats = []
+    for port in range(500):
+        threats += detector.inspect(features('10.0.0.1', '10.0.0.2', port))
+    assert [t['rule'] for t in threats] == ['port_scan']
+
+    threats = detector.inspect(features('10.0.0.1', '10.0.0.2', 1, timestamp=120.0))
+    for port in range(2, 500):
+        threats += detector.inspect(features('10.0.0.1', '10.0.0.2', port, timestamp=120.0))
+    assert [t['rule'] for t in threats] == ['port_scan']
+
+
+def test_reported_state_stays_fixed_size():
+    detector = ScanDetector(host_threshold=1, half_open_threshold=10**6, report_bits=1024)
+    size = len(detector.reported)
+    reports = 0
+    for i in range(5000):
+        reports += len(detector.inspect(features(f'10.{i >> 8}.{i & 255}.1', '10.0.0.2', 80)))
+    assert len(detector.reported) == size == 128
+    assert 0 < reports <= 1024
+
+
+def test_horizontal_sweep_on_one_port_is_not_a_port_scan():
+    detector = ScanDetector(half_open_threshold=10**6)
+    threats = []
+    for host in range(300):
+        threats += detector.inspect(features('10.0.0.1', f'10.0.{host >> 8}.{host & 255}', 80))
+    assert [t['rule'] for t in threats] == ['host_sweep']
+    assert threats[0]['fanout_ports'] == 1
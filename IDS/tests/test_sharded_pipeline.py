@@ -0,0 +1,33 @@
+from sharded_pipeline import FrameRing, _NO_SOURCE_COUNTS
+from scan_detector import ScanDetector, SYN
+
+
+def test_frame_ring_carries_source_counts_across_wraps():
+    ring = FrameRing(capacity=4096)
+    reader = FrameRing(name=ring.name)
+    try:
+        received = []
+        for i in range(200):
+            counts = (float(i),) * len(_NO_SOURCE_COUNTS)
+            assert ring.put(bytes([i]) * (i % 50 + 1), i * 0.5, 1, counts)
+            received.extend(reader.get_batch())
+        assert len(received) == 200
+        frame, timestamp, linktype, counts = received[123]
+        assert (frame, timestamp, linktype) == (bytes([123]) * 24, 61.5, 1)
+        assert counts == [123.0] * len(_NO_SOURCE_COUNTS)
+    finally:
+        reader.close()
+        ring.close(unlink=True)
+
+
+def test_scan_detector_halves_can_run_separately():
+    scans = ScanDetector(port_threshold=50, detect_floods=False)
+    floods = ScanDetector(half_open_threshold=50, detect_scans=False)
+    scan_rules, flood_rules = [], []
+    for port in range(200):
+        features = {'src_ip': '192.0.2.1', 'dst_ip': '10.0.0.1', 'dst_port': port,
+                    'tcp_flags': SYN, 'timestamp': 0.0}
+        scan_rules += [t['rule'] for t in scans.inspect(features)]
+        flood_rules += [t['rule'] for t in floods.inspect(features)]
+    assert scan_rules == ['port_scan']
+    assert flood_rules == ['syn_flood']
@@ -0,0 +1,44 @@
+import pytest
+
+from sketches import HyperLogLog, CountMinSketch, TopK
+
+
+@pytest.mark.parametrize('cardinality', [10, 1000, 50000])
+def test_hyperloglog_estimate_is_close(cardinality):
+    hll = HyperLogLog(precision=10)
+    for i in range(cardinality):
+        hll.add(('10.0.0.1', i))
+    assert hll.count() == pytest.approx(cardinality, rel=0.1)
+
+
+def test_hyperloglog_ignores_duplicates_and_clears():
+    hll = HyperLogLog()
+    for _ in range(100):
+        hll.add('same')
+    assert hll.count() == pytest.approx(1, abs=0.5)
+    hll.clear()
+    assert hll.count() == 0
+
+
+def test_count_min_never_underestimates():
+    sketch = CountMinSketch(width=256, depth=4)
+    counts = {f'host{i}': i % 17 + 1 for i in range(2000)}
+    for key, count in counts.items():
+        sketch.add(key, count)
+    assert all(sketch.estimate(key) >= count for key, count in counts.items())
+
+
+def test_count_min_supports_decrements():
+    sketch = CountMinSketch()
+    sketch.add('flow', 5)
+    assert sketch.add('flow', -3) == 2
+    assert sketch.estimate('flow') == 2
+
+
+def test_topk_keeps_the_largest():
+    top = TopK(k=3)
+    for key, estimate in [('a', 1), ('b', 5), ('c', 3), ('d', 4), ('e', 2)]:
+        top.offer(key, estimate)
+    assert top.top() == [('b', 5), ('d', 4), ('c', 3)]
+    top.offer('c', 10)
+    assert top.top()[0] == ('c', 10)
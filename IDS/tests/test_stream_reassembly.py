@@ -0,0 +1,73 @@
+from packet_decoder import PacketRecord, PROTO_TCP
+from stream_reassembly import StreamReassembler, SYN, FIN
+
+KEY = ('10.0.0.1', '10.0.0.2', 40000, 80, PROTO_TCP)
+ACK = 0x10
+
+
+def segment(seq, payload=b'', flags=ACK):
+    return PacketRecord(0.0, 54 + len(payload), 4, KEY[0], KEY[1], PROTO_TCP, KEY[2], KEY[3],
+                        flags, 65535, 0, payload, seq)
+
+
+def test_in_order_segments_extend_the_window():
+    reassembler = StreamReassembler()
+    assert reassembler.add(KEY, segment(99, flags=SYN)) is None
+    assert reassembler.add(KEY, segment(100, b'GET /ad')) == (b'GET /ad', 7, 7)
+    assert reassembler.add(KEY, segment(107, b'min')) == (b'GET /admin', 10, 3)
+
+
+def test_out_of_order_segments_are_held_until_the_gap_fills():
+    reassembler = StreamReassembler()
+    reassembler.add(KEY, segment(99, flags=SYN))
+    assert reassembler.add(KEY, segment(105, b'world')) is None
+    assert reassembler.add(KEY, segment(100, b'hello')) == (b'helloworld', 10, 10)
+    assert reassembler.stats()['out_of_order'] == 1
+
+
+def test_retransmits_and_overlaps_keep_the_first_bytes():
+    reassembler = StreamReassembler()
+    reassembler.add(KEY, segment(99, flags=SYN))
+    reassembler.add(KEY, segment(100, b'abcd'))
+    assert reassembler.add(KEY, segment(100, b'abcd')) is None
+    assert reassembler.add(KEY, segment(102, b'XXef')) == (b'abcdef', 6, 2)
+    stats = reassembler.stats()
+    assert (stats['retransmits'], stats['overlaps']) == (1, 1)
+
+
+def test_sequence_numbers_wrap():
+    reassembler = StreamReassembler()
+    reassembler.add(KEY, segment(0xFFFFFFFD, flags=SYN))
+    reassembler.add(KEY, segment(0xFFFFFFFE, b'ab'))
+    assert reassembler.add(KEY, segment(0, b'cd')) == (b'abcd', 4, 2)
+
+
+def test_window_is_bounded():
+    reassembler = StreamReassembler(window=8)
+    reassembler.add(KEY, segment(99, flags=SYN))
+    reassembler.add(KEY, segment(100, b'0123456789'))
+    window, position, new = reassembler.add(KEY, segment(110, b'ab'))
+    assert (window, position, new) == (b'456789ab', 12, 2)
+    assert reassembler.memory == 8
+
+
+def test_stream_limit_skips_a_gap_that_never_fills():
+    reassembler = StreamReassembler(stream_limit=8)
+    reassembler.add(KEY, segment(99, flags=SYN))
+    reassembler.add(KEY, segment(100, b'abc'))
+    assert reassembler.add(KEY, segment(110, b'0123456789')) == (b'0123456789', 20, 10)
+    assert reassembler.stats()['gaps'] == 1
+
+
+def test_fin_releases_the_stream_and_memory_cap_evicts():
+    reassembler = StreamReassembler(memory_limit=16)
+    reassembler.add(KEY, segment(99, flags=SYN))
+    reassembler.add(KEY, segment(100, b'abc', flags=ACK | FIN))
+    assert reassembler.stats()['streams'] == 0
+    assert reassembler.memory == 0
+
+    other = KEY[:2] + (40001,) + KEY[3:]
+    reassembler.add(KEY, segment(0, b'x' * 12))
+    reassembler.add(other, segment(0, b'y' * 12))
+    assert reassembler.stats()['memory_evictions'] == 1
+    assert list(reassembler.streams) == [other]
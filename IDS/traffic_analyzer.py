@@ -1,21 +1,57 @@
-from scapy.all import IP, TCP
+from packet_decoder import PacketRecord, record_from_packet, PROTO_TCP, PROTO_UDP, PROTO_ICMP, PROTO_ICMPV6
+from flow_table import FlowTable
+from rate_counter import RateCounter, HostRateTable, RATE_WINDOWS
 from collections import defaultdict
 import threading
 import time
 import logging
 
 class TrafficAnalyzer:
-    def __init__(self):
+    def __init__(self, max_flows=100000, idle_timeout=15.0, active_timeout=1800.0,
+                 on_flow_expired=None, max_hosts=65536, reassembler=None):
         """
         Initializes the TrafficAnalyzer instance with default settings.
+
+        :param max_flows: Maximum number of flows tracked at once.
+        :param idle_timeout: Seconds without packets after which a flow is finished.
+        :param active_timeout: Seconds after which a long-lived flow is exported and restarted.
+        :param on_flow_expired: Optional callback(flow_record, reason) receiving finished flows.
+        :param max_hosts: Maximum number of source and destination hosts tracked for rate features.
+        :param reassembler: Optional StreamReassembler; the features then carry the
+                            reassembled stream window for payload inspection.
         """
         self.connections = defaultdict(list)
-        self.flow_stats = defaultdict(lambda: {
-            'packet_count': 0,
-            'byte_count': 0,
-            'start_time': None,
-            'last_time': None
-        })
+        self.flow_stats = FlowTable(max_flows=max_flows,
+                                    idle_timeout=idle_timeout,
+                                    active_timeout=active_timeout,
+                                    on_expire=on_flow_expired)
+
+        # Sliding-window rates per source and destination host
+        self.src_rates = HostRateTable(max_hosts=max_hosts)
+        self.dst_rates = HostRateTable(max_hosts=max_hosts)
+        self.reassembler = reassembler
+        self.rate_feature_names = [
+            (f'{scope}_pkt_rate_{int(window)}s', f'{scope}_byte_rate_{int(window)}s')
+            for scope in ('flow', 'src', 'dst') for window in RATE_WINDOWS
+        ]
+
+        # Destination rates of UDP and of ICMP/ICMPv6 traffic alone, for amplification
+        # and flood detection; only packets of those protocols update them
+        self.udp_dst_rates = HostRateTable(max_hosts=max_hosts)
+        self.icmp_dst_rates = HostRateTable(max_hosts=max_hosts)
+        self.protocol_rate_names = {
+            scope: [(f'{scope}_pkt_rate_{int(window)}s', f'{scope}_byte_rate_{int(window)}s')
+                    for window in RATE_WINDOWS]
+            for scope in ('dst_udp', 'dst_icmp')
+        }
+
+        # Features beyond the common ones, per protocol other than TCP; packets of
+        # protocols without an entry are not analyzed
+        self.protocol_features = {
+            PROTO_UDP: self.extract_udp_features,
+            PROTO_ICMP: self.extract_icmp_features,
+            PROTO_ICMPV6: self.extract_icmp_features
+        }
 
         # Lock for thread-safe access to shared data structures
         self.lock = threading.Lock()
@@ -28,66 +64,151 @@ class TrafficAnalyzer:
         """
         Analyzes the given packet to update flow statistics.
 
-        :param packet: The packet to analyze.
+        :param packet: The packet to analyze, either a Scapy packet or a PacketRecord
+                       from the fast header decoder.
         :return: A dictionary containing the extracted features, or None if packet is not relevant.
         """
-        if IP in packet and TCP in packet:
-            ip_src = packet[IP].src
-            ip_dst = packet[IP].dst
-            port_src = packet[TCP].sport
-            port_dst = packet[TCP].dport
-
-            flow_key = (ip_src, ip_dst, port_src, port_dst)
-
-            # Lock to ensure thread-safe access to flow_stats
-            with self.lock:
-                stats = self.flow_stats[flow_key]
-                stats['packet_count'] += 1
-                stats['byte_count'] += len(packet)
-                current_time = packet.time
-
-                # Set the start time if it's the first packet in the flow
-                if not stats['start_time']:
-                    stats['start_time'] = current_time
-                stats['last_time'] = current_time
-
-                # Return the extracted features for this packet
-                return self.extract_features(packet, stats)
-
-        # If packet is not TCP, ignore it
-        return None
+        if not isinstance(packet, PacketRecord):
+            packet = record_from_packet(packet)
+
+        if packet is None:
+            return None
+        proto = packet.proto
+        if proto == PROTO_TCP:
+            extract_protocol_features = None
+        else:
+            extract_protocol_features = self.protocol_features.get(proto)
+            if extract_protocol_features is None:
+                return None  # Not a protocol the IDS tracks
+
+        flow_key = (packet.src, packet.dst, packet.sport, packet.dport, proto)
+
+        # Lock to ensure thread-safe access to flow_stats
+        with self.lock:
+            stats = self.flow_stats.update(flow_key, packet.length, packet.time)
+            if stats.rates is None:
+                stats.rates = RateCounter()
+            stats.rates.update(packet.time, packet.length)
+            self.src_rates.update(packet.src, packet.time, packet.length)
+            self.dst_rates.update(packet.dst, packet.time, packet.length)
+
+            # Return the extracted features for this packet
+            features = self.extract_features(packet, stats)
+            if extract_protocol_features is not None:
+                extract_protocol_features(packet, features)
+            elif self.reassembler is not None:
+                stream = self.reassembler.add(flow_key, packet)
+                features['stream_data'], features['stream_end'], features['stream_new'] = \
+                    stream or (None, 0, 0)
+            return features
 
     def extract_features(self, packet, stats):
         """
         Extracts relevant features from the packet and flow statistics.
 
-        :param packet: The packet to extract features from.
-        :param stats: The flow statistics for this flow.
+        :param packet: The PacketRecord to extract features from.
+        :param stats: The FlowRecord for this flow.
         :return: A dictionary of extracted features.
         """
         # Avoid division by zero by checking if the flow duration is positive
-        flow_duration = stats['last_time'] - stats['start_time']
+        flow_duration = stats.last_time - stats.start_time
         if flow_duration <= 0:
             flow_duration = 1  # Set a default value to prevent division by zero
 
         features = {
-            'packet_size': len(packet),
+            'packet_size': packet.length,
             'flow_duration': flow_duration,
-            'packet_rate': stats['packet_count'] / flow_duration,
-            'byte_rate': stats['byte_count'] / flow_duration,
-            'tcp_flags': packet[TCP].flags,
-            'window_size': packet[TCP].window
+            'packet_rate': stats.packet_count / flow_duration,
+            'byte_rate': stats.byte_count / flow_duration,
+            'tcp_flags': packet.tcp_flags,
+            'window_size': packet.window,
+            'protocol': packet.proto,
+            'src_ip': packet.src,
+            'dst_ip': packet.dst,
+            'src_port': packet.sport,
+            'dst_port': packet.dport,
+            'flow_packet_count': stats.packet_count,
+            'timestamp': packet.time,
+            # Payload inspection reads the payload in place from the captured frame
+            'packet_data': packet.data,
+            'payload_offset': packet.payload_offset,
+            'payload_end': packet.payload_end
         }
 
-        self.logger.debug(f"Extracted features: {features}")
+        # Instantaneous rates over 1s/10s/60s windows for the flow and both hosts
+        counters = (stats.rates, self.src_rates.get(packet.src), self.dst_rates.get(packet.dst))
+        names = iter(self.rate_feature_names)
+        for counter in counters:
+            for pkt_count, byte_count, window in zip(counter.packets, counter.bytes, RATE_WINDOWS):
+                pkt_name, byte_name = next(names)
+                features[pkt_name] = pkt_count / window
+                features[byte_name] = byte_count / window
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"Extracted features: {features}")
         return features
 
+    def extract_udp_features(self, packet, features):
+        """
+        Adds the UDP features: payload size and the destination's UDP rates.
+
+        :param packet: The UDP PacketRecord.
+        :param features: Common features of the packet, updated in place.
+        """
+        end = packet.payload_end if packet.payload_end is not None else len(packet.data)
+        features['payload_size'] = max(0, end - packet.payload_offset)
+        self._add_protocol_rates(features, 'dst_udp',
+                                 self.udp_dst_rates.update(packet.dst, packet.time, packet.length))
+
+    def extract_icmp_features(self, packet, features):
+        """
+        Adds the ICMP/ICMPv6 features: message type and code, payload size and
+        the destination's ICMP rates (ICMP and ICMPv6 combined).
+
+        :param packet: The ICMP or ICMPv6 PacketRecord.
+        :param features: Common features of the packet, updated in place.
+        """
+        features['icmp_type'] = packet.dport >> 8
+        features['icmp_code'] = packet.dport & 0xFF
+        end = packet.payload_end if packet.payload_end is not None else len(packet.data)
+        features['payload_size'] = max(0, end - packet.payload_offset)
+        self._add_protocol_rates(features, 'dst_icmp',
+                                 self.icmp_dst_rates.update(packet.dst, packet.time, packet.length))
+
+    def _add_protocol_rates(self, features, scope, counter):
+        for pkt_count, byte_count, window, (pkt_name, byte_name) in zip(
+                counter.packets, counter.bytes, RATE_WINDOWS, self.protocol_rate_names[scope]):
+            features[pkt_name] = pkt_count / window
+            features[byte_name] = byte_count / window
+
     def get_flow_stats(self, flow_key):
         """
         Returns the flow statistics for a given flow key.
 
-        :param flow_key: A tuple of (src_ip, dst_ip, src_port, dst_port) representing the flow.
+        :param flow_key: A tuple of (src_ip, dst_ip, src_port, dst_port, protocol) representing the flow.
         :return: A dictionary containing the flow statistics.
         """
         with self.lock:
-            return self.flow_stats.get(flow_key, None)
+            flow = self.flow_stats.get(flow_key)
+            return flow.as_dict() if flow else None
+
+    def active_flows(self):
+        """
+        Returns the flows currently tracked, e.g. for sampling them while active.
+        """
+        with self.lock:
+            return list(self.flow_stats.flows.values())
+
+    def get_eviction_stats(self):
+        """
+        Returns the flow table size and expiry/eviction counters.
+        """
+        with self.lock:
+            return self.flow_stats.stats()
+
+    def flush_flows(self):
+        """
+        Finishes all tracked flows, emitting them to the expiry callback.
+        """
+        with self.lock:
+            self.flow_stats.flush()
@@ -0,0 +1,263 @@
+import argparse
+import random
+import struct
+import time
+
+SCENARIOS = ('web', 'syn_flood', 'horizontal_scan', 'vertical_scan', 'short_flows',
+             'dns_amplification', 'icmpv6_flood')
+
+# TCP flags
+FIN = 0x01
+SYN = 0x02
+RST = 0x04
+PSH = 0x08
+ACK = 0x10
+
+# IP protocols
+TCP = 6
+UDP = 17
+ICMPV6 = 58
+
+_ETHERNET = bytes.fromhex('001122334455' '66778899aabb' '0800')
+_ETHERNET_IPV6 = bytes.fromhex('001122334455' '66778899aabb' '86dd')
+_IP_HEADER = struct.Struct('!BBHHHBBH4s4s')
+_IPV6_HEADER = struct.Struct('!IHBB16s16s')
+_TCP_HEADER = struct.Struct('!HHIIBBHHH')
+_UDP_HEADER = struct.Struct('!HHHH')
+_ICMP_HEADER = struct.Struct('!BBHHH')
+_PCAP_HEADER = struct.Struct('<IHHiIII')
+_PCAP_RECORD = struct.Struct('<IIII')
+
+START_TIME = 1700000000.0
+
+
+def _ip(text):
+    a, b, c, d = (int(part) for part in text.split('.'))
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+def _checksum(header):
+    total = sum(struct.unpack('!10H', header))
+    total = (total & 0xffff) + (total >> 16)
+    total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def _ipv4_header(src, dst, protocol, length, ident):
+    header = _IP_HEADER.pack(0x45, 0, 20 + length, ident & 0xffff, 0x4000, 64, protocol, 0,
+                             src.to_bytes(4, 'big'), dst.to_bytes(4, 'big'))
+    return header[:10] + struct.pack('!H', _checksum(header)) + header[12:]
+
+
+def tcp_frame(src, dst, sport, dport, flags, seq=0, ack=0, window=65535, payload_size=0, ident=0):
+    """
+    Builds an Ethernet/IPv4/TCP frame.
+
+    :param src: Source IPv4 address as an integer.
+    :param dst: Destination IPv4 address as an integer.
+    :param payload_size: Number of zero payload bytes.
+    :return: The frame as bytes.
+    """
+    tcp = _TCP_HEADER.pack(sport, dport, seq, ack, 5 << 4, flags, window, 0, 0)
+    header = _ipv4_header(src, dst, TCP, len(tcp) + payload_size, ident)
+    return _ETHERNET + header + tcp + bytes(payload_size)
+
+
+def udp_frame(src, dst, sport, dport, payload_size=0, ident=0):
+    """
+    Builds an Ethernet/IPv4/UDP frame (without a UDP checksum).
+
+    :param src: Source IPv4 address as an integer.
+    :param dst: Destination IPv4 address as an integer.
+    :param payload_size: Number of zero payload bytes.
+    :return: The frame as bytes.
+    """
+    udp = _UDP_HEADER.pack(sport, dport, 8 + payload_size, 0)
+    header = _ipv4_header(src, dst, UDP, len(udp) + payload_size, ident)
+    return _ETHERNET + header + udp + bytes(payload_size)
+
+
+def icmpv6_frame(src, dst, icmp_type, code=0, ident=0, seq=0, payload_size=0):
+    """
+    Builds an Ethernet/IPv6/ICMPv6 echo-style frame (the checksum is left zero).
+
+    :param src: Source IPv6 address as an integer.
+    :param dst: Destination IPv6 address as an integer.
+    :param payload_size: Number of zero payload bytes.
+    :return: The frame as bytes.
+    """
+    icmp = _ICMP_HEADER.pack(icmp_type, code, 0, ident & 0xffff, seq & 0xffff)
+    header = _IPV6_HEADER.pack(6 << 28, len(icmp) + payload_size, ICMPV6, 64,
+                               src.to_bytes(16, 'big'), dst.to_bytes(16, 'big'))
+    return _ETHERNET_IPV6 + header + icmp + bytes(payload_size)
+
+
+def _web_flow(rng, client, server, sport, dport):
+    """Yields (src, dst, sport, dport, flags, payload_size) for one web request/response."""
+    yield client, server, sport, dport, SYN, 0
+    yield server, client, dport, sport, SYN | ACK, 0
+    yield client, server, sport, dport, ACK, 0
+    yield client, server, sport, dport, PSH | ACK, rng.randint(200, 600)
+    for _ in range(rng.randint(1, 8)):
+        yield server, client, dport, sport, ACK, 1448
+        yield client, server, sport, dport, ACK, 0
+    yield server, client, dport, sport, PSH | ACK, rng.randint(100, 1448)
+    yield client, server, sport, dport, FIN | ACK, 0
+    yield server, client, dport, sport, FIN | ACK, 0
+    yield client, server, sport, dport, ACK, 0
+
+
+def _web(rng):
+    servers = [_ip(f'10.0.0.{i}') for i in range(1, 21)]
+    active = []
+    next_port = 40000
+    while True:
+        while len(active) < 64:
+            client = _ip('192.168.0.0') + rng.randint(1, 4000)
+            next_port = next_port + 1 if next_port < 65000 else 40000
+            active.append(_web_flow(rng, client, rng.choice(servers), next_port, rng.choice((80, 443))))
+        index = rng.randrange(len(active))
+        try:
+            yield next(active[index])
+        except StopIteration:
+            active[index] = active[-1]
+            active.pop()
+
+
+def _syn_flood(rng):
+    target = _ip('10.0.0.80')
+    while True:
+        yield rng.getrandbits(32) | 0x01000000, target, rng.randint(1024, 65535), 80, SYN, 0
+
+
+def _horizontal_scan(rng):
+    scanner = _ip('203.0.113.7')
+    network = _ip('10.0.0.0')
+    host = 0
+    while True:
+        host = host + 1 if host < 0xfffe else 1
+        yield scanner, network + host, rng.randint(40000, 60000), 22, SYN, 0
+
+
+def _vertical_scan(rng):
+    scanner = _ip('203.0.113.7')
+    target = _ip('10.0.0.5')
+    port = 0
+    while True:
+        port = port + 1 if port < 65535 else 1
+        yield scanner, target, 51234, port, SYN, 0
+
+
+def _short_flows(rng):
+    network = _ip('172.16.0.0')
+    server = _ip('10.0.0.53')
+    flow = 0
+    while True:
+        flow += 1
+        client = network + (flow >> 14)
+        sport = 1024 + (flow & 0x3fff)
+        yield client, server, sport, 80, SYN, 0
+        yield server, client, 80, sport, SYN | ACK, 0
+        yield client, server, sport, 80, PSH | ACK, rng.randint(40, 300)
+        yield server, client, 80, sport, FIN | ACK, rng.randint(0, 600)
+
+
+def _dns_amplification(rng):
+    # Large responses from many open resolvers to one victim (UDP)
+    victim = _ip('10.0.0.25')
+    while True:
+        resolver = _ip('198.18.0.0') + rng.randint(1, 2000)
+        yield resolver, victim, 53, rng.randint(1024, 65535), 0, rng.randint(1200, 1472)
+
+
+def _icmpv6_flood(rng):
+    # ICMPv6 echo requests (type 128) from spoofed sources to one host; sport
+    # carries the echo identifier and dport the type and code (type << 8 | code)
+    target = 0x20010db8 << 96 | 0x80
+    while True:
+        yield 0x20010db8 << 96 | 1 << 64 | rng.getrandbits(64), target, rng.getrandbits(16), 128 << 8, 0, 56
+
+
+_SCENARIO_FUNCTIONS = {
+    'web': _web,
+    'syn_flood': _syn_flood,
+    'horizontal_scan': _horizontal_scan,
+    'vertical_scan': _vertical_scan,
+    'short_flows': _short_flows,
+    'dns_amplification': _dns_amplification,
+    'icmpv6_flood': _icmpv6_flood,
+}
+
+# Protocol of the scenarios that are not TCP
+_SCENARIO_PROTOCOLS = {
+    'dns_amplification': UDP,
+    'icmpv6_flood': ICMPV6,
+}
+
+
+def generate(scenario, packets, seed=1, start_time=START_TIME, interval=1e-5):
+    """
+    Deterministically generates Ethernet frames for a traffic scenario.
+
+    :param scenario: One of SCENARIOS: 'web' (benign request/response mix), 'syn_flood'
+                     (spoofed SYNs to one service), 'horizontal_scan' (one port across a /16),
+                     'vertical_scan' (all ports of one host), 'short_flows' (a new
+                     4-packet flow every 4 packets), 'dns_amplification' (large UDP DNS
+                     responses to one victim) or 'icmpv6_flood' (IPv6 echo requests
+                     to one host).
+    :param packets: Number of frames to generate.
+    :param seed: Random seed; the same seed always yields the same frames.
+    :param start_time: Timestamp of the first frame.
+    :param interval: Seconds between frames.
+    :return: Iterator of (timestamp, frame bytes).
+    """
+    if scenario not in _SCENARIO_FUNCTIONS:
+        raise ValueError(f"Unknown scenario '{scenario}', expected one of {SCENARIOS}")
+    rng = random.Random(seed)
+    source = _SCENARIO_FUNCTIONS[scenario](rng)
+    protocol = _SCENARIO_PROTOCOLS.get(scenario, TCP)
+    for i in range(packets):
+        src, dst, sport, dport, flags, payload_size = next(source)
+        if protocol == UDP:
+            frame = udp_frame(src, dst, sport, dport, payload_size, ident=i)
+        elif protocol == ICMPV6:
+            frame = icmpv6_frame(src, dst, dport >> 8, dport & 0xff, sport, i, payload_size)
+        else:
+            frame = tcp_frame(src, dst, sport, dport, flags, seq=i, window=65535 if flags & ACK else 1024,
+                              payload_size=payload_size, ident=i)
+        yield start_time + i * interval, frame
+
+
+def write_pcap(path, frames, snaplen=65535):
+    """
+    Writes (timestamp, frame) pairs to a classic Ethernet pcap file.
+
+    :return: Number of frames written.
+    """
+    count = 0
+    with open(path, 'wb') as f:
+        f.write(_PCAP_HEADER.pack(0xa1b2c3d4, 2, 4, 0, 0, snaplen, 1))
+        for timestamp, frame in frames:
+            seconds = int(timestamp)
+            f.write(_PCAP_RECORD.pack(seconds, int(round((timestamp - seconds) * 1e6)),
+                                      len(frame), len(frame)))
+            f.write(frame)
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic synthetic traffic generator")
+    parser.add_argument("scenario", choices=SCENARIOS)
+    parser.add_argument("-o", "--output", required=True, help="pcap file to write")
+    parser.add_argument("-n", "--packets", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = write_pcap(args.output, generate(args.scenario, args.packets, args.seed))
+    print(f"Wrote {count} packets to {args.output} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
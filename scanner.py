@@ -1,43 +1,257 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+import ipaddress
+import argparse
+import json
+import time
+import sys
 import nmap
 
-scanner = nmap.PortScanner()
-
-print("Welcome, this is a basic nmap automation tool")
-print("<-------------------------------------------------->")
-
-ip_addr = input("Please enter the IP address: ")
-print("The IP entered: ", ip_addr)
-type(ip_addr)
-
-resp = input("""\nPlease enter the type of scan want to run
-                1) SYN ACK Scan
-                2) UDP Scan
-                3) Comprehensive Scan\n""")
-print("Selected option: ", resp)
-
-if resp == '1':
-    print("Nmap Version: ", scanner.nmap_version())
-    scanner.scan(ip_addr, '1-1024', '-v -sS')
-    print(scanner.scaninfo())
-    print("IP Status: ", scanner[ip_addr].state())
-    print(scanner[ip_addr].all_protocols())
-    print("Open Ports: ", scanner[ip_addr]['tcp'].keys())
-
-elif resp == '2':
-    print("Nmap Version: ", scanner.nmap_version())
-    scanner.scan(ip_addr, '1-1024', '-v -sU')
-    print(scanner.scaninfo())
-    print("IP Status: ", scanner[ip_addr].state())
-    print(scanner[ip_addr].all_protocols())
-    print("Open Ports: ", scanner[ip_addr]['udp'].keys())
-
-elif resp == '3':
-    print("Nmap Version: ", scanner.nmap_version())
-    scanner.scan(ip_addr, '1-1024', '-v -sS -sV -sC -A -O')
-    print(scanner.scaninfo())
-    print("IP Status: ", scanner[ip_addr].state())
-    print(scanner[ip_addr].all_protocols())
-    print("Open Ports: ", scanner[ip_addr]['tcp'].keys())
-
-else:
-    print("Please enter a valid option")
+# nmap arguments of each scan type (as offered by the interactive menu)
+SCAN_TYPES = {
+    'syn': '-v -sS',
+    'udp': '-v -sU',
+    'comprehensive': '-v -sS -sV -sC -A -O',
+}
+
+
+def interactive():
+    scanner = nmap.PortScanner()
+
+    print("Welcome, this is a basic nmap automation tool")
+    print("<-------------------------------------------------->")
+
+    ip_addr = input("Please enter the IP address: ")
+    print("The IP entered: ", ip_addr)
+    type(ip_addr)
+
+    resp = input("""\nPlease enter the type of scan want to run
+                    1) SYN ACK Scan
+                    2) UDP Scan
+                    3) Comprehensive Scan\n""")
+    print("Selected option: ", resp)
+
+    if resp == '1':
+        print("Nmap Version: ", scanner.nmap_version())
+        scanner.scan(ip_addr, '1-1024', SCAN_TYPES['syn'])
+        print(scanner.scaninfo())
+        print("IP Status: ", scanner[ip_addr].state())
+        print(scanner[ip_addr].all_protocols())
+        print("Open Ports: ", scanner[ip_addr]['tcp'].keys())
+
+    elif resp == '2':
+        print("Nmap Version: ", scanner.nmap_version())
+        scanner.scan(ip_addr, '1-1024', SCAN_TYPES['udp'])
+        print(scanner.scaninfo())
+        print("IP Status: ", scanner[ip_addr].state())
+        print(scanner[ip_addr].all_protocols())
+        print("Open Ports: ", scanner[ip_addr]['udp'].keys())
+
+    elif resp == '3':
+        print("Nmap Version: ", scanner.nmap_version())
+        scanner.scan(ip_addr, '1-1024', SCAN_TYPES['comprehensive'])
+        print(scanner.scaninfo())
+        print("IP Status: ", scanner[ip_addr].state())
+        print(scanner[ip_addr].all_protocols())
+        print("Open Ports: ", scanner[ip_addr]['tcp'].keys())
+
+    else:
+        print("Please enter a valid option")
+
+
+def read_targets(targets, target_files):
+    """
+    Collects the target specifications from the command line and target files
+    (one per line, '#' starts a comment).
+    """
+    specs = list(targets)
+    for path in target_files:
+        with open(path) as f:
+            for line in f:
+                spec = line.split('#', 1)[0].strip()
+                if spec:
+                    specs.append(spec)
+    return specs
+
+
+def expand_targets(specs):
+    """
+    Yields the individual hosts of the target specifications: addresses and
+    CIDR ranges are expanded (lazily, so large ranges use no memory), host
+    names are passed to nmap as they are.
+    """
+    for spec in specs:
+        try:
+            network = ipaddress.ip_network(spec, strict=False)
+        except ValueError:
+            yield spec
+            continue
+        if network.num_addresses == 1:
+            yield str(network.network_address)
+        else:
+            for address in network.hosts():
+                yield str(address)
+
+
+def count_targets(specs):
+    """
+    Returns the number of hosts expand_targets yields, without expanding them.
+    """
+    total = 0
+    for spec in specs:
+        try:
+            network = ipaddress.ip_network(spec, strict=False)
+        except ValueError:
+            total += 1
+            continue
+        hosts = network.num_addresses
+        if network.version == 4 and hosts > 2:
+            hosts -= 2  # Network and broadcast addresses
+        elif network.version == 6 and hosts > 2:
+            hosts -= 1  # Subnet-router anycast address
+        total += hosts
+    return total
+
+
+def scan_chunk(hosts, ports, arguments, host_timeout):
+    """
+    Scans a chunk of hosts with one nmap process.
+
+    :param hosts: List of hosts.
+    :param ports: nmap port specification.
+    :param arguments: nmap arguments of the scan type.
+    :param host_timeout: Seconds after which nmap gives up on a host.
+    :return: List of result dictionaries, one per host. 'status' is always a string:
+             the nmap host state ('up', 'down'), 'no_result', 'timeout' or 'error'.
+    """
+    started = time.time()
+    scanner = nmap.PortScanner()
+    try:
+        # Hosts of a chunk are scanned in parallel, so the chunk gets about one host timeout
+        scanner.scan(' '.join(hosts), ports, f"{arguments} --host-timeout {host_timeout}s",
+                     timeout=host_timeout + 60)
+    except nmap.PortScannerTimeout as e:
+        # nmap's --host-timeout skips slow hosts by itself, so this only fires when the
+        # process hangs. nmap writes its XML report on exit, so the results of hosts that
+        # already finished are lost with it; a smaller --chunk-size limits the loss.
+        return [{'host': host, 'status': 'timeout', 'error': str(e).strip()} for host in hosts]
+    except nmap.PortScannerError as e:
+        return [{'host': host, 'status': 'error', 'error': str(e).strip()} for host in hosts]
+
+    elapsed = round(time.time() - started, 3)
+    results = []
+    reported = set()
+    for host in scanner.all_hosts():
+        details = dict(scanner[host])
+        reported.add(host)
+        reported.update(name['name'] for name in details.get('hostnames', []) if name.get('name'))
+        # nmap's own 'status' is a {'state', 'reason'} dictionary
+        status = details.pop('status', {})
+        result = {'host': host, 'status': status.get('state', 'unknown'), 'reason': status.get('reason'),
+                  'elapsed': elapsed}
+        result.update(details)
+        results.append(result)
+    for host in hosts:
+        if host not in reported:
+            # Timed out, or not reported by nmap (e.g. an unresolvable name)
+            results.append({'host': host, 'status': 'no_result', 'elapsed': elapsed})
+    return results
+
+
+def run_scan(specs, ports, scan_type, workers, chunk_size, host_timeout, output, progress=True):
+    """
+    Scans the targets with a bounded pool of nmap processes and writes one JSON
+    line per host as soon as the chunk it was scanned in finishes.
+
+    :param specs: Target specifications (addresses, CIDR ranges, host names).
+    :param ports: nmap port specification, e.g. '1-1024' or '22,80,443'.
+    :param scan_type: Key of SCAN_TYPES.
+    :param workers: Maximum number of concurrent nmap processes.
+    :param chunk_size: Hosts per nmap process.
+    :param host_timeout: Seconds after which nmap gives up on a host.
+    :param output: Text stream for the JSON lines.
+    :param progress: Report progress on stderr.
+    :return: Number of hosts found up.
+    """
+    total = count_targets(specs)
+    arguments = SCAN_TYPES[scan_type]
+    hosts = expand_targets(specs)
+    done = up = 0
+    started = time.time()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            pending = set()
+            exhausted = False
+            while pending or not exhausted:
+                # Only a few chunks are queued ahead, so huge ranges are never expanded at once
+                while not exhausted and len(pending) < workers * 2:
+                    chunk = list(islice(hosts, chunk_size))
+                    if not chunk:
+                        exhausted = True
+                        break
+                    pending.add(pool.submit(scan_chunk, chunk, ports, arguments, host_timeout))
+                if not pending:
+                    break
+
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    for result in future.result():
+                        output.write(json.dumps(result, default=str) + '\n')
+                        done += 1
+                        up += result['status'] == 'up'
+                    output.flush()
+                if progress:
+                    elapsed = time.time() - started
+                    remaining = (total - done) * elapsed / done if done else 0.0
+                    print(f"[{done}/{total}] {up} up, {elapsed:.0f}s elapsed, ~{remaining:.0f}s remaining",
+                          file=sys.stderr)
+        except KeyboardInterrupt:
+            # Leaving the block waits for the pool, so drop the queued chunks first;
+            # the running nmap processes get the same SIGINT and exit
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+    return up
+
+
+def main():
+    if len(sys.argv) == 1:
+        interactive()
+        return
+
+    parser = argparse.ArgumentParser(description="Basic nmap automation tool. Without arguments it asks "
+                                                 "for one target interactively.")
+    parser.add_argument("targets", nargs="*", help="Addresses, CIDR ranges or host names")
+    parser.add_argument("-iL", "--target-file", action="append", default=[],
+                        help="File with one target per line (can be repeated)")
+    parser.add_argument("-p", "--ports", default="1-1024", help="nmap port specification")
+    parser.add_argument("-s", "--scan", choices=sorted(SCAN_TYPES), default="syn", help="Scan type")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Maximum concurrent nmap processes")
+    parser.add_argument("--chunk-size", type=int, default=4, help="Hosts per nmap process")
+    parser.add_argument("--host-timeout", type=int, default=300, help="Seconds before nmap gives up on a host")
+    parser.add_argument("-o", "--output", help="Write the JSON lines to this file instead of stdout")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Do not report progress on stderr")
+    args = parser.parse_args()
+
+    if args.workers < 1 or args.chunk_size < 1 or args.host_timeout < 1:
+        parser.error("--workers, --chunk-size and --host-timeout must be positive")
+    try:
+        specs = read_targets(args.targets, args.target_file)
+    except OSError as e:
+        parser.error(str(e))
+    if not specs:
+        parser.error("no targets given")
+
+    output = open(args.output, 'a') if args.output else sys.stdout
+    try:
+        run_scan(specs, args.ports, args.scan, args.workers, args.chunk_size, args.host_timeout,
+                 output, progress=not args.quiet)
+    except KeyboardInterrupt:
+        print("Scan interrupted", file=sys.stderr)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import nmap  # noqa: F401
+except ImportError:
+    # scanner.py imports python-nmap at module level; the tests replace PortScanner anyway
+    nmap = types.ModuleType('nmap')
+    nmap.PortScannerError = type('PortScannerError', (Exception,), {})
+    nmap.PortScannerTimeout = type('PortScannerTimeout', (nmap.PortScannerError,), {})
+    nmap.PortScanner = None
+    sys.modules['nmap'] = nmap
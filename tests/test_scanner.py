@@ -0,0 +1,91 @@
+import signal
+import json
+import time
+import io
+import os
+
+import pytest
+
+import scanner
+
+
+class FakePortScanner:
+    """Stands in for nmap.PortScanner: every host whose last octet is even is up."""
+    scanned = []
+    on_scan = None
+
+    def scan(self, hosts, ports, arguments, timeout=None):
+        self.hosts = hosts.split()
+        FakePortScanner.scanned.extend(self.hosts)
+        if FakePortScanner.on_scan:
+            FakePortScanner.on_scan(self.hosts)
+
+    def all_hosts(self):
+        return [host for host in self.hosts if int(host.rsplit('.', 1)[1]) % 2 == 0]
+
+    def __getitem__(self, host):
+        return {'hostnames': [{'name': '', 'type': ''}],
+                'status': {'state': 'up', 'reason': 'syn-ack'},
+                'tcp': {80: {'state': 'open', 'name': 'http'}}}
+
+
+@pytest.fixture(autouse=True)
+def fake_nmap(monkeypatch):
+    FakePortScanner.scanned = []
+    FakePortScanner.on_scan = None
+    monkeypatch.setattr(scanner.nmap, 'PortScanner', FakePortScanner)
+
+
+@pytest.mark.parametrize('specs', [
+    ['10.0.0.0/29'],
+    ['192.0.2.7', 'scanme.example.org', '10.0.0.0/31', '10.0.0.9/32'],
+    ['2001:db8::/125', '2001:db8::1'],
+])
+def test_count_matches_expansion(specs):
+    assert scanner.count_targets(specs) == len(list(scanner.expand_targets(specs)))
+
+
+def test_expansion_is_lazy():
+    hosts = scanner.expand_targets(['10.0.0.0/8'])
+    assert next(hosts) == '10.0.0.1'
+    assert scanner.count_targets(['10.0.0.0/8']) == 2 ** 24 - 2
+
+
+def test_scan_chunk_reports_string_status():
+    results = scanner.scan_chunk(['10.0.0.2', '10.0.0.3'], '80', '-sS', 30)
+    by_host = {result['host']: result for result in results}
+    assert by_host['10.0.0.2']['status'] == 'up'
+    assert by_host['10.0.0.2']['reason'] == 'syn-ack'
+    assert by_host['10.0.0.2']['tcp'][80]['state'] == 'open'
+    assert by_host['10.0.0.3']['status'] == 'no_result'
+
+
+def test_scan_chunk_timeout(monkeypatch):
+    def hang(hosts):
+        raise scanner.nmap.PortScannerTimeout('Timeout from nmap process')
+    FakePortScanner.on_scan = hang
+    results = scanner.scan_chunk(['10.0.0.2'], '80', '-sS', 30)
+    assert [result['status'] for result in results] == ['timeout']
+
+
+def test_run_scan_counts_hosts_up():
+    output = io.StringIO()
+    up = scanner.run_scan(['10.0.0.0/29'], '80', 'syn', workers=2, chunk_size=2, host_timeout=30,
+                          output=output, progress=False)
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert len(lines) == 6
+    assert up == sum(line['status'] == 'up' for line in lines) == 3
+
+
+def test_interrupt_cancels_queued_chunks():
+    def interrupt(hosts):
+        if hosts == ['10.0.0.1']:
+            # Like Ctrl-C while the main thread waits for the first chunk
+            time.sleep(0.1)
+            os.kill(os.getpid(), signal.SIGINT)
+            time.sleep(0.2)
+    FakePortScanner.on_scan = interrupt
+    with pytest.raises(KeyboardInterrupt):
+        scanner.run_scan(['10.0.0.0/28'], '80', 'syn', workers=1, chunk_size=1, host_timeout=30,
+                         output=io.StringIO(), progress=False)
+    assert FakePortScanner.scanned == ['10.0.0.1']